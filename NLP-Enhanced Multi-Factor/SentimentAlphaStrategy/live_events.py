@@ -0,0 +1,49 @@
+from datetime import datetime
+
+# 情感事件行的解析 (LEAN 的 ReportSentiment.Reader 与测试共用，不依赖 LEAN / numpy)
+# - 回测文件 (etl/export_lean.py): 每行 "yyyyMMdd,score"
+# - 实盘端点 (etl/news_stream.py GET /live/{代码}?since=游标): 每行 "yyyyMMdd HH:MM:SS.fff,score"
+#   LEAN 的 Rest 数据源把整个响应体作为一个 line 交给 Reader，多条事件需先按行拆开
+# - 游标为 "yyyyMMddHHMMSSfff" (本地时间)，端点只返回信号可用时间晚于游标的事件，
+#   客户端每次只收到新事件；"0" 表示从头开始
+
+
+def parse_line(line):
+    """
+    解析一行，返回 (时间, 分数, 是否实盘行)；空行或格式不符时返回 None
+    固定格式，按位置切片: 0-8 为日期，9 之后为分数 (实盘行在日期后多一段 " HH:MM:SS.fff")
+    """
+    try:
+        time_obj = datetime(int(line[0:4]), int(line[4:6]), int(line[6:8]))
+        live = line[8] == ' '
+        if live:
+            time_obj = time_obj.replace(hour=int(line[9:11]), minute=int(line[12:14]), second=int(line[15:17]),
+                                        microsecond=int(line[18:21]) * 1000)
+        score = float(line[22:] if live else line[9:])
+    except (ValueError, IndexError):
+        return None
+    return time_obj, score, live
+
+
+def parse_events(body, after=None):
+    """
+    实盘端点的响应体 -> [(时间, 分数)]，只保留时间晚于 after 的事件，按时间升序
+    """
+    events = []
+    for line in body.splitlines():
+        parsed = parse_line(line.strip())
+        if parsed is None or not parsed[2]:
+            continue
+        if after is None or parsed[0] > after:
+            events.append(parsed[:2])
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+def cursor(after=None):
+    """
+    事件时间 -> 端点的 since 游标
+    """
+    if after is None:
+        return "0"
+    return after.strftime("%Y%m%d%H%M%S") + f"{after.microsecond // 1000:03d}"
@@ -1,8 +1,12 @@
 
 from AlgorithmImports import *
+import os
 import pandas as pd
 import csv
 from datetime import datetime
+from signal_fusion import DEFAULT_PARAMS, StreamingSignal
+from live_events import cursor, parse_events, parse_line
+from portfolio_targets import DRIFT_TOLERANCE, MAX_WEIGHT, rebalance_orders, target_weights
 
 class SentimentAlphaStrategy(QCAlgorithm):
     def Initialize(self):
@@ -13,7 +17,14 @@ class SentimentAlphaStrategy(QCAlgorithm):
         # 股票列表
         self.stocks = ['002202', '601615', '000630', '000878', '000875', '603067']
         self.stock_symbols = {}
-        self.sentiment_data = {}
+        # 每只股票一个增量信号 (与本地回测同一套规则，见 signal_fusion.py)，每根 bar O(1) 更新
+        self.signals = {}
+        # 最新持仓信号，由定时调仓统一下单
+        self.positions = {}
+        # 尚未并入信号的最新情感 (实盘中新闻随时到达，等下一根 bar 再推进信号)
+        self.pending_sentiment = {}
+        # 已处理的最新情感事件时间: 实盘端点每次返回最近若干条，重复 / 过期的事件忽略
+        self.last_event_time = {}
         
         for stock in self.stocks:
             # 添加股票行情数据 (Daily Resolution)
@@ -38,90 +49,109 @@ class SentimentAlphaStrategy(QCAlgorithm):
             # 关联到对应的股票 Symbol
             self.AddData(ReportSentiment, f"{stock}_sentiment", Resolution.Daily)
             
-            # 初始化情感分
-            self.sentiment_data[stock] = 0.5 # Neutral start
+            self.signals[stock] = StreamingSignal()
+            self.positions[stock] = 0.0
+            self.pending_sentiment[stock] = float("nan")
+            self.last_event_time[stock] = datetime.min
+
+        # 预热 MA 长窗口，预热期间只更新信号状态不下单
+        self.SetWarmUp(DEFAULT_PARAMS["ma_long"], Resolution.Daily)
+
+        # 每个交易日开盘后统一调仓一次 (OnData 只更新信号)
+        anchor = self.stock_symbols[self.stocks[0]]
+        self.Schedule.On(self.DateRules.EveryDay(anchor), self.TimeRules.AfterMarketOpen(anchor, 30), self.Rebalance)
 
     def OnData(self, data):
         # 遍历每只股票
         for stock in self.stocks:
             sentiment_symbol = f"{stock}_sentiment"
-            
-            # 检查是否有新的情感数据
+
+            # 检查是否有新的情感数据 (无消息为 NaN，情绪按衰减延续)
             if data.ContainsKey(sentiment_symbol):
                 sentiment = data[sentiment_symbol]
-                if sentiment is not None:
-                    # 更新该股票的情感分
-                    score = sentiment.Value
-                    self.sentiment_data[stock] = score
-                    self.Debug(f"{self.Time}: {stock} New Sentiment Score: {score}")
-
-            # 获取当前情感分
-            current_sentiment = self.sentiment_data[stock]
-            
-            # 交易逻辑
-            # 如果情感分 > 0.6，做多 (Weight 0.15)
-            # 如果情感分 < 0.4，清仓
-            # 简单策略：基于情感分调整仓位
-            
-            if not self.Securities[stock].Invested:
-                if current_sentiment > 0.6:
-                    self.SetHoldings(stock, 0.15)
-                    self.Debug(f"{self.Time}: Buy {stock} (Sentiment: {current_sentiment})")
-            else:
-                if current_sentiment < 0.4:
-                    self.Liquidate(stock)
-                    self.Debug(f"{self.Time}: Sell {stock} (Sentiment: {current_sentiment})")
+                if sentiment is not None and sentiment.Time > self.last_event_time[stock]:
+                    self.last_event_time[stock] = sentiment.Time
+                    self.pending_sentiment[stock] = sentiment.Value
+                    self.Debug(f"{self.Time}: {stock} New Sentiment Score: {sentiment.Value}")
+
+            # 只在有该股票新 bar 时推进信号 (一根 bar 一次更新)
+            if not data.Bars.ContainsKey(self.stock_symbols[stock]):
+                continue
+            close = float(data.Bars[self.stock_symbols[stock]].Close)
+            new_sentiment = self.pending_sentiment[stock]
+            self.pending_sentiment[stock] = float("nan")
+
+            # 交易逻辑: 舆情衰减 + MA5/MA20 技术面融合 (与 run_strategy_local.py 一致)
+            self.positions[stock] = self.signals[stock].update(close, new_sentiment)
+
+    def Rebalance(self):
+        """
+        计算全部股票的目标权重后一次性提交 (一组 PortfolioTarget)，
+        权重偏离在容忍带以内的股票不下单
+        """
+        if self.IsWarmingUp:
+            return
+        total = self.Portfolio.TotalPortfolioValue
+        if total <= 0:
+            return
+
+        current = {stock: self.Portfolio[self.stock_symbols[stock]].HoldingsValue / total for stock in self.stocks}
+        orders = rebalance_orders(target_weights(self.positions, MAX_WEIGHT), current, DRIFT_TOLERANCE)
+        if not orders:
+            return
+
+        # 清仓在前，先释放资金再加仓
+        self.SetHoldings([PortfolioTarget(self.stock_symbols[stock], weight) for stock, weight in orders.items()])
+        self.Debug(f"{self.Time}: Rebalance {len(orders)} stocks "
+                   f"(holding {sum(1 for pos in self.positions.values() if pos == 1)})")
 
 class ReportSentiment(PythonData):
     """
-    自定义数据类，用于读取研报情感 CSV
+    自定义数据类，读取 etl/export_lean.py 导出的紧凑研报情感文件
+    每行 "yyyyMMdd,score"，已对齐到交易日并按日合并，按日期升序
+    实盘模式轮询 etl/news_stream.py 的本地端点，每行 "yyyyMMdd HH:MM:SS.fff,score"
+    (信号可用时间，每只股票每轮一条，已按回测相同的 reducer 合并)
+    行格式的解析见 live_events.py
     """
+    LIVE_URL = "http://127.0.0.1:8766/live/{code}?since={since}"
+    # 实盘: 每只股票已交给 LEAN 的最新事件时间，作为下次请求的 since 游标，并过滤重复事件
+    live_cursor = {}
+
     def GetSource(self, config, date, isLiveMode):
-        # 构建文件路径
         # config.Symbol.Value 会是 "002202_sentiment"
         stock_code = config.Symbol.Value.split('_')[0]
-        # 使用相对路径，假设 Lean 在项目根目录运行
-        # 文件路径: data/alternative/sentiment_reports/000630_report_sentiment.csv
-        source = f"data/alternative/sentiment_reports/{stock_code}_report_sentiment.csv"
+        if isLiveMode:
+            url = self.LIVE_URL.format(code=stock_code, since=cursor(self.live_cursor.get(stock_code)))
+            # 响应体可能包含多条事件，Reader 返回 BaseDataCollection，由 LEAN 展开为逐条数据
+            return SubscriptionDataSource(url, SubscriptionTransportMedium.Rest, FileFormat.UnfoldingCollection)
+        # 相对 lean.json 的 data-folder: alternative/nlp_sentiment/report/000630.csv
+        source = os.path.join(Globals.DataFolder, "alternative", "nlp_sentiment", "report", f"{stock_code}.csv")
         return SubscriptionDataSource(source, SubscriptionTransportMedium.LocalFile)
 
     def Reader(self, config, line, date, isLiveMode):
-        if not (line.strip() and line[0].isdigit()): return None
-
-        try:
-            # 解析 CSV 行
-            # 使用 csv module 防止逗号干扰
-            # 格式: 序号,股票代码,股票简称,...,日期,链接,sentiment_score
-            # 倒数第一列: score
-            # 倒数第三列: 日期
-            
-            # 简单 split 可能会有问题如果字段内有逗号，但这里为了性能先试 split
-            parts = line.split(',')
-            
-            # 如果 split 后列数不对，可能需要 csv reader
-            # 假设结构相对固定，最后几列应该没问题
-            
-            score_str = parts[-1].strip()
-            date_str = parts[-3].strip() # 日期列
-            
-            # 解析日期
-            try:
-                # 格式 2025-12-09
-                time_obj = datetime.strptime(date_str, "%Y-%m-%d")
-            except ValueError:
+        if isLiveMode:
+            # Rest 数据源: line 为整个响应体 (多行)
+            stock_code = config.Symbol.Value.split('_')[0]
+            events = parse_events(line, self.live_cursor.get(stock_code))
+            if not events:
                 return None
+            ReportSentiment.live_cursor[stock_code] = events[-1][0]
+            # 实盘事件在信号可用时刻立即生效
+            points = [self._point(config, time_obj, score, time_obj) for time_obj, score in events]
+            return BaseDataCollection(points[-1].EndTime, config.Symbol, points)
 
-            # 创建对象
-            sentiment = ReportSentiment()
-            sentiment.Symbol = config.Symbol
-            sentiment.Time = time_obj
-            sentiment.Value = float(score_str)
-            
-            # 结束时间 = 开始时间 + 1天 (日频数据)
-            sentiment.EndTime = sentiment.Time + timedelta(days=1)
-            
-            return sentiment
-            
-        except Exception as e:
-            # print(f"Error parsing line: {line} - {e}")
+        parsed = parse_line(line)
+        if parsed is None:
+            # 空行或格式不符
             return None
+        time_obj, score, _ = parsed
+        # 日频数据: 结束时间 = 开始时间 + 1天
+        return self._point(config, time_obj, score, time_obj + timedelta(days=1))
+
+    def _point(self, config, time_obj, score, end_time):
+        sentiment = ReportSentiment()
+        sentiment.Symbol = config.Symbol
+        sentiment.Time = time_obj
+        sentiment.Value = score
+        sentiment.EndTime = end_time
+        return sentiment
@@ -0,0 +1,29 @@
+# 组合目标权重与调仓容忍带 (LEAN 与本地模拟共用，不依赖 LEAN / numpy)
+# - target_weights: 信号为 1 的股票等权，单只不超过 max_weight (与 portfolio_backtest.py 的口径一致)
+# - rebalance_orders: 只返回需要下单的股票，开仓 / 清仓总是执行，
+#   已持仓股票的权重偏离目标不超过容忍带 (相对目标权重) 时不下单，避免价格波动 / 持仓数变化带来的碎单
+
+MAX_WEIGHT = 0.15
+DRIFT_TOLERANCE = 0.2
+
+
+def target_weights(positions, max_weight=MAX_WEIGHT):
+    """
+    positions: {股票: 持仓信号 0/1}，返回 {股票: 目标权重}
+    """
+    held = [stock for stock, pos in positions.items() if pos == 1]
+    weight = min(1.0 / len(held), max_weight) if held else 0.0
+    return {stock: (weight if pos == 1 else 0.0) for stock, pos in positions.items()}
+
+
+def rebalance_orders(targets, current, tolerance=DRIFT_TOLERANCE):
+    """
+    targets / current: {股票: 目标权重 / 当前权重}
+    返回需要调整的 {股票: 目标权重}，清仓在前 (先释放资金再加仓)
+    """
+    orders = {}
+    for stock, target in targets.items():
+        weight = current.get(stock, 0.0)
+        if (target == 0.0) != (weight == 0.0) or abs(target - weight) > tolerance * max(target, weight):
+            orders[stock] = target
+    return dict(sorted(orders.items(), key=lambda item: item[1]))
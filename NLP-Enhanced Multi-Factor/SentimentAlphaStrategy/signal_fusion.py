@@ -0,0 +1,225 @@
+import math
+import numpy as np
+
+# 信号融合: 舆情衰减 + MA5/MA20 技术面 (本地回测、strategy_mock 与 LEAN 共用这一份规则)
+# - 批量模式 (数组): 回测一次算完整段历史
+# - 增量模式 (StreamingSignal): 每根 bar O(1) 更新滚动均线和与衰减情绪，用于 LEAN OnData / 实盘
+# 两种模式的运算顺序完全相同，仓位逐位一致:
+# - 均线按 "滚动和 += 新价 - 出窗价" 递推，批量模式用 np.add.accumulate 顺序累加，不用 pandas rolling
+# - 窗口内价格全部相同 (停牌 / 一字板) 时均线直接取该价格，避免滚动和的舍入误差产生假的金叉死叉
+# 本文件放在 LEAN 项目目录内，main.py 可直接导入；只依赖 numpy (安装了 numba 时批量 kernel 编译执行)
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# 原策略参数
+DEFAULT_PARAMS = {
+    "decay_factor": 0.9,     # 每天衰减 10%
+    "strong_buy": 0.8,       # 舆情极度看多，忽略技术面
+    "tech_floor": -0.2,      # 技术面看多时，舆情不低于此值才跟进
+    "hold_threshold": 0.5,   # 技术面看空时，舆情高于此值仍持有
+    "ma_short": 5,
+    "ma_long": 20,
+}
+
+
+def fuse_step(current, pos, new_sentiment, tech, decay_factor, strong_buy, tech_floor, hold_threshold):
+    """
+    推进一根 bar: 返回 (当前情绪, 持仓)
+    new_sentiment 为 NaN 表示当天无消息 (0.0 是一条中性消息)
+    """
+    if not math.isnan(new_sentiment):
+        # 有新消息，更新当前情绪
+        current = new_sentiment
+    else:
+        # 否则情绪随时间衰减
+        current *= decay_factor
+
+    # 技术面看多 + 舆情不看空 = 买入；技术面看空 + 舆情不看多 = 卖出；舆情极度看多 = 强力买入
+    if current > strong_buy:
+        pos = 1.0
+    elif tech == 1:
+        pos = 1.0 if current > tech_floor else 0.0
+    elif tech == -1:
+        pos = 1.0 if current > hold_threshold else 0.0
+    return current, pos
+
+
+_step = njit(inline="always")(fuse_step) if njit is not None else fuse_step
+
+
+def _signal_kernel(new_sentiment, tech_signal, decay_factor, strong_buy, tech_floor, hold_threshold,
+                   sentiment, position):
+    # sentiment / position 为预分配的输出 (numba 下为数组，纯 Python 下为列表)
+    current = 0.0
+    pos = 0.0
+    for i in range(len(new_sentiment)):
+        current, pos = _step(current, pos, new_sentiment[i], tech_signal[i],
+                             decay_factor, strong_buy, tech_floor, hold_threshold)
+        sentiment[i] = current
+        position[i] = pos
+
+
+if njit is not None:
+    _compiled_kernel = njit(cache=True)(_signal_kernel)
+
+    def signal_kernel(new_sentiment, tech_signal, decay_factor, strong_buy, tech_floor, hold_threshold):
+        n = len(new_sentiment)
+        sentiment, position = np.empty(n), np.empty(n)
+        _compiled_kernel(np.ascontiguousarray(new_sentiment, dtype=np.float64),
+                         np.ascontiguousarray(tech_signal, dtype=np.int64),
+                         decay_factor, strong_buy, tech_floor, hold_threshold, sentiment, position)
+        return sentiment, position
+else:
+    def signal_kernel(new_sentiment, tech_signal, decay_factor, strong_buy, tech_floor, hold_threshold):
+        # 逐元素访问时 Python 列表比 numpy 数组快得多
+        n = len(new_sentiment)
+        sentiment, position = [0.0] * n, [0.0] * n
+        _signal_kernel(np.asarray(new_sentiment, dtype=np.float64).tolist(),
+                       np.asarray(tech_signal, dtype=np.int64).tolist(),
+                       decay_factor, strong_buy, tech_floor, hold_threshold, sentiment, position)
+        return np.array(sentiment), np.array(position)
+
+
+def moving_average(close, window):
+    """
+    滚动均线 (批量)，close 为 (T,) 或 (T, N)，沿时间轴计算
+    前 window-1 天及窗口内含 NaN 时为 NaN (与 pandas rolling 相同)
+    """
+    x = np.asarray(close, dtype=np.float64)
+    idx = np.arange(len(x)).reshape((-1,) + (1,) * (x.ndim - 1))
+    missing = np.isnan(x)
+    filled = np.where(missing, 0.0, x)
+
+    # 滚动和: 每步加上 (新价 - 出窗价)，accumulate 严格按时间顺序累加
+    delta = filled.copy()
+    delta[window:] -= filled[:-window]
+    sums = np.add.accumulate(delta, axis=0)
+    nan_count = np.add.accumulate(missing.astype(np.int64), axis=0)
+    nan_in_window = nan_count.copy()
+    nan_in_window[window:] -= nan_count[:-window]
+
+    # 连续相同价格的天数
+    same = np.zeros(x.shape, dtype=bool)
+    same[1:] = x[1:] == x[:-1]
+    run = idx - np.maximum.accumulate(np.where(same, 0, idx), axis=0) + 1
+
+    ma = np.where(run >= window, x, sums / window)
+    return np.where((idx >= window - 1) & (nan_in_window == 0), ma, np.nan)
+
+
+def tech_signal_from_ma(ma_short, ma_long):
+    """
+    MA 多头排列 -> 1，空头排列 -> -1，其余 (含 NaN) -> 0
+    """
+    ma_short = np.asarray(ma_short, dtype=np.float64)
+    ma_long = np.asarray(ma_long, dtype=np.float64)
+    return np.where(ma_short > ma_long, 1, np.where(ma_short < ma_long, -1, 0)).astype(np.int64)
+
+
+def batch_signals(close, new_sentiment, **params):
+    """
+    批量模式: close / new_sentiment (无消息为 NaN) 为按交易日对齐的一维数组
+    返回 dict: ma_short / ma_long / tech / sentiment / position (numpy 数组)
+    """
+    p = dict(DEFAULT_PARAMS, **params)
+    ma_short = moving_average(close, p["ma_short"])
+    ma_long = moving_average(close, p["ma_long"])
+    tech = tech_signal_from_ma(ma_short, ma_long)
+    sentiment, position = signal_kernel(np.asarray(new_sentiment, dtype=np.float64), tech,
+                                        p["decay_factor"], p["strong_buy"], p["tech_floor"], p["hold_threshold"])
+    return {"ma_short": ma_short, "ma_long": ma_long, "tech": tech, "sentiment": sentiment, "position": position}
+
+
+def advance_positions(new_sentiment, tech, state=None, decay_factor=DEFAULT_PARAMS["decay_factor"],
+                      strong_buy=DEFAULT_PARAMS["strong_buy"], tech_floor=DEFAULT_PARAMS["tech_floor"],
+                      hold_threshold=DEFAULT_PARAMS["hold_threshold"]):
+    """
+    面板版 (多只股票) 批量模式: 沿时间轴顺序推进，每一步对所有股票做向量运算，规则与 fuse_step 相同
+    new_sentiment / tech: (T, N) 矩阵
+    state: 上一段结束时的 (当前情绪, 持仓) 向量，None 表示从零开始
+    返回 (int8 持仓矩阵 (T, N), 本段结束时的 state)，可分段接续计算
+    """
+    n_days, n_symbols = new_sentiment.shape
+    position = np.zeros((n_days, n_symbols), dtype=np.int8)
+    if state is None:
+        current = np.zeros(n_symbols)
+        pos = np.zeros(n_symbols, dtype=bool)
+    else:
+        current, pos = state
+    for t in range(n_days):
+        s = new_sentiment[t]
+        current = np.where(np.isnan(s), current * decay_factor, s)
+        tech_t = tech[t]
+        pos = np.where(current > strong_buy, True,
+                       np.where(tech_t == 1, current > tech_floor,
+                                np.where(tech_t == -1, current > hold_threshold, pos)))
+        position[t] = pos
+    return position, (current, pos)
+
+
+def panel_positions(new_sentiment, tech, decay_factor=DEFAULT_PARAMS["decay_factor"],
+                    strong_buy=DEFAULT_PARAMS["strong_buy"], tech_floor=DEFAULT_PARAMS["tech_floor"],
+                    hold_threshold=DEFAULT_PARAMS["hold_threshold"]):
+    """
+    从零开始计算整段持仓，返回 int8 持仓矩阵 (T, N)
+    """
+    return advance_positions(new_sentiment, tech, None, decay_factor, strong_buy, tech_floor, hold_threshold)[0]
+
+
+class RollingMean:
+    """
+    增量均线: 环形缓冲 + 滚动和，update() 为 O(1)，结果与 moving_average() 逐位一致
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.buffer = [0.0] * window
+        self.missing = [False] * window
+        self.count = 0
+        self.sum = 0.0
+        self.nan_count = 0
+        self.last = float("nan")
+        self.same_run = 0
+
+    def update(self, price):
+        missing = math.isnan(price)
+        filled = 0.0 if missing else price
+        slot = self.count % self.window
+        self.sum += filled - self.buffer[slot]
+        self.nan_count += missing - self.missing[slot]
+        self.buffer[slot] = filled
+        self.missing[slot] = missing
+        self.same_run = self.same_run + 1 if price == self.last else 1
+        self.last = price
+        self.count += 1
+
+        if self.count < self.window or self.nan_count:
+            return float("nan")
+        return price if self.same_run >= self.window else self.sum / self.window
+
+
+class StreamingSignal:
+    """
+    增量模式: 单只股票每根 bar 调用一次 update(close, new_sentiment)，返回持仓 (0.0 / 1.0)
+    状态只有两条均线的环形缓冲、当前情绪与持仓，不需要保留历史价格
+    """
+
+    def __init__(self, **params):
+        p = dict(DEFAULT_PARAMS, **params)
+        self.params = (p["decay_factor"], p["strong_buy"], p["tech_floor"], p["hold_threshold"])
+        self.ma_short = RollingMean(p["ma_short"])
+        self.ma_long = RollingMean(p["ma_long"])
+        self.sentiment = 0.0
+        self.position = 0.0
+
+    def update(self, close, new_sentiment=float("nan")):
+        ma_short = self.ma_short.update(close)
+        ma_long = self.ma_long.update(close)
+        # NaN 参与比较均为 False -> 技术面中性
+        tech = 1 if ma_short > ma_long else (-1 if ma_short < ma_long else 0)
+        self.sentiment, self.position = fuse_step(self.sentiment, self.position, new_sentiment, tech,
+                                                  *self.params)
+        return self.position
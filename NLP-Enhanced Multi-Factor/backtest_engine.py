@@ -0,0 +1,173 @@
+import time
+import numpy as np
+import pandas as pd
+from SentimentAlphaStrategy.signal_fusion import (DEFAULT_PARAMS, StreamingSignal, moving_average, signal_kernel,
+                                                  tech_signal_from_ma)
+
+# 向量化回测引擎，替代 run_strategy_local.py 中逐行 iterrows 的循环
+# - 日收益率、MA、技术信号、资金曲线都是数组运算
+# - 均线、情绪衰减与仓位规则来自 SentimentAlphaStrategy/signal_fusion.py (与 LEAN 共用)，
+#   依赖上一时刻状态的部分在一个紧凑的 kernel 里顺序执行
+# 输出与原循环、与逐 bar 的增量模式 (StreamingSignal) 逐位一致，见 tests/test_backtest_engine.py
+# 测速: python backtest_engine.py (20 只 x 2500 个交易日，纯 numpy 约 20-25x)
+
+INITIAL_CAPITAL = 10000.0
+
+
+def equity_curve(daily_return, position, initial_capital=INITIAL_CAPITAL):
+    """
+    持仓日资金乘以 (1 + 收益)，与原循环一样顺序累乘 (首项为初始资金)，结果逐位一致
+    """
+    ret = np.nan_to_num(np.asarray(daily_return, dtype=np.float64), nan=0.0)
+    factors = np.where(np.asarray(position) == 1, 1.0 + ret, 1.0)
+    return np.multiply.accumulate(np.concatenate(([initial_capital], factors)))[1:]
+
+
+def run_backtest_arrays(close, new_sentiment, short_ma=None, long_ma=None, initial_capital=INITIAL_CAPITAL,
+                        **params):
+    """
+    数组接口: close 与 new_sentiment (无新消息当天为 NaN) 按交易日对齐
+    short_ma / long_ma: 可预先计算的均线数组 (参数扫描时复用)，为空时按 ma_short / ma_long 窗口计算
+    返回 dict: sentiment / position / equity / daily_return (numpy 数组)
+    """
+    p = dict(DEFAULT_PARAMS, **params)
+    close_s = pd.Series(np.asarray(close, dtype=np.float64))
+    if short_ma is None:
+        short_ma = moving_average(close_s.to_numpy(), p["ma_short"])
+    if long_ma is None:
+        long_ma = moving_average(close_s.to_numpy(), p["ma_long"])
+
+    daily_return = close_s.pct_change().to_numpy()
+    tech = tech_signal_from_ma(short_ma, long_ma)
+    sentiment, position = signal_kernel(np.asarray(new_sentiment, dtype=np.float64), tech,
+                                        p["decay_factor"], p["strong_buy"], p["tech_floor"], p["hold_threshold"])
+    return {
+        "sentiment": sentiment,
+        "position": position,
+        "equity": equity_curve(daily_return, position, initial_capital),
+        "daily_return": daily_return,
+    }
+
+
+def align_sentiment(price_index, daily_sentiment):
+    """
+    把已对齐到交易日的情感分 (etl/align_sentiment.py 生成的因子列) 按价格日期取出，无消息为 NaN
+    """
+    if daily_sentiment is None or len(daily_sentiment) == 0:
+        return np.full(len(price_index), np.nan)
+    return pd.Series(daily_sentiment, dtype=np.float64).reindex(price_index).to_numpy(dtype=np.float64)
+
+
+def run_backtest(df_price, daily_sentiment, initial_capital=INITIAL_CAPITAL, **params):
+    """
+    DataFrame 接口: df_price 以日期为索引、含 close 列；daily_sentiment 为 {date: score} 或 Series
+    返回在 df_price 上追加 Daily_Return / MA / Sentiment / Position / Equity 列的新 DataFrame
+    """
+    p = dict(DEFAULT_PARAMS, **params)
+    close = df_price["close"]
+    short_ma = moving_average(close.to_numpy(), p["ma_short"])
+    long_ma = moving_average(close.to_numpy(), p["ma_long"])
+    result = run_backtest_arrays(close.to_numpy(), align_sentiment(df_price.index, daily_sentiment),
+                                 short_ma=short_ma, long_ma=long_ma, initial_capital=initial_capital, **p)
+    # 一次性拼接新列，避免逐列插入的开销
+    columns = pd.DataFrame({
+        "Daily_Return": result["daily_return"],
+        f"MA{p['ma_short']}": short_ma,
+        f"MA{p['ma_long']}": long_ma,
+        "Sentiment": result["sentiment"],
+        "Position": result["position"].astype(int),
+        "Equity": result["equity"],
+    }, index=df_price.index)
+    return pd.concat([df_price, columns], axis=1)
+
+
+def reference_backtest(df_price, sentiment_map, initial_capital=INITIAL_CAPITAL):
+    """
+    原 run_strategy_local.py 的逐行循环 (只用于一致性校验)
+    原循环把 0.0 视为无消息；随机样本的分数不会恰好为 0，两种口径在校验中等价
+    """
+    df_price = df_price.copy()
+    df_price['Daily_Return'] = df_price['close'].pct_change()
+    df_price['MA5'] = df_price['close'].rolling(window=5).mean()
+    df_price['MA20'] = df_price['close'].rolling(window=20).mean()
+
+    capital = initial_capital
+    position = 0
+    equity = []
+    positions = []
+    current_sentiment = 0.0
+    decay_factor = 0.9
+    for date, row in df_price.iterrows():
+        new_sentiment = sentiment_map.get(date, 0.0)
+        if new_sentiment != 0.0:
+            current_sentiment = new_sentiment
+        else:
+            current_sentiment *= decay_factor
+
+        ma5 = row['MA5']
+        ma20 = row['MA20']
+        tech_signal = 0
+        if pd.notna(ma5) and pd.notna(ma20):
+            if ma5 > ma20:
+                tech_signal = 1
+            elif ma5 < ma20:
+                tech_signal = -1
+
+        target_position = position
+        if current_sentiment > 0.8:
+            target_position = 1
+        elif tech_signal == 1:
+            target_position = 1 if current_sentiment > -0.2 else 0
+        elif tech_signal == -1:
+            target_position = 1 if current_sentiment > 0.5 else 0
+        position = target_position
+
+        ret = row['Daily_Return']
+        if pd.isna(ret): ret = 0.0
+        if position == 1:
+            capital = capital * (1 + ret)
+        equity.append(capital)
+        positions.append(position)
+
+    return np.asarray(positions), np.asarray(equity)
+
+
+def synthetic_case(n_days=750, n_events=60, seed=0):
+    """
+    随机价格 + 随机研报事件，用于一致性校验与测速
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range("2022-01-03", periods=n_days)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n_days)))
+    df_price = pd.DataFrame({"close": close}, index=index)
+    event_dates = index[rng.choice(n_days, size=min(n_events, n_days), replace=False)]
+    sentiment_map = dict(zip(event_dates, rng.uniform(-1, 1, len(event_dates))))
+    return df_price, sentiment_map
+
+
+def benchmark(cases=20, n_days=2500):
+    """
+    原循环与向量化引擎在同一批随机样本上的耗时，返回 (原循环耗时, 引擎耗时)
+    一致性校验见 tests/test_backtest_engine.py
+    """
+    loop_time = 0.0
+    engine_time = 0.0
+    for seed in range(cases):
+        df_price, sentiment_map = synthetic_case(n_days=n_days, seed=seed)
+
+        start = time.perf_counter()
+        reference_backtest(df_price, sentiment_map)
+        loop_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        run_backtest(df_price, sentiment_map)
+        engine_time += time.perf_counter() - start
+    return loop_time, engine_time
+
+
+if __name__ == "__main__":
+    # 首次调用的一次性开销 (导入、缓存) 不计入测速
+    run_backtest(*synthetic_case(n_days=30))
+    loop_time, engine_time = benchmark()
+    print(f"原循环: {loop_time * 1000:.1f} ms, 向量化引擎: {engine_time * 1000:.1f} ms, "
+          f"加速 {loop_time / max(engine_time, 1e-9):.0f}x")
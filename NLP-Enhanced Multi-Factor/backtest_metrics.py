@@ -0,0 +1,162 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from etl.instrumentation import collected, merge, timer
+
+# 回测绩效指标 (向量化) 与后台绘图
+# - compute_metrics: 对净值矩阵 (日期 × 股票) 的所有列一次性计算
+#   CAGR / Sharpe / Sortino / 最大回撤及持续天数 / 换手 / 胜率 / 仓位暴露
+#   各股票日期区间不同时以 NaN 补齐，NaN 不参与计算
+# - ChartRenderer: 绘图放到后台进程池 (Agg 后端)，第一次提交时才创建进程池并导入 matplotlib，
+#   不画图的场景 (参数扫描等) 完全不付出绘图开销
+
+TRADING_DAYS = 252
+
+
+def _as_matrix(values):
+    if isinstance(values, pd.Series):
+        values = values.to_frame()
+    if isinstance(values, pd.DataFrame):
+        return values.to_numpy(dtype=np.float64), list(values.columns)
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    return values, list(range(values.shape[1]))
+
+
+def max_drawdown_duration(equity):
+    """
+    每列处于水下 (低于历史最高净值) 的最长连续天数
+    """
+    peak = np.fmax.accumulate(equity, axis=0)
+    underwater = equity < peak
+    idx = np.arange(len(equity))[:, None]
+    # 每个位置上一次 "不在水下" 的下标，持续天数 = 当前下标 - 该下标
+    last_high = np.maximum.accumulate(np.where(underwater, -1, idx), axis=0)
+    return (idx - last_high).max(axis=0) if len(equity) else np.zeros(equity.shape[1], dtype=int)
+
+
+def compute_metrics(equity, position=None, periods_per_year=TRADING_DAYS):
+    """
+    equity: 净值 (T,) / (T, N) 数组、Series 或 DataFrame (列为股票)
+    position: 同形状的持仓 (0/1 或权重)，提供时计算换手、胜率 (持仓日) 与暴露
+    返回每列一行的 DataFrame
+    """
+    eq, columns = _as_matrix(equity)
+    valid = ~np.isnan(eq)
+    n_valid = valid.sum(axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = eq[1:] / eq[:-1] - 1
+        first = pd.DataFrame(eq).bfill().to_numpy()[0]
+        last = pd.DataFrame(eq).ffill().to_numpy()[-1]
+        years = n_valid / periods_per_year
+        cagr = np.where(years > 0, (last / first) ** (1 / np.where(years > 0, years, 1)) - 1, np.nan)
+
+        mean = np.nanmean(returns, axis=0) if len(returns) else np.full(eq.shape[1], np.nan)
+        std = np.nanstd(returns, axis=0) if len(returns) else np.full(eq.shape[1], np.nan)
+        downside = np.sqrt(np.nanmean(np.minimum(returns, 0.0) ** 2, axis=0)) if len(returns) else std
+        sharpe = np.where(std > 0, mean / std * np.sqrt(periods_per_year), 0.0)
+        sortino = np.where(downside > 0, mean / downside * np.sqrt(periods_per_year), 0.0)
+
+        peak = np.fmax.accumulate(eq, axis=0)
+        max_drawdown = np.nanmin(eq / peak - 1, axis=0)
+
+    metrics = {
+        "total_return": last / first - 1,
+        "cagr": cagr,
+        "sharpe": sharpe,
+        "sortino": sortino,
+        "max_drawdown": max_drawdown,
+        "max_drawdown_days": max_drawdown_duration(eq),
+    }
+
+    if position is not None:
+        pos, _ = _as_matrix(position)
+        pos = np.nan_to_num(pos, nan=0.0)
+        held = pos[1:] != 0
+        with np.errstate(invalid="ignore"):
+            metrics["turnover"] = np.abs(np.diff(pos, axis=0, prepend=0.0)).sum(axis=0) / np.maximum(n_valid, 1)
+            metrics["hit_rate"] = ((returns > 0) & held).sum(axis=0) / np.maximum(held.sum(axis=0), 1)
+            metrics["exposure"] = (pos != 0).sum(axis=0) / np.maximum(n_valid, 1)
+    else:
+        # 没有持仓信息时，胜率按净值有变化的交易日计算
+        moving = np.nan_to_num(returns) != 0
+        metrics["hit_rate"] = (np.nan_to_num(returns) > 0).sum(axis=0) / np.maximum(moving.sum(axis=0), 1)
+
+    return pd.DataFrame(metrics, index=columns)
+
+
+def _plot_equity(stock, dates, equity, benchmark, save_path):
+    # 在绘图进程中执行: 无界面后端，按需导入
+    with timer("plot"):
+        return _draw_equity(stock, dates, equity, benchmark, save_path)
+
+
+def _draw_equity(stock, dates, equity, benchmark, save_path):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(10, 6))
+    # 策略曲线（实线）
+    plt.plot(dates, equity, label=f"{stock} Strategy", color='red', linewidth=2)
+    # 基准曲线（虚线）
+    if benchmark is not None:
+        plt.plot(dates, benchmark, label=f"{stock} Buy & Hold", color='blue', linestyle='--', alpha=0.7)
+    plt.title(f"{stock}: Strategy vs Buy & Hold")
+    plt.xlabel("Date")
+    plt.ylabel("Portfolio Value (Initial: 10000)")
+    plt.legend()
+    plt.grid(True)
+    plt.savefig(save_path)
+    plt.close()
+    return save_path
+
+
+class ChartRenderer:
+    """
+    后台绘图: submit() 立即返回，close() 等待全部完成并返回已保存的路径
+    """
+
+    def __init__(self, output_dir="backtest_results", max_workers=None):
+        self.output_dir = output_dir
+        self.max_workers = max_workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self._pool = None
+        self._futures = []
+
+    def submit(self, stock, equity, benchmark=None):
+        """
+        equity / benchmark: 以日期为索引的 Series
+        """
+        if self._pool is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        save_path = os.path.join(self.output_dir, f"{stock}_backtest.png")
+        # 绘图进程内的计时随结果带回
+        self._futures.append(self._pool.submit(
+            collected, _plot_equity, stock, equity.index.to_numpy(), equity.to_numpy(),
+            None if benchmark is None else benchmark.to_numpy(), save_path))
+        return save_path
+
+    def close(self):
+        paths = []
+        for future in self._futures:
+            try:
+                path, snapshot = future.result()
+                merge(snapshot)
+                paths.append(path)
+            except Exception as e:
+                print(f"  绘图失败: {e}")
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self._futures = []
+        return paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,289 @@
+import argparse
+import glob
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+# 基准测试: 吞吐与峰值内存
+# - scoring: 情感打分 (texts/s)，默认使用随机权重的小模型，完全离线；--workers 给出多进程分片打分的扩展性
+# - dedup: 打分前的精确 + MinHash/LSH 近似去重 (rows/s) 及省下的模型调用比例；
+#   并检查只差一个极性字的标题 (OPPOSITE_TITLES) 不被合并
+# - archive: 超大新闻档案的新闻情感处理 (calc_sentiment.process_news_data)，整个文件一次读入 vs 分块流式，
+#   对比峰值内存 (分块时应与档案大小无关)；标题几乎互不相同，吞吐包含模型打分
+# - backtest: 单股向量化引擎 / 原逐行循环 / 组合面板回测 (bars/s)
+# - csv: 原始 CSV、datastore CSV 回退与 Parquet 读取 (rows/s)
+# - pdf: 研报 PDF 文本提取 (pages/s)
+# 数据由 synthetic_data.py 按 seed 确定性生成，规模由 --symbols 控制 (6 ~ 5000)
+#
+# 运行 (项目根目录): python benchmarks/run_benchmarks.py --symbols 6
+#                    python benchmarks/run_benchmarks.py --symbols 5000 --only backtest csv
+#                    python benchmarks/run_benchmarks.py --model IDEA-CCNL/Erlangshen-Roberta-110M-Sentiment
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.join(PROJECT_ROOT, "etl"))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic_data
+
+BENCHMARKS = ("scoring", "dedup", "archive", "backtest", "csv", "pdf")
+
+# 情绪相反、字符 n-gram 相似度却很高的标题对，近似去重不得合并
+OPPOSITE_TITLES = [
+    ("比亚迪：首次覆盖给予买入评级，新能源龙头地位稳固", "比亚迪：首次覆盖给予卖出评级，新能源龙头地位稳固"),
+    ("贵州茅台：上调目标价至2100元，维持增持评级", "贵州茅台：下调目标价至2100元，维持增持评级"),
+    ("招商银行：业绩稳健，维持增持评级", "招商银行：业绩承压，维持减持评级"),
+    ("宁德时代：三季度净利润同比增长35%，超市场预期", "宁德时代：三季度净利润同比下滑35%，超市场预期"),
+    ("中国平安：新业务价值转正，盈利能力改善", "中国平安：新业务价值转负，亏损能力改善"),
+]
+
+
+# tracemalloc 会明显拖慢分配密集的代码 (如 pdfplumber)，计时与内存分两次运行
+TRACE_MEMORY = True
+
+
+def measure(name, unit, fn):
+    """
+    运行 fn() (返回处理的数量)，记录耗时、吞吐；再运行一次记录 Python 堆峰值 (tracemalloc)
+    """
+    start = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - start
+    peak = float("nan")
+    if TRACE_MEMORY:
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    result = {
+        "benchmark": name,
+        "count": count,
+        "seconds": elapsed,
+        "rate": count / elapsed if elapsed > 0 else float("inf"),
+        "unit": unit,
+        "peak_mb": peak / 1024 / 1024,
+    }
+    print(f"  {name:<28}{count:>12,} {unit:<7}{elapsed:>9.3f}s{result['rate']:>14,.0f} {unit}/s"
+          f"{result['peak_mb']:>10.1f} MB")
+    return result
+
+
+def bench_scoring(codes, model, n_texts, batch_size, workers=()):
+    from sentiment_scoring import load_model, score_texts
+    from sentiment_service import ShardedScorer
+
+    model_name = model
+    tokenizer, model, device = load_model(model_name)
+    rng = np.random.default_rng(0)
+    texts = synthetic_data.synthetic_headlines(n_texts, rng, name=synthetic_data.BASE_NAMES[0], duplicate_rate=0)
+    # 预热，排除首批初始化开销
+    score_texts(texts[:batch_size], tokenizer, model, device, batch_size=batch_size, show_progress=False)
+    results = [
+        measure("score_texts (128 tok)", "texts", lambda: len(score_texts(
+            texts, tokenizer, model, device, batch_size=batch_size, max_length=128, show_progress=False))),
+    ]
+    for n in workers:
+        scorer = ShardedScorer("fp32", workers=n, model_name=model_name)
+        scorer.load()
+        scorer.score(texts[:batch_size * n], batch_size=batch_size, show_progress=False)
+        results.append(measure(f"ShardedScorer ({n} proc)", "texts", lambda: len(scorer.score(
+            texts, max_length=128, batch_size=batch_size, show_progress=False))))
+        scorer.close()
+    return results
+
+
+def bench_dedup(n_texts):
+    from text_dedup import collapse_duplicates
+
+    rng = np.random.default_rng(0)
+    texts = synthetic_data.varied_headlines(n_texts, rng, duplicate_rate=0.3)
+    stats = {}
+    results = [measure("collapse_duplicates", "texts", lambda: stats.update(collapse_duplicates(texts)[1])
+                       or len(texts))]
+    print(f"    {stats['rows']:,} 行 -> 精确去重后 {stats['exact_groups']:,} -> 近似聚类后 {stats['clusters']:,}"
+          f" (节省模型调用 {stats['saved'] * 100:.1f}%)")
+    results[0]["saved"] = stats["saved"]
+
+    merged = [pair for pair in OPPOSITE_TITLES if collapse_duplicates(list(pair))[0][1] == 0]
+    print(f"    极性相反标题对: {len(OPPOSITE_TITLES) - len(merged)}/{len(OPPOSITE_TITLES)} 未合并")
+    if merged:
+        raise SystemExit(f"去重错误: 情绪相反的标题被合并 {merged}")
+    return results
+
+
+def bench_archive(codes, model, n_rows, chunk_size, batch_size):
+    import contextlib
+    import io
+    from calc_sentiment import process_news_data
+    from sentiment_cache import normalize_text
+    from sentiment_service import InProcessScorer
+
+    # 一只股票的超大新闻档案 (其余股票无新闻)
+    # 标题用 varied_headlines (几乎都不相同)：模板标题只有几十种，去重后几乎不调用模型，测到的只是 CSV 读写
+    rng = np.random.default_rng(0)
+    dates = pd.date_range("2015-01-05", periods=750, freq="B").to_numpy()
+    news = synthetic_data.synthetic_news(codes[0], synthetic_data.BASE_NAMES[0], n_rows, dates, rng)
+    news["新闻标题"] = synthetic_data.varied_headlines(n_rows, rng)
+    news["新闻内容"] = [f"{t}。据公告显示，公司相关事项正在推进中。" for t in news["新闻标题"]]
+    unique = news["新闻标题"].map(normalize_text).nunique()
+    print(f"  新闻档案: {n_rows:,} 行，{unique:,} 条不同标题 (需模型打分)")
+    os.makedirs("data/alternative/news", exist_ok=True)
+    news.to_csv(f"data/alternative/news/{codes[0]}_news.csv", index=False)
+    scorer = InProcessScorer("fp32", model_name=model)
+    scorer.load()
+
+    def run(size):
+        # 每次从头处理 (清空任务队列与情感缓存)，进度输出不计入
+        for path in glob.glob("data/cache/sentiment_cache.sqlite*"):
+            os.remove(path)
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            process_news_data(batch_size, chunk_size=size, restart=True, scorer=scorer)
+        return n_rows
+
+    results = [
+        measure("news archive (whole file)", "rows", lambda: run(None)),
+        measure(f"news archive (chunk {chunk_size})", "rows", lambda: run(chunk_size)),
+    ]
+    for result in results:
+        result["unique_texts"] = unique
+    scorer.close()
+    return results
+
+
+def bench_backtest(codes, n_days):
+    from backtest_engine import reference_backtest, run_backtest
+    from portfolio_backtest import run_portfolio_backtest
+    from etl.datastore import load_frame
+
+    frames = {}
+    for code in codes:
+        df = load_frame("equity_daily", code, columns=["close"]).set_index("date")
+        rng = np.random.default_rng(int(code))
+        events = df.index[rng.choice(len(df), size=max(1, len(df) // 20), replace=False)]
+        frames[code] = (df, dict(zip(events, rng.uniform(-1, 1, len(events)))))
+
+    sample = list(frames.values())[:min(len(frames), 6)]
+    results = [
+        measure("iterrows loop (<=6 stocks)", "bars", lambda: sum(
+            len(reference_backtest(df, sm)[0]) for df, sm in sample)),
+        measure("backtest_engine", "bars", lambda: sum(
+            len(run_backtest(df, sm)) for df, sm in frames.values())),
+    ]
+
+    close = pd.DataFrame({code: df["close"] for code, (df, _) in frames.items()})
+    sentiment = pd.DataFrame({code: pd.Series(sm) for code, (_, sm) in frames.items()})
+    sentiment = sentiment.reindex(index=close.index, columns=close.columns)
+    close_arr, sent_arr = close.to_numpy(), sentiment.to_numpy()
+    results.append(measure("portfolio_backtest", "bars", lambda: (
+        run_portfolio_backtest(close_arr, sent_arr)["position"].size)))
+    return results
+
+
+def bench_csv(codes, n_days):
+    from etl.datastore import load_frame, migrate_csv
+
+    equity_files = glob.glob("data/equity/daily/*.csv")
+    report_files = glob.glob("data/alternative/reports/*.csv")
+    results = [
+        measure("pd.read_csv equity", "rows", lambda: sum(len(pd.read_csv(f)) for f in equity_files)),
+        measure("pd.read_csv reports", "rows", lambda: sum(len(pd.read_csv(f)) for f in report_files)),
+        measure("load_frame (CSV fallback)", "rows", lambda: sum(
+            len(load_frame("equity_daily", code)) for code in codes)),
+    ]
+    try:
+        migrate_csv("equity_daily")
+    except Exception as e:
+        print(f"  跳过 Parquet 读取 ({e})")
+        return results
+    results.append(measure("load_frame (Parquet)", "rows", lambda: sum(
+        len(load_frame("equity_daily", code)) for code in codes)))
+    results.append(measure("load_frame (Parquet, close)", "rows", lambda: sum(
+        len(load_frame("equity_daily", code, columns=["close"])) for code in codes)))
+    return results
+
+
+def bench_pdf(n_docs, pages_per_doc):
+    from calc_fulltext_sentiment import extract_pdf_text
+
+    rng = np.random.default_rng(0)
+    pdfs = [synthetic_data.synthetic_pdf(pages_per_doc, rng) for _ in range(n_docs)]
+
+    def run():
+        for content in pdfs:
+            extract_pdf_text(content, max_pages=None)
+        return n_docs * pages_per_doc
+
+    return [measure("extract_pdf_text", "pages", run)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="吞吐与峰值内存基准测试")
+    parser.add_argument("--symbols", type=int, default=6, help="合成股票数 (6 ~ 5000)")
+    parser.add_argument("--days", type=int, default=750)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--model", default=None, help="打分模型 (默认离线生成随机权重的小模型)")
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--dedup-texts", type=int, default=200000, help="去重基准的标题条数")
+    parser.add_argument("--archive-rows", type=int, default=200000, help="新闻档案基准的行数")
+    parser.add_argument("--chunk-size", type=int, default=20000, help="新闻档案基准分块读取的行数")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, nargs="*", default=[], help="分片打分的进程数，如 --workers 1 2 4 8")
+    parser.add_argument("--pdfs", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="不统计 Python 堆峰值 (省去第二次运行)")
+    parser.add_argument("--workdir", default=None, help="合成数据目录 (默认临时目录，结束后删除)")
+    parser.add_argument("--json", default=None, help="结果另存为 JSON")
+    args = parser.parse_args()
+    global TRACE_MEMORY
+    TRACE_MEMORY = not args.no_memory
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="nlp_mf_bench_"))
+    print(f"生成合成数据: {args.symbols} 只股票 × {args.days} 个交易日 -> {workdir}")
+    codes = synthetic_data.generate_market(workdir, args.symbols, args.days, news_per_symbol=0,
+                                           reports_per_symbol=30)
+    model = args.model
+    if ("scoring" in args.only or "archive" in args.only) and model is None:
+        model = synthetic_data.build_tiny_model(os.path.join(workdir, "tiny-model"))
+
+    cwd = os.getcwd()
+    # datastore 使用相对路径 data/...，切换到合成数据目录
+    os.chdir(workdir)
+    results = []
+    print(f"  {'benchmark':<28}{'count':>12} {'':<7}{'time':>10}{'throughput':>20}{'py peak':>10}")
+    try:
+        if "scoring" in args.only:
+            results += bench_scoring(codes, model, args.texts, args.batch_size, args.workers)
+        if "dedup" in args.only:
+            results += bench_dedup(args.dedup_texts)
+        if "archive" in args.only:
+            results += bench_archive(codes, model, args.archive_rows, args.chunk_size, args.batch_size)
+        if "backtest" in args.only:
+            results += bench_backtest(codes, args.days)
+        if "csv" in args.only:
+            results += bench_csv(codes, args.days)
+        if "pdf" in args.only:
+            results += bench_pdf(args.pdfs, args.pages)
+    finally:
+        os.chdir(cwd)
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"进程峰值 RSS: {max_rss_mb:.0f} MB")
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"symbols": args.symbols, "days": args.days, "max_rss_mb": max_rss_mb,
+                       "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存至 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
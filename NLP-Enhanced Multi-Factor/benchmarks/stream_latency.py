@@ -0,0 +1,95 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import urllib.request
+
+# 流式新闻端到端延迟测试 (完全离线)
+# - 新闻源: synthetic_data.FakeNewsSource，按泊松过程实时产生新闻 (含转载重复)，接口与 stock_news_em 相同
+# - 打分: 随机权重的小模型 (进程内)，或 --model 指定的真实模型
+# - 运行 NewsStreamer 若干轮，检查: 去重后没有重复打分、追加写入的行数、LEAN 实时端点可读取，
+#   并输出 发布时间 -> 信号可用 的延迟分布 (p50 / p95 / max)
+#
+# 运行 (项目根目录): python benchmarks/stream_latency.py --seconds 20 --interval 1
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.join(PROJECT_ROOT, "etl"))
+sys.path.append(os.path.join(PROJECT_ROOT, "SentimentAlphaStrategy"))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic_data
+from live_events import cursor, parse_events
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式新闻端到端延迟测试 (本地假新闻源)")
+    parser.add_argument("--symbols", type=int, default=6)
+    parser.add_argument("--seconds", type=float, default=20.0, help="运行时长")
+    parser.add_argument("--interval", type=float, default=1.0, help="轮询间隔 (秒)")
+    parser.add_argument("--rate", type=float, default=0.5, help="每只股票每秒的新闻条数")
+    parser.add_argument("--duplicate-rate", type=float, default=0.3)
+    parser.add_argument("--model", default=None, help="打分模型 (默认离线生成随机权重的小模型)")
+    parser.add_argument("--workdir", default=None, help="工作目录 (默认临时目录，结束后删除)")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="nlp_mf_stream_"))
+    model = args.model or synthetic_data.build_tiny_model(os.path.join(workdir, "tiny-model"))
+    codes, _ = synthetic_data.stock_universe(args.symbols)
+
+    from news_stream import NewsStreamer
+    from sentiment_cache import normalize_text
+    from sentiment_service import InProcessScorer
+    import pandas as pd
+
+    cwd = os.getcwd()
+    # datastore / 缓存使用相对路径 data/...，切换到工作目录
+    os.chdir(workdir)
+    try:
+        scorer = InProcessScorer("fp32", model_name=model)
+        if not scorer.load():
+            raise SystemExit("模型加载失败")
+        source = synthetic_data.FakeNewsSource(codes, rate=args.rate, duplicate_rate=args.duplicate_rate)
+        # 假新闻源不需要限速
+        streamer = NewsStreamer(codes, source=source, scorer=scorer, batch_size=32, rate=1000.0)
+        port = streamer.serve(port=0)
+
+        max_polls = max(1, int(args.seconds / args.interval))
+        print(f"轮询 {len(codes)} 只股票 {max_polls} 轮 (间隔 {args.interval}s，约 {args.rate} 条/秒/股)...")
+        stats = streamer.run(poll_interval=args.interval, max_polls=max_polls, report_every=float("inf"))
+
+        # 与 LEAN 的 Reader 相同: 整个响应体一次解析
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/live/{codes[0]}?since={cursor()}", timeout=5) as resp:
+            live_events = parse_events(resp.read().decode("utf-8"))
+        streamer.close()
+
+        written = 0
+        duplicates = 0
+        for code in codes:
+            path = os.path.join(streamer.save_dir, f"{code}_sentiment.csv")
+            if os.path.exists(path):
+                df = pd.read_csv(path)
+                written += len(df)
+                duplicates += int(df["新闻标题"].map(normalize_text).duplicated().sum())
+    finally:
+        os.chdir(cwd)
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"  产生新闻:     {source.published}")
+    print(f"  抓取行数:     {stats['fetched']} (含翻页重叠与转载)")
+    print(f"  打分 / 写入:  {stats['scored']} / {written}，重复写入 {duplicates}")
+    print(f"  实时端点:     {codes[0]} 共 {len(live_events)} 条" +
+          (f"，最新 {live_events[-1][0]} {live_events[-1][1]:+.4f}" if live_events else ""))
+    if stats["count"]:
+        print(f"  端到端延迟:   p50 {stats['p50_ms']:.0f} ms, p95 {stats['p95_ms']:.0f} ms, "
+              f"max {stats['max_ms']:.0f} ms (上界约为轮询间隔 {args.interval * 1000:.0f} ms + 抓取 + 打分)")
+    if duplicates:
+        raise SystemExit("去重失败: 同一标题被重复写入")
+    if [t for t, _ in live_events] != sorted({t for t, _ in live_events}):
+        raise SystemExit("实时端点的事件时间未严格递增")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+
+# 确定性的合成数据生成器 (离线基准测试用)
+# 与真实数据同样的目录结构与列名:
+# - data/equity/daily/{代码}.csv                 Date, Open, High, Low, Close, Volume
+# - data/alternative/news/{代码}_news.csv        关键词, 新闻标题, 新闻内容, 发布时间, 文章来源, 新闻链接
+# - data/alternative/reports/{代码}_reports.csv  序号, 股票代码, 股票简称, 报告名称, 东财评级, 机构, 行业, 日期, 报告PDF链接
+# 另外提供: 合成研报 PDF (纯文本页)、随机权重的小模型 (不依赖网络)、实时产生新闻的本地假新闻源
+#
+# 运行: python benchmarks/synthetic_data.py --root data/synthetic --symbols 6
+#       (不要把 root 指向项目自身的 data/，会覆盖真实数据)
+
+# 前 6 只与项目实际使用的股票一致
+BASE_STOCKS = ['002202', '601615', '000630', '000878', '000875', '603067']
+BASE_NAMES = ['金风科技', '明阳智能', '铜陵有色', '云南铜业', '吉电股份', '振华股份']
+
+POSITIVE_EVENTS = ["业绩大增，超预期", "中标大额订单", "获机构上调评级至买入", "新产品量产顺利", "净利润同比增长",
+                   "回购股份彰显信心", "海外市场拓展加速", "毛利率显著改善"]
+NEGATIVE_EVENTS = ["工厂发生火灾，停产整顿", "业绩不及预期", "遭股东大比例减持", "收到监管问询函", "净利润同比下滑",
+                   "原材料价格上涨压缩利润", "项目进度延期", "涉及重大诉讼"]
+NEUTRAL_EVENTS = ["召开年度股东大会", "发布季度报告", "董事会换届", "披露投资者关系活动记录", "调整组织架构"]
+REPORT_TEMPLATES = ["{name}({code})：{event}，维持买入评级", "{name}深度报告：{event}", "{name}点评：{event}",
+                    "{industry}行业周报：{name}{event}"]
+RATINGS = ["买入", "增持", "中性", "减持"]
+INSTITUTIONS = ["中信证券", "华泰证券", "国泰君安", "招商证券", "广发证券", "海通证券"]
+INDUSTRIES = ["风电设备", "有色金属", "电力", "化学原料", "光伏设备", "储能"]
+SOURCES = ["东方财富", "证券时报", "上海证券报", "财联社"]
+
+
+def stock_universe(n_symbols):
+    """
+    前 6 只为项目股票，其余按序生成 6 位代码
+    """
+    codes = list(BASE_STOCKS[:n_symbols])
+    names = list(BASE_NAMES[:n_symbols])
+    i = 0
+    while len(codes) < n_symbols:
+        code = f"{300000 + i:06d}" if i % 2 else f"{600000 + i:06d}"
+        i += 1
+        if code in codes:
+            continue
+        codes.append(code)
+        names.append(f"合成{len(codes):04d}")
+    return codes, names
+
+
+def synthetic_prices(n_days, rng, start="2015-01-05"):
+    """
+    几何随机游走 OHLCV，列名与 download_market.py 一致
+    """
+    dates = pd.bdate_range(start, periods=n_days)
+    close = 10 * np.exp(np.cumsum(rng.normal(0.0002, 0.02, n_days)))
+    open_ = close * np.exp(rng.normal(0, 0.005, n_days))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, n_days)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, n_days)))
+    volume = rng.integers(10_000, 1_000_000, n_days).astype(float)
+    return pd.DataFrame({
+        'Date': dates.strftime('%Y-%m-%d'),
+        'Open': open_.round(2), 'High': high.round(2), 'Low': low.round(2), 'Close': close.round(2),
+        'Volume': volume,
+    })
+
+
+def synthetic_headlines(n, rng, name="公司", duplicate_rate=0.2):
+    """
+    n 条新闻标题 (正面 / 负面 / 中性模板)，duplicate_rate 比例为已有标题的转载 (仅标点/空格不同)
+    """
+    events = POSITIVE_EVENTS + NEGATIVE_EVENTS + NEUTRAL_EVENTS
+    titles = []
+    for _ in range(n):
+        if titles and rng.random() < duplicate_rate:
+            base = titles[int(rng.integers(len(titles)))]
+            variant = rng.integers(3)
+            titles.append(base + "！" if variant == 0 else base.replace("，", ", ") if variant == 1 else " " + base)
+        else:
+            event = events[int(rng.integers(len(events)))]
+            titles.append(f"{name}{event}")
+    return titles
+
+
+def varied_headlines(n, rng, duplicate_rate=0.3):
+    """
+    n 条互不相同的标题 (随机公司名 + 事件 + 随机数字)，duplicate_rate 比例为已有标题的转载:
+    标点 / 空格不同 (精确去重可识别) 或前后加了来源前缀 / 后缀 (近似去重才能识别)
+    """
+    events = POSITIVE_EVENTS + NEGATIVE_EVENTS + NEUTRAL_EVENTS
+    titles = []
+    for _ in range(n):
+        if titles and rng.random() < duplicate_rate:
+            base = titles[int(rng.integers(len(titles)))]
+            variant = rng.integers(4)
+            titles.append(base + "！" if variant == 0 else base.replace("，", ", ") if variant == 1
+                          else "快讯：" + base if variant == 2 else base + "(附公告)")
+        else:
+            name = "".join(BASE_NAMES[i][j] for i, j in zip(rng.integers(len(BASE_NAMES), size=4), range(4)))
+            event = events[int(rng.integers(len(events)))]
+            titles.append(f"{name}{event}，涉及金额{rng.integers(1, 100000)}万元，{rng.integers(1, 100)}家机构参与调研")
+    return titles
+
+
+NEWS_COLUMNS = ['关键词', '新闻标题', '新闻内容', '发布时间', '文章来源', '新闻链接']
+
+
+def synthetic_news(code, name, n_rows, dates, rng):
+    titles = synthetic_headlines(n_rows, rng, name)
+    times = pd.to_datetime(rng.choice(dates, size=n_rows)) + pd.to_timedelta(rng.integers(0, 86400, n_rows), unit="s")
+    return pd.DataFrame({
+        '关键词': code,
+        '新闻标题': titles,
+        '新闻内容': [f"{t}。据公告显示，公司相关事项正在推进中。" for t in titles],
+        '发布时间': times.strftime('%Y-%m-%d %H:%M:%S'),
+        '文章来源': [SOURCES[i] for i in rng.integers(len(SOURCES), size=n_rows)],
+        '新闻链接': [f"http://finance.example.com/news/{code}/{i}.html" for i in range(n_rows)],
+    }).sort_values('发布时间', ascending=False).reset_index(drop=True)
+
+
+class FakeNewsSource:
+    """
+    本地假新闻源，调用方式与 ak.stock_news_em 相同: source(stock) -> DataFrame (最近 page_size 条)
+    每只股票按泊松过程以 rate 条/秒 实时产生新闻，发布时间精确到微秒 (用于测端到端延迟)
+    """
+
+    def __init__(self, stocks, rate=1.0, page_size=10, duplicate_rate=0.2, seed=0):
+        self.rate = rate
+        self.page_size = page_size
+        self.duplicate_rate = duplicate_rate
+        self.rngs = {code: np.random.default_rng([seed, i]) for i, code in enumerate(stocks)}
+        self.names = dict(zip(stocks, (BASE_NAMES * (len(stocks) // len(BASE_NAMES) + 1))[:len(stocks)]))
+        self.pages = {code: pd.DataFrame(columns=NEWS_COLUMNS) for code in stocks}
+        self.updated = {code: time.time() for code in stocks}
+        self.published = 0
+
+    def __call__(self, stock):
+        rng = self.rngs[stock]
+        now = time.time()
+        n = int(rng.poisson(self.rate * (now - self.updated[stock])))
+        if n:
+            times = np.sort(rng.uniform(self.updated[stock], now, n))
+            titles = synthetic_headlines(n, rng, self.names[stock], self.duplicate_rate)
+            page = pd.DataFrame({
+                '关键词': stock,
+                '新闻标题': titles,
+                '新闻内容': [f"{t}。据公告显示，公司相关事项正在推进中。" for t in titles],
+                '发布时间': [time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t)) + f".{int(t % 1 * 1e6):06d}"
+                             for t in times],
+                '文章来源': [SOURCES[i] for i in rng.integers(len(SOURCES), size=n)],
+                '新闻链接': [f"http://finance.example.com/news/{stock}/{self.published + i}.html" for i in range(n)],
+            })
+            self.published += n
+            # 与接口一致: 最新的在前，只返回最近一页
+            self.pages[stock] = pd.concat([page.iloc[::-1], self.pages[stock]], ignore_index=True).head(self.page_size)
+        self.updated[stock] = now
+        return self.pages[stock].copy()
+
+
+def synthetic_reports(code, name, n_rows, dates, rng):
+    events = POSITIVE_EVENTS + NEGATIVE_EVENTS + NEUTRAL_EVENTS
+    industry = INDUSTRIES[int(rng.integers(len(INDUSTRIES)))]
+    titles = [REPORT_TEMPLATES[int(rng.integers(len(REPORT_TEMPLATES)))].format(
+        name=name, code=code, industry=industry, event=events[int(rng.integers(len(events)))])
+        for _ in range(n_rows)]
+    # 研报日期包含周末 (与真实数据一致，用于测试对齐到交易日)
+    calendar = pd.date_range(dates[0], dates[-1], freq="D")
+    report_dates = pd.to_datetime(rng.choice(calendar, size=n_rows))
+    return pd.DataFrame({
+        '序号': np.arange(1, n_rows + 1),
+        '股票代码': code,
+        '股票简称': name,
+        '报告名称': titles,
+        '东财评级': [RATINGS[i] for i in rng.integers(len(RATINGS), size=n_rows)],
+        '机构': [INSTITUTIONS[i] for i in rng.integers(len(INSTITUTIONS), size=n_rows)],
+        '行业': industry,
+        '日期': report_dates.strftime('%Y-%m-%d'),
+        '报告PDF链接': [f"http://pdf.example.com/{code}/{i}.pdf" for i in range(n_rows)],
+    }).sort_values('日期', ascending=False).reset_index(drop=True)
+
+
+def generate_market(root, n_symbols=6, n_days=750, news_per_symbol=100, reports_per_symbol=30, seed=0):
+    """
+    在 root 下生成与 data/ 相同布局的合成数据，返回股票代码列表
+    同一 seed 生成的数据完全相同
+    """
+    codes, names = stock_universe(n_symbols)
+    dirs = {
+        "equity": os.path.join(root, "data/equity/daily"),
+        "news": os.path.join(root, "data/alternative/news"),
+        "reports": os.path.join(root, "data/alternative/reports"),
+    }
+    for d in dirs.values():
+        os.makedirs(d, exist_ok=True)
+
+    for i, (code, name) in enumerate(zip(codes, names)):
+        # 每只股票独立的随机流，股票数变化不影响已有股票的数据
+        rng = np.random.default_rng([seed, i])
+        prices = synthetic_prices(n_days, rng)
+        prices.to_csv(os.path.join(dirs["equity"], f"{code}.csv"), index=False)
+        dates = pd.DatetimeIndex(prices['Date'])
+        if news_per_symbol:
+            synthetic_news(code, name, news_per_symbol, dates.to_numpy(), rng).to_csv(
+                os.path.join(dirs["news"], f"{code}_news.csv"), index=False)
+        if reports_per_symbol:
+            synthetic_reports(code, name, reports_per_symbol, dates, rng).to_csv(
+                os.path.join(dirs["reports"], f"{code}_reports.csv"), index=False)
+    return codes
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages):
+    """
+    生成只含文本的最小 PDF (标准 Helvetica 字体，仅 ASCII)，pages: 每页的文本行列表
+    """
+    objects = []
+    page_ids = []
+    n_pages = len(pages)
+    # 对象编号: 1 Catalog, 2 Pages, 3 Font, 之后每页 (Page, Contents) 各一个
+    font_id = 3
+    for i, lines in enumerate(pages):
+        page_id, content_id = 4 + 2 * i, 5 + 2 * i
+        page_ids.append(page_id)
+        stream = "BT /F1 10 Tf 12 TL 50 800 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        objects.append((page_id, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                                 f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>"))
+        objects.append((content_id, f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream"))
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects = [
+        (1, "<< /Type /Catalog /Pages 2 0 R >>"),
+        (2, f"<< /Type /Pages /Kids [{kids}] /Count {n_pages} >>"),
+        (3, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"),
+    ] + objects
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id, body in objects:
+        offsets[obj_id] = len(out)
+        out += f"{obj_id} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for obj_id in range(1, len(objects) + 1):
+        out += f"{offsets[obj_id]:010d} 00000 n \n".encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
+
+
+def synthetic_pdf(n_pages, rng, lines_per_page=60):
+    words = ["revenue", "growth", "margin", "order", "capacity", "wind", "copper", "outlook", "rating", "buy",
+             "profit", "guidance", "demand", "cost", "risk", "quarter"]
+    pages = [[" ".join(words[j] for j in rng.integers(len(words), size=12)) for _ in range(lines_per_page)]
+             for _ in range(n_pages)]
+    return make_pdf(pages)
+
+
+def build_tiny_model(path, seed=0, hidden_size=64, layers=2):
+    """
+    随机权重的小型 BERT 分类模型 + 字级 tokenizer，保存到 path，可直接用 load_model(path) 加载
+    只用于离线测吞吐，分数没有意义
+    """
+    import torch
+    from transformers import BertConfig, BertForSequenceClassification, BertTokenizerFast
+
+    if os.path.exists(os.path.join(path, "config.json")):
+        return path
+    os.makedirs(path, exist_ok=True)
+
+    chars = set("".join(POSITIVE_EVENTS + NEGATIVE_EVENTS + NEUTRAL_EVENTS + REPORT_TEMPLATES + BASE_NAMES
+                        + RATINGS + INSTITUTIONS + INDUSTRIES + SOURCES) + "合成公司据公告显示相关事项正在推进中。")
+    chars |= set("0123456789abcdefghijklmnopqrstuvwxyz")
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + sorted(chars)
+    vocab_file = os.path.join(path, "vocab.txt")
+    with open(vocab_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(vocab) + "\n")
+    tokenizer = BertTokenizerFast(vocab_file=vocab_file)
+    if len(tokenizer) != len(vocab):
+        # transformers 5 中词表参数改为 vocab
+        tokenizer = BertTokenizerFast(vocab=vocab_file)
+    tokenizer.save_pretrained(path)
+
+    torch.manual_seed(seed)
+    config = BertConfig(vocab_size=len(vocab), hidden_size=hidden_size, num_hidden_layers=layers,
+                        num_attention_heads=2, intermediate_size=hidden_size * 2, max_position_embeddings=512,
+                        num_labels=2)
+    BertForSequenceClassification(config).save_pretrained(path)
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="生成合成行情 / 新闻 / 研报数据")
+    parser.add_argument("--root", default="data/synthetic")
+    parser.add_argument("--symbols", type=int, default=6)
+    parser.add_argument("--days", type=int, default=750)
+    parser.add_argument("--news", type=int, default=100, help="每只股票的新闻条数")
+    parser.add_argument("--reports", type=int, default=30, help="每只股票的研报条数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if os.path.abspath(args.root) == os.path.abspath("."):
+        raise SystemExit("root 不能是项目根目录 (会覆盖真实数据)")
+    codes = generate_market(args.root, args.symbols, args.days, args.news, args.reports, args.seed)
+    print(f"已生成 {len(codes)} 只股票的合成数据: {args.root}/data/")
@@ -15,6 +15,7 @@ def check_gpu():
     else:
         print("CUDA Available: NO")
         print("WARNING: Running on CPU. NLP tasks will be slow.")
+        print("Tip: compare int8 / ONNX Runtime CPU backends with: python etl/inference_backends.py")
 
 if __name__ == "__main__":
     check_gpu()
@@ -0,0 +1,157 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from datastore import DATASETS, list_symbols, load_frame, write_frame
+from instrumentation import run_metrics, timer
+
+# 情感事件 -> 交易日历 的 as-of 对齐，生成预计算的情感因子面板 (数据集 sentiment_factor)
+# - 每个事件映射到其发布时间之后最近的交易日 (排序后的 as-of join，direction="forward")：
+#   周末 / 节假日发布的研报顺延到下一个交易日，不再因日期精确匹配不上而被丢弃
+#   带时分的新闻在收盘 (SESSION_CLOSE) 之后发布的，最早在下一个交易日生效
+# - 同一交易日的多条事件按 reducer 合并 (mean / last / sum / max_abs / median 或自定义函数)
+# - 没有事件的交易日不写入 (读取后为 NaN)，分数恰好为 0.0 的事件仍是一条有效消息
+# 每只股票以自身的行情日期为交易日历；回测直接读取结果，不再每次重建 dict / 日期交集，
+# LEAN 读取由 etl/export_lean.py 导出的紧凑文件
+#
+# 运行 (项目根目录，情感打分之后): python etl/align_sentiment.py
+#                                  python etl/align_sentiment.py --reducer last
+
+# 因子列名 -> 情感数据集 (新闻合并批量打分与实时流两个数据集)
+FACTOR_SOURCES = {
+    "report": ("report_sentiment",),
+    "fulltext": ("fulltext_sentiment",),
+    "news": ("news_sentiment", "news_stream_sentiment"),
+}
+
+FACTOR_COLUMNS = [c for name in FACTOR_SOURCES for c in (name, f"{name}_count")]
+
+SESSION_CLOSE = "15:00"
+
+
+def _max_abs(scores):
+    # 取绝对值最大的一条 (保留符号)
+    return scores.iloc[int(np.argmax(np.abs(scores.to_numpy())))]
+
+
+REDUCERS = {
+    "mean": "mean",
+    "median": "median",
+    "last": "last",
+    "sum": "sum",
+    "max_abs": _max_abs,
+}
+
+
+def align_events(event_times, scores, sessions, reducer="mean", session_close=SESSION_CLOSE):
+    """
+    event_times: 事件发布时间 (日期或带时分的时间)，scores: 对应的情感分
+    sessions: 交易日
+    返回以交易日为索引的 DataFrame (score, count)，只包含有事件的交易日
+    最后一个交易日之后的事件 (尚无可交易的日期) 被丢弃
+    """
+    events = pd.DataFrame({
+        "time": pd.to_datetime(pd.Series(event_times).reset_index(drop=True), errors="coerce"),
+        "score": pd.to_numeric(pd.Series(scores).reset_index(drop=True), errors="coerce"),
+    }).dropna()
+    day = events["time"].dt.normalize()
+    after_close = (events["time"] - day) > pd.Timedelta(f"{session_close}:00")
+    events["key"] = (day + pd.to_timedelta(after_close.astype(int), unit="D")).astype("datetime64[ns]")
+    # 同一交易日内保持发布时间顺序，reducer=last 取最后发布的一条
+    events = events.sort_values(["key", "time"], kind="stable")
+
+    calendar = pd.DataFrame({"session": pd.DatetimeIndex(sessions).unique().sort_values().astype("datetime64[ns]")})
+    merged = pd.merge_asof(events, calendar, left_on="key", right_on="session", direction="forward")
+    merged = merged.dropna(subset=["session"])
+
+    grouped = merged.groupby("session", sort=True)["score"]
+    agg = REDUCERS.get(reducer, reducer)
+    return pd.DataFrame({"score": grouped.agg(agg), "count": grouped.size()})
+
+
+def _event_times(dataset, df):
+    # 优先使用原始的发布时间列 (可能带时分)，规范的 date 列已按日归一
+    return next((df[c] for c in DATASETS[dataset]["date_cols"] if c != "date" and c in df.columns), df["date"])
+
+
+def _load_events(datasets, symbol):
+    """
+    一个来源的全部事件 (time, score)，没有数据时返回 None
+    多个数据集合并时，同一标题 + 发布时间的事件 (实时流抓到后又被批量下载) 只保留一条
+    """
+    frames = []
+    for dataset in datasets:
+        df = load_frame(dataset, symbol)
+        if df is None or df.empty or "sentiment_score" not in df.columns:
+            continue
+        frames.append(pd.DataFrame({
+            "time": pd.to_datetime(_event_times(dataset, df), errors="coerce", format="mixed").to_numpy(),
+            "score": df["sentiment_score"].to_numpy(),
+            "title": df["新闻标题"].to_numpy() if "新闻标题" in df.columns else None,
+        }))
+    if not frames:
+        return None
+    events = pd.concat(frames, ignore_index=True)
+    if len(frames) > 1:
+        events = events.drop_duplicates(["title", "time"])
+    return events
+
+
+def build_factor(symbol, reducer="mean", session_close=SESSION_CLOSE):
+    """
+    一只股票的对齐因子: date + 每个来源的 (分数, 事件数) 两列
+    没有行情数据时返回 None
+    """
+    prices = load_frame("equity_daily", symbol, columns=["close"])
+    if prices is None or prices.empty:
+        return None
+    sessions = prices["date"]
+
+    frames = []
+    for name, datasets in FACTOR_SOURCES.items():
+        events = _load_events(datasets, symbol)
+        if events is None:
+            continue
+        aligned = align_events(events["time"], events["score"], sessions, reducer, session_close)
+        frames.append(aligned.rename(columns={"score": name, "count": f"{name}_count"}))
+
+    # 列顺序固定，缺失的来源为空列
+    factor = pd.concat(frames, axis=1) if frames else pd.DataFrame(index=pd.DatetimeIndex([]))
+    factor = factor.reindex(columns=FACTOR_COLUMNS).sort_index()
+    count_cols = [f"{name}_count" for name in FACTOR_SOURCES]
+    factor[count_cols] = factor[count_cols].fillna(0).astype("int64")
+    factor.index.name = "date"
+    return factor.reset_index()
+
+
+def save_factor(symbol, factor):
+    # Parquet 仓库 (本地回测读取) + CSV (未安装 pyarrow 时的回退；LEAN 文件由 export_lean.py 导出)
+    csv_path = DATASETS["sentiment_factor"]["csv"].format(symbol=symbol)
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    with timer("csv_write", items=len(factor)):
+        factor.to_csv(csv_path, index=False, date_format="%Y-%m-%d")
+    with timer("parquet_write", items=len(factor)):
+        write_frame("sentiment_factor", symbol, factor)
+    return csv_path
+
+
+def main(reducer="mean", session_close=SESSION_CLOSE):
+    symbols = list_symbols("equity_daily")
+    print(f"对齐情感事件到交易日: {len(symbols)} 只股票 (reducer={reducer})")
+    for symbol in symbols:
+        with timer("align"):
+            factor = build_factor(symbol, reducer, session_close)
+        if factor is None:
+            continue
+        csv_path = save_factor(symbol, factor)
+        counts = ", ".join(f"{name} {int((factor[f'{name}_count'] > 0).sum())}" for name in FACTOR_SOURCES)
+        print(f"  {symbol}: {len(factor)} 个有事件的交易日 ({counts}) -> {csv_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="情感事件对齐到交易日历")
+    parser.add_argument("--reducer", default="mean", choices=list(REDUCERS))
+    parser.add_argument("--session-close", default=SESSION_CLOSE, help="收盘时间，之后发布的消息顺延到下一交易日")
+    args = parser.parse_args()
+    with run_metrics("align_sentiment"):
+        main(args.reducer, args.session_close)
@@ -3,109 +3,348 @@ import requests
 import pandas as pd
 import os
 import io
-import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from transformers import pipeline
+from sentiment_cache import SentimentCache
+from sentiment_scoring import AGGREGATORS
+from sentiment_service import get_scorer
+from fetch_engine import TokenBucket
+from datastore import write_frame
+from job_queue import QUEUE_PATH, JobQueue
+from instrumentation import collected, count, merge, observe, run_metrics, timer
 
-def download_and_analyze_pdf(url):
+MODEL_NAME = "IDEA-CCNL/Erlangshen-Roberta-110M-Sentiment"
+# pipeline 的分数口径 (Top label 概率带符号) 与标题打分不同，缓存里单独区分
+CACHE_MODEL_KEY = MODEL_NAME + "#pipeline"
+SUMMARY_CHARS = 400
+# summary 模式只用前 SUMMARY_CHARS 个字符，默认只解析前几页
+SUMMARY_PAGES = 2
+
+# 流水线各阶段之间的队列结束标记
+_DONE = object()
+
+def download_pdf(url):
     """
-    下载 PDF 并提取前 2 页文本
+    下载 PDF，失败返回 None
     """
     try:
         headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(url, headers=headers, timeout=10)
+        with timer("pdf_download"):
+            response = requests.get(url, headers=headers, timeout=10)
         if response.status_code != 200:
-            return ""
-        
-        with pdfplumber.open(io.BytesIO(response.content)) as pdf:
+            count("pdf_download_failures", reason=f"http_{response.status_code}")
+            return None
+        observe("pdf_bytes", len(response.content))
+        return response.content
+    except Exception as e:
+        print(f"Error downloading PDF {url}: {e}")
+        count("pdf_download_failures", reason=type(e).__name__)
+        return None
+
+def extract_pdf_text(content, max_pages=2):
+    """
+    提取前 max_pages 页文本 (CPU 密集，在进程池中执行)，max_pages=None 读取全部页
+    """
+    try:
+        with timer("pdf_parse") as t, pdfplumber.open(io.BytesIO(content)) as pdf:
             text = ""
             # 只读前 2 页，通常包含核心摘要
-            pages_to_read = min(2, len(pdf.pages))
+            pages_to_read = len(pdf.pages) if max_pages is None else min(max_pages, len(pdf.pages))
             for i in range(pages_to_read):
                 page_text = pdf.pages[i].extract_text()
                 if page_text:
                     text += page_text + "\n"
+            t.items = pages_to_read
             return text
     except Exception as e:
-        print(f"Error parsing PDF {url}: {e}")
+        print(f"Error parsing PDF: {e}")
         return ""
 
-def process_full_text_sentiment():
-    print("加载 NLP 模型 (Erlangshen-Roberta)...")
-    sentiment_pipeline = pipeline("sentiment-analysis", model="IDEA-CCNL/Erlangshen-Roberta-110M-Sentiment")
-    
-    report_dir = "data/alternative/reports"
-    sentiment_dir = "data/alternative/sentiment_fulltext"
-    os.makedirs(sentiment_dir, exist_ok=True)
-    
+def download_and_analyze_pdf(url):
+    """
+    下载 PDF 并提取前 2 页文本
+    """
+    content = download_pdf(url)
+    if not content:
+        return ""
+    return extract_pdf_text(content)
+
+def collect_report_docs(report_dir, max_reports=None):
+    """
+    汇总所有研报 CSV 中带 PDF 链接的行
+    返回 {stock_code: [doc, ...]}，doc = (stock_code, 行号, 日期, 标题, PDF 链接)
+    """
+    docs = {}
     # 获取所有研报 CSV
     csv_files = [f for f in os.listdir(report_dir) if f.endswith("_reports.csv")]
-    
+
     for csv_file in csv_files:
         stock_code = csv_file.split("_")[0]
-        print(f"正在处理 {stock_code} 的研报全文...")
-        
         df = pd.read_csv(os.path.join(report_dir, csv_file))
-        
-        # 为了演示，每只股票只取最近 10 条有 PDF 链接的研报
-        # 否则下载几百个 PDF 会非常慢
+
         if '报告PDF链接' not in df.columns:
             print(f"  {csv_file} 缺少 PDF 链接列，跳过")
             continue
-            
-        df_target = df.head(10).copy() 
-        
-        results = []
-        
-        for index, row in df_target.iterrows():
-            pdf_url = row['报告PDF链接']
-            title = row['报告名称']
-            date = row['日期']
-            
-            if pd.isna(pdf_url):
-                continue
-                
-            print(f"  分析: {title[:20]}... ({date})")
-            
-            # 1. 提取全文
-            full_text = download_and_analyze_pdf(pdf_url)
-            
-            if not full_text:
-                print("    PDF 下载/解析失败")
-                continue
-                
-            # 2. 截取部分文本进行分析 (模型有长度限制，通常 512 tokens)
-            # 我们取前 400 个字符作为摘要
-            summary_text = full_text[:400]
-            
-            # 3. 情感打分
-            try:
-                result = sentiment_pipeline(summary_text)[0]
-                label = result['label'] # Positive / Negative
-                score = result['score']
-                
-                # 映射分数: Positive -> 1, Negative -> -1
-                final_score = score if label == 'Positive' else -score
-                
-                results.append({
-                    'date': date,
-                    'title': title,
-                    'sentiment_score': final_score,
-                    'summary': summary_text[:50] + "..."
-                })
-                print(f"    -> Score: {final_score:.4f}")
-                
-            except Exception as e:
-                print(f"    NLP Error: {e}")
-                
-            # 礼貌延时
-            time.sleep(1)
-            
-        # 保存结果
-        if results:
-            df_res = pd.DataFrame(results)
+
+        if max_reports is not None:
+            df = df.head(max_reports)
+
+        df = df.dropna(subset=['报告PDF链接'])
+        docs[stock_code] = [
+            (stock_code, i, date, title, url)
+            for i, (date, title, url) in enumerate(zip(df['日期'], df['报告名称'], df['报告PDF链接']))
+        ]
+        print(f"  {stock_code}: {len(docs[stock_code])} 篇研报待处理")
+
+    return docs
+
+def _job_id(doc):
+    # 每篇研报一个任务: 股票代码 + PDF 链接 (研报 CSV 重新下载后行号会变，链接不变)
+    return f"{doc[0]}:{doc[4]}"
+
+def _leased_docs(jobs, queue_name, n):
+    # 按需从任务队列领取研报 (每次 n 篇)，租约只覆盖流水线中正在处理的文档
+    while True:
+        leased = jobs.lease(queue_name, n)
+        if not leased:
+            return
+        for _, payload in leased:
+            yield tuple(payload)
+
+def _download_stage(doc_iter, doc_lock, limiter, pdf_queue, on_fail):
+    # 多个下载线程共享同一个文档迭代器
+    try:
+        while True:
+            with doc_lock:
+                doc = next(doc_iter, None)
+            if doc is None:
+                break
+            limiter.acquire()
+            content = download_pdf(doc[4])
+            if content:
+                pdf_queue.put((doc, content))
+            else:
+                print(f"    PDF 下载失败: {str(doc[3])[:20]}...")
+                on_fail(doc, "download failed")
+    finally:
+        pdf_queue.put(_DONE)
+
+def _parse_stage(pdf_queue, text_queue, n_downloaders, parse_workers, max_pages):
+    # 把 PDF 分发到进程池解析，同时在途的解析任务数有上限
+    pending = deque()
+    max_pending = parse_workers * 2
+    finished = 0
+
+    def forward(doc, future):
+        try:
+            # 解析进程内的 pdf_parse 计时随结果带回
+            text, snapshot = future.result()
+            merge(snapshot)
+        except Exception as e:
+            print(f"    PDF 解析进程异常: {e}")
+            text = ""
+        text_queue.put((doc, text))
+
+    try:
+        with ProcessPoolExecutor(max_workers=parse_workers) as pool:
+            while finished < n_downloaders:
+                item = pdf_queue.get()
+                if item is _DONE:
+                    finished += 1
+                    continue
+                doc, content = item
+                pending.append((doc, pool.submit(collected, extract_pdf_text, content, max_pages)))
+                while len(pending) >= max_pending:
+                    forward(*pending.popleft())
+            while pending:
+                forward(*pending.popleft())
+    finally:
+        text_queue.put(_DONE)
+
+def _score_summaries(summaries, sentiment_pipeline, cache):
+    # summary 模式: 只取前 SUMMARY_CHARS 个字符，经 HF pipeline 打分 (Top label 概率带符号)
+    cached = cache.get_many(CACHE_MODEL_KEY, SUMMARY_CHARS, summaries)
+    miss_idx = [i for i in range(len(summaries)) if i not in cached]
+
+    scores = dict(cached)
+    if miss_idx:
+        with timer("forward", items=len(miss_idx)):
+            outputs = sentiment_pipeline([summaries[i] for i in miss_idx], batch_size=len(miss_idx),
+                                         truncation=True)
+        miss_scores = []
+        for i, result in zip(miss_idx, outputs):
+            label = result['label'] # Positive / Negative
+            score = result['score']
+            # 映射分数: Positive -> 1, Negative -> -1
+            final_score = score if label == 'Positive' else -score
+            scores[i] = final_score
+            miss_scores.append(final_score)
+        cache.put_many(CACHE_MODEL_KEY, SUMMARY_CHARS, [summaries[i] for i in miss_idx], miss_scores)
+    return [scores[i] for i in range(len(summaries))]
+
+def _score_batch(batch, scorer, jobs, queue_name):
+    texts = [full_text for _, full_text in batch]
+    try:
+        with timer("score_documents", items=len(texts)):
+            scores = scorer(texts)
+    except Exception as e:
+        print(f"    NLP Error: {e}")
+        jobs.fail(queue_name, [_job_id(doc) for doc, _ in batch], e)
+        return
+
+    done = []
+    for (doc, full_text), score in zip(batch, scores):
+        stock_code, row, date, title, _ = doc
+        done.append((_job_id(doc), {
+            'date': date,
+            'title': title,
+            'sentiment_score': score,
+            'summary': full_text[:50] + "..."
+        }))
+        print(f"  {stock_code} {str(title)[:20]}... ({date}) -> Score: {score:.4f}")
+    # 每批提交一次，崩溃时最多重做当前批
+    jobs.complete(queue_name, done)
+
+def process_full_text_sentiment(max_reports=None, download_workers=4, download_rate=2.0,
+                                parse_workers=None, batch_size=16, queue_size=32,
+                                mode="chunked", aggregator="mean", first_k=3, max_pages=None, backend="fp32",
+                                score_workers=1, queue_path=QUEUE_PATH, restart=False):
+    """
+    研报全文情感流水线: 下载 -> 解析 -> 打分
+
+    - 下载: download_workers 个线程，令牌桶限速 download_rate 篇/秒 (替代每篇 sleep 1 秒)
+    - 解析: pdfplumber 为 CPU 密集且持有 GIL，放到 parse_workers 个进程的进程池
+    - 打分: 主线程攒满 batch_size 篇文档后批量过模型
+    阶段之间用容量为 queue_size 的有界队列连接，内存占用不随研报数增长
+    max_reports: 每只股票最多处理的研报数，None 为全部历史
+
+    mode:
+    - "chunked": 提取文本切成重叠的 512 token 窗口，整批窗口一起过模型，
+      再按 aggregator (mean / length_weighted / first_k) 聚合为 P(pos) - P(neg)
+    - "summary": 旧逻辑，只取前 400 个字符
+    max_pages: 每篇研报解析的页数，None 时 chunked 模式解析全文，summary 模式解析前 SUMMARY_PAGES 页
+    backend: chunked 模式的推理后端 fp32 / int8 / onnx
+    score_workers: chunked 模式的打分进程数 (>1 时每批文档按行分片到多个进程)
+
+    每篇研报是任务队列 (job_queue.py) 中的一个任务，每批打分后提交结果:
+    中断 (网络故障 / 坏 PDF / OOM) 后重跑同一命令从上次停下的地方继续，下载或解析失败的研报最多重试 3 次；
+    多个进程 (或共享文件系统的多台机器) 可同时运行，共同消费队列。restart=True 清空队列从头处理
+    """
+    if max_pages is None and mode == "summary":
+        max_pages = SUMMARY_PAGES
+    print("加载 NLP 模型 (Erlangshen-Roberta)...")
+    cache = SentimentCache()
+    if mode == "chunked":
+        # 常驻服务在线时直接复用，否则进程内加载
+        doc_scorer = get_scorer(backend, workers=score_workers)
+        if not doc_scorer.load():
+            return
+
+        def scorer(texts):
+            return doc_scorer.score_documents(texts, max_length=512, aggregator=aggregator, first_k=first_k,
+                                              cache=cache)
+    elif mode == "summary":
+        sentiment_pipeline = pipeline("sentiment-analysis", model=MODEL_NAME)
+
+        def scorer(texts):
+            return _score_summaries([t[:SUMMARY_CHARS] for t in texts], sentiment_pipeline, cache)
+    else:
+        raise ValueError(f"未知的打分模式: {mode}")
+
+    report_dir = "data/alternative/reports"
+    sentiment_dir = "data/alternative/sentiment_fulltext"
+    os.makedirs(sentiment_dir, exist_ok=True)
+
+    docs = collect_report_docs(report_dir, max_reports)
+    jobs = JobQueue(queue_path)
+    # 打分参数不同的结果不能混用，各用一个队列
+    queue_name = f"fulltext:{mode}:{aggregator}:{first_k}:{max_pages}:{backend}"
+    if restart:
+        jobs.reset(queue_name)
+    jobs.enqueue(queue_name, [(_job_id(doc), list(doc)) for stock_docs in docs.values() for doc in stock_docs])
+    print(jobs.summary(queue_name))
+    parse_workers = parse_workers or max(1, (os.cpu_count() or 2) - 1)
+
+    pdf_queue = queue.Queue(maxsize=queue_size)
+    text_queue = queue.Queue(maxsize=queue_size)
+    doc_iter = _leased_docs(jobs, queue_name, download_workers)
+    doc_lock = threading.Lock()
+    limiter = TokenBucket(download_rate, burst=download_workers)
+
+    threads = [
+        threading.Thread(target=_download_stage, daemon=True,
+                         args=(doc_iter, doc_lock, limiter, pdf_queue,
+                               lambda doc, error: jobs.fail(queue_name, [_job_id(doc)], error)))
+        for _ in range(download_workers)
+    ]
+    threads.append(threading.Thread(target=_parse_stage,
+                                    args=(pdf_queue, text_queue, download_workers, parse_workers, max_pages),
+                                    daemon=True))
+    for t in threads:
+        t.start()
+
+    batch = []
+    while True:
+        item = text_queue.get()
+        if item is _DONE:
+            break
+        doc, full_text = item
+        if not full_text:
+            print(f"    PDF 解析失败: {str(doc[3])[:20]}...")
+            jobs.fail(queue_name, [_job_id(doc)], "parse failed")
+            continue
+        batch.append((doc, full_text))
+        if len(batch) >= batch_size:
+            _score_batch(batch, scorer, jobs, queue_name)
+            batch = []
+    if batch:
+        _score_batch(batch, scorer, jobs, queue_name)
+
+    for t in threads:
+        t.join()
+
+    # 保存结果 (含之前各次运行已完成的任务，按原研报顺序)
+    # 多个进程同时运行时，最后结束的进程写出的文件是完整的
+    finished = jobs.results(queue_name)
+    for stock_code, stock_docs in docs.items():
+        records = [finished[_job_id(doc)] for doc in stock_docs if _job_id(doc) in finished]
+        if records:
+            df_res = pd.DataFrame(records)
             save_path = os.path.join(sentiment_dir, f"{stock_code}_fulltext_sentiment.csv")
-            df_res.to_csv(save_path, index=False)
+            tmp_path = save_path + ".tmp"
+            with timer("csv_write", items=len(df_res)):
+                df_res.to_csv(tmp_path, index=False)
+                os.replace(tmp_path, save_path)
+            with timer("parquet_write", items=len(df_res)):
+                write_frame("fulltext_sentiment", stock_code, df_res)
             print(f"  已保存全文情感: {save_path}")
 
+    print(jobs.summary(queue_name))
+    jobs.close()
+    print(cache.summary())
+    cache.close()
+    if mode == "chunked":
+        doc_scorer.close()
+
 if __name__ == "__main__":
-    process_full_text_sentiment()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="研报全文情感 (可中断续跑)")
+    parser.add_argument("--max-reports", type=int, default=None, help="每只股票最多处理的研报数")
+    parser.add_argument("--mode", default="chunked", choices=["chunked", "summary"],
+                        help=f"chunked: 全文切窗口打分；summary: 只取前 {SUMMARY_CHARS} 个字符 (旧逻辑)")
+    parser.add_argument("--aggregator", default="mean", choices=AGGREGATORS, help="chunked 模式窗口分数的聚合方式")
+    parser.add_argument("--first-k", type=int, default=3, help="aggregator=first_k 时取前几个窗口")
+    parser.add_argument("--max-pages", type=int, default=None,
+                        help=f"每篇研报解析的页数 (默认 chunked 全文，summary 前 {SUMMARY_PAGES} 页)")
+    parser.add_argument("--backend", default="fp32", choices=["fp32", "int8", "onnx"])
+    parser.add_argument("--score-workers", type=int, default=1)
+    parser.add_argument("--restart", action="store_true", help="清空任务队列，全部研报重新处理")
+    args = parser.parse_args()
+    with run_metrics("calc_fulltext_sentiment"):
+        process_full_text_sentiment(args.max_reports, mode=args.mode, aggregator=args.aggregator,
+                                    first_k=args.first_k, max_pages=args.max_pages, backend=args.backend,
+                                    score_workers=args.score_workers, restart=args.restart)
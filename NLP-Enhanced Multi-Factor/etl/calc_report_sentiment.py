@@ -1,66 +1,99 @@
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import pandas as pd
 import os
+import argparse
 import glob
-from tqdm import tqdm
+from sentiment_scoring import score_texts
+from sentiment_service import get_scorer
+from sentiment_cache import SentimentCache
+from text_dedup import THRESHOLD, DedupReport, score_collapsed
+from datastore import PartitionWriter, read_csv_chunks
+from instrumentation import run_metrics, timer
 
-# 复用 calc_sentiment.py 中的模型加载逻辑，但改为处理 reports 目录
+# 模型加载与打分复用 sentiment_service.py (常驻服务或进程内)，这里处理 reports 目录
 # 并且针对研报标题进行打分
+# 研报列表按 chunk_size 行分块处理，内存与文件大小无关
 
-def load_sentiment_model():
-    # 依然使用 Erlangshen
-    device = torch.device("cpu")
-    model_name = "IDEA-CCNL/Erlangshen-Roberta-110M-Sentiment"
-    try:
-        tokenizer = AutoTokenizer.from_pretrained(model_name)
-        model = AutoModelForSequenceClassification.from_pretrained(model_name).to(device)
-        return tokenizer, model, device
-    except:
-        return None, None, None
+CHUNK_SIZE = 20000
 
 def calc_score(text, tokenizer, model, device):
     if not tokenizer: return 0.0
-    inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=128).to(device)
-    with torch.no_grad():
-        outputs = model(**inputs)
-        probs = torch.nn.functional.softmax(outputs.logits, dim=-1)
-        # 1: Positive, 0: Negative
-        return probs[0][1].item() - probs[0][0].item()
+    return score_texts([text], tokenizer, model, device, max_length=128, show_progress=False)[0]
 
-def process_report_sentiment():
+def process_report_sentiment(batch_size=64, backend="fp32", dedup_threshold=None, workers=1,
+                             chunk_size=CHUNK_SIZE):
     report_dir = "data/alternative/reports"
     save_dir = "data/alternative/sentiment_reports" # 区分新闻情感
     os.makedirs(save_dir, exist_ok=True)
     
-    tokenizer, model, device = load_sentiment_model()
-    if not tokenizer:
+    scorer = get_scorer(backend, workers=workers)
+    if not scorer.load():
         print("模型加载失败")
         return
 
+    # 持久化缓存: 已打过分的研报标题直接复用
+    cache = SentimentCache()
+    # 同一研报标题只打一次分；近似去重 (--near-dedup) 时同一事件几乎相同的标题每簇只打一次分
+    dedup = DedupReport()
+
     files = glob.glob(os.path.join(report_dir, "*.csv"))
     for file in files:
         stock_code = os.path.basename(file).split('_')[0]
         print(f"正在处理 {stock_code} 研报情感...")
-        
-        df = pd.read_csv(file)
-        if df.empty: continue
-        
-        scores = []
-        # 处理所有研报
-        for index, row in tqdm(df.iterrows(), total=len(df)):
-            # 研报标题通常在 '报告名称' (AKShare default) 或 'title' 列
-            text = str(row.get('报告名称', row.get('title', '')))
-            
-            # 研报标题通常包含 "买入", "增持", "超预期" 等强情感词
-            score = calc_score(text, tokenizer, model, device)
-            scores.append(score)
-            
-        df['sentiment_score'] = scores
-        
+
+        # 研报标题通常在 '报告名称' (AKShare default) 或 'title' 列，每个文件判断一次
+        # 研报标题通常包含 "买入", "增持", "超预期" 等强情感词
+        header = pd.read_csv(file, nrows=0).columns
+        col = next((c for c in ('报告名称', 'title') if c in header), None)
+
+        # 分块读取、打分、追加写出 (处理所有研报)，整个文件完成后替换旧结果
         save_path = os.path.join(save_dir, f"{stock_code}_report_sentiment.csv")
-        df.to_csv(save_path, index=False)
-        print(f"已保存: {save_path}")
+        tmp_path = save_path + ".tmp"
+        parquet = PartitionWriter("report_sentiment", stock_code)
+        rows = 0
+        try:
+            for chunk in read_csv_chunks(file, chunk_size):
+                texts = chunk[col].fillna("").tolist() if col else [""] * len(chunk)
+                with timer("score_texts", items=len(texts)):
+                    scores, stats = score_collapsed(scorer, texts, dedup_threshold, max_length=128,
+                                                    batch_size=batch_size, cache=cache)
+                dedup.add(stats)
+
+                chunk['sentiment_score'] = scores
+                with timer("csv_write", items=len(chunk)):
+                    chunk.to_csv(tmp_path, mode="a" if rows else "w", header=not rows, index=False)
+                with timer("parquet_write", items=len(chunk)):
+                    parquet.write(chunk)
+                rows += len(chunk)
+        except BaseException:
+            parquet.abort()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        if rows == 0:
+            parquet.abort()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            continue
+
+        os.replace(tmp_path, save_path)
+        parquet.close()
+        print(f"已保存: {save_path} ({rows} 条)")
+
+    print(dedup.summary())
+    print(cache.summary())
+    cache.close()
+    scorer.close()
 
 if __name__ == "__main__":
-    process_report_sentiment()
+    parser = argparse.ArgumentParser(description="研报标题情感打分")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--backend", default="fp32", choices=["fp32", "int8", "onnx"])
+    parser.add_argument("--workers", type=int, default=1, help="打分进程数 (>1 时按行分片并行)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="每块读取的行数")
+    parser.add_argument("--near-dedup", type=float, nargs="?", const=THRESHOLD, default=None, metavar="THRESHOLD",
+                        help=f"开启 MinHash 近似去重 (相似度阈值，缺省 {THRESHOLD})；默认只合并完全相同的标题")
+    args = parser.parse_args()
+    with run_metrics("calc_report_sentiment"):
+        process_report_sentiment(args.batch_size, args.backend, dedup_threshold=args.near_dedup,
+                                 workers=args.workers, chunk_size=args.chunk_size)
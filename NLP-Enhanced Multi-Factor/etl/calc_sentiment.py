@@ -1,111 +1,180 @@
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import pandas as pd
 import os
+import argparse
 import glob
-from tqdm import tqdm
+from sentiment_scoring import score_texts
+from sentiment_service import get_scorer
+from sentiment_cache import SentimentCache
+from text_dedup import THRESHOLD, DedupReport, score_collapsed
+from datastore import PartitionWriter, read_csv_chunks
+from job_queue import QUEUE_PATH, JobQueue
+from instrumentation import run_metrics, timer
 
-def load_sentiment_model():
-    """
-    加载中文情感模型
-    使用: IDEA-CCNL/Erlangshen-Roberta-110M-Sentiment
-    """
-    device = torch.device("cpu")
-    print(f"Using device: {device}")
-
-    # 替换为中文模型
-    model_name = "IDEA-CCNL/Erlangshen-Roberta-110M-Sentiment"
-    
-    print(f"正在加载模型 {model_name}...")
-    try:
-        tokenizer = AutoTokenizer.from_pretrained(model_name)
-        model = AutoModelForSequenceClassification.from_pretrained(model_name).to(device)
-        return tokenizer, model, device
-    except Exception as e:
-        print(f"模型加载失败 (可能是网络问题): {e}")
-        return None, None, None
+# 每块读取的新闻行数 (超大新闻档案分块处理，内存与文件大小无关)
+CHUNK_SIZE = 20000
 
 def calc_sentiment(text, tokenizer, model, device):
     if not tokenizer or not model:
         return 0.0
-        
-    inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=512).to(device)
-    with torch.no_grad():
-        outputs = model(**inputs)
-        predictions = torch.nn.functional.softmax(outputs.logits, dim=-1)
-        
-        # Erlangshen-Roberta-110M-Sentiment labels: 
-        # Label 0: Negative
-        # Label 1: Positive
-        # 假设我们用 Positive - Negative 作为分数 (-1 ~ 1)
-        
-        # 注意: 需确认模型输出维度。如果是2分类: [neg, pos]
-        prob_neg = predictions[0][0].item()
-        prob_pos = predictions[0][1].item()
-        
-        score = prob_pos - prob_neg
-        return score
-
-def process_news_data():
+    # 单条打分，批量场景请直接用 score_texts
+    return score_texts([text], tokenizer, model, device, max_length=512, show_progress=False)[0]
+
+def headline_column(df):
+    """
+    新闻标题所在的列: 优先 '新闻标题'，其次 'title'，否则第一个字符串列 (按列判断一次，不逐行检查)
+    """
+    for col in ('新闻标题', 'title'):
+        if col in df.columns:
+            return col
+    for col in df.columns:
+        if pd.api.types.is_string_dtype(df[col]) or df[col].dtype == object:
+            return col
+    return None
+
+def file_job_id(path):
+    """
+    文件任务的 id: 路径 + 修改时间 + 大小，文件重新下载后视为新任务
+    """
+    stat = os.stat(path)
+    return f"{path}:{stat.st_mtime_ns}:{stat.st_size}"
+
+def leased_files(jobs, queue_name):
+    """
+    逐个领取文件任务，返回 (job_id, 文件路径)，队列为空时结束
+    """
+    while True:
+        leased = jobs.lease(queue_name, 1)
+        if not leased:
+            return
+        job_id, payload = leased[0]
+        yield job_id, payload["file"]
+
+def headline_texts(df, col):
+    """
+    一块新闻的标题文本 (列已事先确定)，空标题记为 "无内容"
+    """
+    if col is None or col not in df.columns:
+        return ["无内容"] * len(df)
+    texts = df[col].fillna("").astype(str)
+    return texts.where(~texts.isin(["", "nan"]), "无内容").tolist()
+
+def process_news_data(batch_size=32, backend="fp32", dedup_threshold=None, workers=1,
+                      queue_path=QUEUE_PATH, restart=False, chunk_size=CHUNK_SIZE, scorer=None):
     news_dir = "data/alternative/news"
     save_dir = "data/alternative/sentiment"
     os.makedirs(save_dir, exist_ok=True)
     
-    # 1. 加载模型
-    tokenizer, model, device = load_sentiment_model()
-    
-    # 2. 遍历新闻文件
+    # 1. 遍历新闻文件 (没有文件时不加载模型)
     files = glob.glob(os.path.join(news_dir, "*.csv"))
     
     if not files:
         print("未找到新闻数据，请先运行 download_news.py")
         return
 
-    for file in files:
+    # 2. 加载模型 (常驻服务在线时直接复用，否则进程内加载；workers > 1 时多进程分片打分)
+    # 也可传入已加载的 scorer (基准测试)，由调用方负责关闭
+    own_scorer = scorer is None
+    if own_scorer:
+        scorer = get_scorer(backend, workers=workers)
+    has_model = scorer.load()
+
+    # 持久化缓存: 已打过分的标题直接复用
+    cache = SentimentCache()
+    # 同一块内的转载标题只打一次分: 默认 (dedup_threshold=None) 只合并归一化后完全相同的标题，
+    # 传入 threshold (--near-dedup) 时再合并近似改写 (极性词不同的不合并)
+    # 跨块的完全相同标题由持久化缓存命中
+    dedup = DedupReport()
+
+    # 每个新闻文件一个任务: 中断后重跑只处理未完成的文件，多个进程可同时运行本脚本分担文件
+    # (没有模型时的随机分数不记入队列)
+    jobs = None
+    if has_model:
+        jobs = JobQueue(queue_path)
+        # 打分参数不同的结果不能混用 (如加上 --near-dedup 重跑)，各用一个队列
+        queue_name = f"news:{backend}:{dedup_threshold}"
+        if restart:
+            jobs.reset(queue_name)
+        jobs.enqueue(queue_name, [(file_job_id(f), {"file": f}) for f in files])
+        print(jobs.summary(queue_name))
+        pending = leased_files(jobs, queue_name)
+    else:
+        pending = ((None, f) for f in files)
+
+    for job_id, file in pending:
         stock_code = os.path.basename(file).split('_')[0]
         print(f"正在处理 {stock_code} 的新闻情感...")
-        
-        df = pd.read_csv(file)
-        if df.empty: continue
-        
-        # 3. 计算情感分 (计算所有行)
-        scores = []
-        # 为了演示速度，这里限制处理前 50 条，如果需要全部，去掉 .head(50)
-        process_df = df # df.head(50) 
-        
-        for index, row in tqdm(process_df.iterrows(), total=len(process_df)):
-            # 优先使用 '新闻标题'，其次 '新闻内容' (AKShare 列名可能是 'title', 'content' 或其他)
-            # 检查列名
-            text = ""
-            if '新闻标题' in row:
-                text = str(row['新闻标题'])
-            elif 'title' in row:
-                text = str(row['title'])
-            else:
-                # 尝试找第一列字符串
-                for col in row.index:
-                    if isinstance(row[col], str):
-                        text = row[col]
-                        break
-            
-            if not text or text == "nan":
-                text = "无内容"
-            
-            if tokenizer:
-                score = calc_sentiment(text, tokenizer, model, device)
-            else:
-                import random
-                score = random.uniform(-1, 1) # Mock data
-            
-            scores.append(score)
-            
-        # 4. 保存结果
-        result_df = process_df.copy()
-        result_df['sentiment_score'] = scores
-        
+
+        # 标题列每个文件判断一次 (优先 '新闻标题'，其次 'title'，否则第一个字符串列)，按推断类型的前几行判断
+        col = headline_column(pd.read_csv(file, nrows=100))
+
+        # 3. 分块读取、打分、追加写出: 内存只与 chunk_size 有关，与文件大小无关
+        # 先写临时文件，整个文件处理完后替换，中途失败不会留下半个结果
         save_path = os.path.join(save_dir, f"{stock_code}_sentiment.csv")
-        result_df.to_csv(save_path, index=False)
-        print(f"已保存: {save_path}")
+        tmp_path = save_path + ".tmp"
+        parquet = PartitionWriter("news_sentiment", stock_code)
+        rows = 0
+        try:
+            for chunk in read_csv_chunks(file, chunk_size):
+                texts = headline_texts(chunk, col)
+                if has_model:
+                    # 批量推理，返回顺序与 texts 一致
+                    with timer("score_texts", items=len(texts)):
+                        scores, stats = score_collapsed(scorer, texts, dedup_threshold, max_length=512,
+                                                        batch_size=batch_size, cache=cache)
+                    dedup.add(stats)
+                else:
+                    import random
+                    scores = [random.uniform(-1, 1) for _ in texts] # Mock data
+
+                # 4. 保存结果
+                chunk['sentiment_score'] = scores
+                with timer("csv_write", items=len(chunk)):
+                    chunk.to_csv(tmp_path, mode="a" if rows else "w", header=not rows, index=False)
+                with timer("parquet_write", items=len(chunk)):
+                    parquet.write(chunk)
+                rows += len(chunk)
+                if jobs is not None:
+                    # 大文件处理时间可能超过租约，每块续租
+                    jobs.extend(queue_name, [job_id])
+        except BaseException:
+            parquet.abort()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        if rows == 0:
+            parquet.abort()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if jobs is not None:
+                jobs.complete(queue_name, [(job_id, {"rows": 0})])
+            continue
+
+        os.replace(tmp_path, save_path)
+        parquet.close()
+        print(f"已保存: {save_path} ({rows} 条)")
+        if jobs is not None:
+            jobs.complete(queue_name, [(job_id, {"rows": rows, "path": save_path})])
+
+    print(dedup.summary())
+    print(cache.summary())
+    if jobs is not None:
+        print(jobs.summary(queue_name))
+        jobs.close()
+    cache.close()
+    if own_scorer:
+        scorer.close()
 
 if __name__ == "__main__":
-    process_news_data()
+    parser = argparse.ArgumentParser(description="新闻标题情感打分")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--backend", default="fp32", choices=["fp32", "int8", "onnx"])
+    parser.add_argument("--workers", type=int, default=1, help="打分进程数 (>1 时按行分片并行)")
+    parser.add_argument("--restart", action="store_true", help="清空任务队列，全部文件重新处理")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="每块读取的行数")
+    parser.add_argument("--near-dedup", type=float, nargs="?", const=THRESHOLD, default=None, metavar="THRESHOLD",
+                        help=f"开启 MinHash 近似去重 (相似度阈值，缺省 {THRESHOLD})；默认只合并完全相同的标题")
+    args = parser.parse_args()
+    with run_metrics("calc_sentiment"):
+        process_news_data(args.batch_size, args.backend, dedup_threshold=args.near_dedup, workers=args.workers,
+                          restart=args.restart, chunk_size=args.chunk_size)
@@ -0,0 +1,337 @@
+import os
+import glob
+import shutil
+import time
+import pandas as pd
+
+# 列式数据仓库 (Parquet)，替代 data/ 下逐文件解析的 CSV
+# 目录布局: data/store/{dataset}/symbol={代码}/part-0.parquet  (hive 分区，按数据集 + 股票)
+#           增量追加 (append_frame) 写入同目录下的 part-{时间戳}.parquet，分片过多时合并回 part-0
+#           分块覆盖写入 (PartitionWriter) 每块一个分片，写完后整体替换原分区
+# - 列类型在写入时固定 (date 为 datetime64)，读取时不再需要 pd.to_datetime
+# - 读取支持列裁剪 (columns) 与日期区间谓词下推 (start / end)
+# - 未安装 pyarrow 或某只股票尚未入库时，回退读取原 CSV
+#
+# ETL 脚本与 etl/ 下其他模块平级导入: from datastore import ...
+# 项目根目录的回测脚本: from etl.datastore import ...
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+STORE_ROOT = "data/store"
+
+# dataset -> 原 CSV 路径模板 / 原日期列 (按优先级)
+DATASETS = {
+    "equity_daily": {
+        "csv": "data/equity/daily/{symbol}.csv",
+        "date_cols": ["date", "日期"],
+    },
+    "news_sentiment": {
+        "csv": "data/alternative/sentiment/{symbol}_sentiment.csv",
+        "date_cols": ["发布时间", "date", "日期"],
+    },
+    # 实时新闻 (etl/news_stream.py 追加写入)，与批量打分的 news_sentiment 分开存放，
+    # calc_sentiment.py 重跑时整体替换 news_sentiment 不会丢失实时数据
+    "news_stream_sentiment": {
+        "csv": "data/alternative/sentiment_stream/{symbol}_sentiment.csv",
+        "date_cols": ["发布时间", "date", "日期"],
+    },
+    "report_sentiment": {
+        "csv": "data/alternative/sentiment_reports/{symbol}_report_sentiment.csv",
+        "date_cols": ["日期", "date", "发布时间"],
+    },
+    "fulltext_sentiment": {
+        "csv": "data/alternative/sentiment_fulltext/{symbol}_fulltext_sentiment.csv",
+        "date_cols": ["date", "日期", "发布时间"],
+    },
+    # 对齐到交易日的情感因子 (etl/align_sentiment.py 生成)，每个来源一列分数 + 一列事件数
+    "sentiment_factor": {
+        "csv": "data/alternative/sentiment_factor/{symbol}_sentiment_factor.csv",
+        "date_cols": ["date"],
+        "dtypes": {"report": "float64", "report_count": "int64",
+                   "fulltext": "float64", "fulltext_count": "int64",
+                   "news": "float64", "news_count": "int64"},
+    },
+}
+
+# 行情列统一为小写 (date, open, high, low, close, volume)
+PRICE_DTYPES = {"open": "float64", "high": "float64", "low": "float64", "close": "float64", "volume": "float64"}
+
+
+def _partition_dir(dataset, symbol, root=STORE_ROOT):
+    return os.path.join(root, dataset, f"symbol={symbol}")
+
+
+def _part_files(part_dir):
+    return sorted(glob.glob(os.path.join(part_dir, "part-*.parquet")))
+
+
+def _normalize(dataset, df):
+    """
+    统一列与类型:
+    - 行情: 列名小写，OHLCV 为 float64
+    - 情感: 保留原始列，新增/覆盖规范的 date 列 (按日归一)，sentiment_score 为 float64
+    - 数据集声明了 dtypes 的列按声明的数值类型存储
+    - 其余原始列一律存为 string，保证各股票分区的 schema 一致 (全空列/代码前导零不受影响)
+    """
+    df = df.copy()
+    if dataset == "equity_daily":
+        df.columns = df.columns.str.lower()
+    date_col = next((c for c in DATASETS[dataset]["date_cols"] if c in df.columns), None)
+    if date_col is None:
+        raise ValueError(f"{dataset}: 找不到日期列 {DATASETS[dataset]['date_cols']}")
+    # 情感的发布时间可能混有秒级与亚秒级 (实时流)，逐条解析，避免按首行推断的格式把其余行置为 NaT
+    fmt = None if dataset == "equity_daily" else "mixed"
+    df["date"] = pd.to_datetime(df[date_col], errors="coerce", format=fmt).dt.normalize()
+    if date_col != "date" and dataset == "equity_daily":
+        df = df.drop(columns=[date_col])
+    df = df.dropna(subset=["date"])
+
+    dtypes = DATASETS[dataset].get("dtypes", {})
+    for col in df.columns:
+        if col == "date":
+            continue
+        if dataset == "equity_daily" and col in PRICE_DTYPES:
+            df[col] = df[col].astype(PRICE_DTYPES[col])
+        elif col in dtypes:
+            values = pd.to_numeric(df[col], errors="coerce")
+            df[col] = values.fillna(0).astype(dtypes[col]) if dtypes[col] == "int64" else values.astype(dtypes[col])
+        elif col == "sentiment_score":
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+        else:
+            df[col] = df[col].astype("string")
+
+    return df.sort_values("date", kind="stable").reset_index(drop=True)
+
+
+def _read_csv(dataset, path):
+    # 原始列按字符串读取，避免股票代码等被解析成整数
+    if dataset == "equity_daily" or "dtypes" in DATASETS[dataset]:
+        return pd.read_csv(path)
+    return pd.read_csv(path, dtype=str)
+
+
+def read_csv_chunks(path, chunk_size=None):
+    """
+    分块读取原始 CSV，每块最多 chunk_size 行 (None 时整个文件作为一块)
+    列一律按字符串读取: 各块的类型一致 (不随块内是否有空值而变)，股票代码保留前导零
+    """
+    if chunk_size is None:
+        yield pd.read_csv(path, dtype=str)
+        return
+    with pd.read_csv(path, dtype=str, chunksize=chunk_size) as reader:
+        yield from reader
+
+
+def write_frame(dataset, symbol, df, root=STORE_ROOT):
+    """
+    写入 (覆盖) 一只股票的分区。未安装 pyarrow 时跳过 (仍可回退读取 CSV)
+    """
+    if not HAS_ARROW:
+        return None
+    df = _normalize(dataset, df)
+    part_dir = _partition_dir(dataset, symbol, root)
+    os.makedirs(part_dir, exist_ok=True)
+    path = os.path.join(part_dir, "part-0.parquet")
+    # 临时文件以 . 开头，写入过程中并发的数据集扫描会忽略它
+    tmp_path = os.path.join(part_dir, ".part-0.parquet.tmp")
+    # 按日期排序写入，行组统计信息可用于日期区间过滤
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path, row_group_size=65536)
+    os.replace(tmp_path, path)
+    # 覆盖写入: 之前追加的分片一并删除
+    for part in _part_files(part_dir):
+        if part != path:
+            os.remove(part)
+    return path
+
+
+def append_frame(dataset, symbol, df, root=STORE_ROOT, max_parts=32):
+    """
+    追加新行 (流式写入): 写一个新的分片，不重写已有数据；分片数超过 max_parts 时合并为一个
+    """
+    if not HAS_ARROW or df.empty:
+        return None
+    df = _normalize(dataset, df)
+    part_dir = _partition_dir(dataset, symbol, root)
+    os.makedirs(part_dir, exist_ok=True)
+    name = f"part-{time.time_ns()}.parquet"
+    path = os.path.join(part_dir, name)
+    tmp_path = os.path.join(part_dir, f".{name}.tmp")
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+    os.replace(tmp_path, path)
+    if len(_part_files(part_dir)) > max_parts:
+        write_frame(dataset, symbol, load_frame(dataset, symbol, root=root), root=root)
+    return path
+
+
+class PartitionWriter:
+    """
+    分块覆盖写入一只股票的分区 (超大文件流式处理，内存只与块大小有关):
+        writer = PartitionWriter("news_sentiment", code)
+        for chunk in ...:
+            writer.write(chunk)
+        writer.close()
+    每块按日期排序后写为一个分片 (多分片读取时 load_frame / load_panel 会整体按日期排序)；
+    分片先写到以 . 开头的暂存目录 (数据集扫描会忽略)，close() 时替换原分区，中途失败原分区不受影响
+    """
+
+    def __init__(self, dataset, symbol, root=STORE_ROOT):
+        self.dataset = dataset
+        self.part_dir = _partition_dir(dataset, symbol, root)
+        self.stage_dir = os.path.join(root, dataset, f".symbol={symbol}.tmp")
+        self.parts = 0
+        if HAS_ARROW:
+            shutil.rmtree(self.stage_dir, ignore_errors=True)
+            os.makedirs(self.stage_dir)
+
+    def write(self, df):
+        if not HAS_ARROW or df.empty:
+            return
+        df = _normalize(self.dataset, df)
+        path = os.path.join(self.stage_dir, f"part-{self.parts}.parquet")
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path, row_group_size=65536)
+        self.parts += 1
+
+    def close(self):
+        if not HAS_ARROW:
+            return None
+        old_dir = self.stage_dir[:-len(".tmp")] + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.isdir(self.part_dir):
+            os.replace(self.part_dir, old_dir)
+        os.replace(self.stage_dir, self.part_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return self.part_dir
+
+    def abort(self):
+        shutil.rmtree(self.stage_dir, ignore_errors=True)
+
+
+def _filter_dates(df, start, end):
+    if start is not None:
+        df = df[df["date"] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df["date"] <= pd.Timestamp(end)]
+    return df
+
+
+def _date_filter_expr(start, end):
+    expr = None
+    if start is not None:
+        expr = ds.field("date") >= pa.scalar(pd.Timestamp(start), type=pa.timestamp("ns"))
+    if end is not None:
+        cond = ds.field("date") <= pa.scalar(pd.Timestamp(end), type=pa.timestamp("ns"))
+        expr = cond if expr is None else expr & cond
+    return expr
+
+
+def load_frame(dataset, symbol, columns=None, start=None, end=None, root=STORE_ROOT):
+    """
+    读取一只股票的数据，返回按 date 排序的 DataFrame (date 为 datetime64 列)
+    不存在时返回 None
+    columns: 只读取这些列 (date 总会包含)
+    start / end: 日期闭区间
+    """
+    if columns is not None and "date" not in columns:
+        columns = ["date"] + list(columns)
+
+    parts = _part_files(_partition_dir(dataset, symbol, root))
+    if HAS_ARROW and parts:
+        table = ds.dataset(parts, format="parquet").to_table(columns=columns, filter=_date_filter_expr(start, end))
+        df = table.to_pandas()
+        if len(parts) > 1:
+            df = df.sort_values("date", kind="stable").reset_index(drop=True)
+        return df
+
+    # 回退: 原 CSV
+    csv_path = DATASETS[dataset]["csv"].format(symbol=symbol)
+    if not os.path.exists(csv_path):
+        return None
+    df = _normalize(dataset, _read_csv(dataset, csv_path))
+    df = _filter_dates(df, start, end)
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    return df.reset_index(drop=True)
+
+
+def list_symbols(dataset, root=STORE_ROOT):
+    symbols = set()
+    for part_dir in glob.glob(os.path.join(root, dataset, "symbol=*")):
+        symbols.add(os.path.basename(part_dir).split("=", 1)[1])
+    if not symbols:
+        # 回退: 从原 CSV 文件名推断
+        pattern = DATASETS[dataset]["csv"]
+        prefix, suffix = pattern.split("{symbol}")
+        for path in glob.glob(prefix + "*" + suffix):
+            symbols.add(path[len(prefix):len(path) - len(suffix)])
+    return sorted(symbols)
+
+
+def load_panel(dataset, symbols=None, columns=None, start=None, end=None, root=STORE_ROOT):
+    """
+    一次读取多只股票，返回长表 (symbol, date, ...)
+    Parquet 仓库下整个数据集作为一个 Arrow dataset 扫描，列裁剪与 symbol/日期过滤均下推到扫描层；
+    指定的股票中尚未写入 Parquet 分区的，与 load_frame 一样回退读取原 CSV
+    """
+    if columns is not None:
+        columns = ["symbol", "date"] + [c for c in columns if c not in ("symbol", "date")]
+
+    dataset_dir = os.path.join(root, dataset)
+    if HAS_ARROW and os.path.isdir(dataset_dir):
+        partitioning = ds.partitioning(pa.schema([("symbol", pa.string())]), flavor="hive")
+        dataset_obj = ds.dataset(dataset_dir, format="parquet", partitioning=partitioning)
+        expr = _date_filter_expr(start, end)
+        csv_only = []
+        if symbols is not None:
+            symbols = list(symbols)
+            cond = ds.field("symbol").isin(symbols)
+            expr = cond if expr is None else expr & cond
+            csv_only = [s for s in symbols if not _part_files(_partition_dir(dataset, s, root))]
+        df = dataset_obj.to_table(columns=columns, filter=expr).to_pandas()
+        frames = _load_each(dataset, csv_only, columns, start, end, root)
+        if frames:
+            df = pd.concat([df] + frames, ignore_index=True) if len(df) else pd.concat(frames, ignore_index=True)
+        return df.sort_values(["symbol", "date"], kind="stable").reset_index(drop=True)
+
+    frames = _load_each(dataset, symbols if symbols is not None else list_symbols(dataset, root),
+                        columns, start, end, root)
+    if not frames:
+        return pd.DataFrame(columns=columns or ["symbol", "date"])
+    df = pd.concat(frames, ignore_index=True)
+    return df[["symbol"] + [c for c in df.columns if c != "symbol"]]
+
+
+def _load_each(dataset, symbols, columns, start, end, root):
+    # 逐只股票 load_frame (Parquet 分区或原 CSV)，加上 symbol 列
+    frames = []
+    for symbol in symbols:
+        df = load_frame(dataset, symbol, columns=None if columns is None else columns[1:],
+                        start=start, end=end, root=root)
+        if df is not None:
+            frames.append(df.assign(symbol=symbol))
+    return frames
+
+
+def migrate_csv(dataset, root=STORE_ROOT):
+    """
+    把某个数据集的原 CSV 全部导入 Parquet 仓库
+    """
+    count = 0
+    for symbol in list_symbols(dataset, root="__csv_only__"):
+        csv_path = DATASETS[dataset]["csv"].format(symbol=symbol)
+        write_frame(dataset, symbol, _read_csv(dataset, csv_path), root=root)
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    if not HAS_ARROW:
+        print("未安装 pyarrow: pip install pyarrow")
+    else:
+        for name in DATASETS:
+            print(f"{name}: 导入 {migrate_csv(name)} 只股票")
@@ -1,66 +1,176 @@
-import akshare as ak
 import pandas as pd
 import os
+import json
 from datetime import datetime, timedelta
-import time
+from fetch_engine import DEFAULT_STOCKS, FetchEngine, print_report, read_stock_list
+from datastore import write_frame
+from instrumentation import run_metrics, timer
 
-def download_market_data(symbol="000300", period="365"):
+# 每只股票最后一根已落盘 K 线的日期 (水位线)，增量模式只拉取水位线之后的数据
+WATERMARK_PATH = "data/equity/watermarks.json"
+
+PRICE_COLUMNS = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+
+def fetch_akshare_daily(stock, start_date, end_date):
+    """
+    默认数据源: AKShare 前复权日线
+    数据源签名: source(stock, start_date, end_date) -> DataFrame[Date, Open, High, Low, Close, Volume]
+    start_date / end_date 格式 YYYYMMDD，测试时可替换为本地桩函数
+    """
+    import akshare as ak
+
+    # 使用 stock_zh_a_hist 接口
+    with timer("akshare", endpoint="stock_zh_a_hist"):
+        df = ak.stock_zh_a_hist(symbol=stock, start_date=start_date, end_date=end_date, adjust="qfq")
+    if df.empty:
+        return pd.DataFrame(columns=PRICE_COLUMNS)
+
+    # 重命名列以符合 Lean 习惯 (Date, Open, High, Low, Close, Volume)
+    # AKShare 返回: 日期, 开盘, 收盘, 最高, 最低, 成交量, ...
+    df = df.rename(columns={
+        '日期': 'Date',
+        '开盘': 'Open',
+        '最高': 'High',
+        '最低': 'Low',
+        '收盘': 'Close',
+        '成交量': 'Volume'
+    })
+    return df
+
+def load_watermarks(path=WATERMARK_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_watermarks(watermarks, path=WATERMARK_PATH):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(watermarks, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def _normalize_bars(df):
+    # 只保留需要的列，日期统一为 YYYY-MM-DD 字符串，便于与已有 CSV 比较/追加
+    df = df[PRICE_COLUMNS].copy()
+    df['Date'] = pd.to_datetime(df['Date']).dt.strftime('%Y-%m-%d')
+    return df.sort_values('Date').drop_duplicates('Date', keep='last').reset_index(drop=True)
+
+def adjustment_changed(df_old, df_new, tolerance=1e-4):
+    """
+    比较重叠窗口内的收盘价，判断前复权因子是否变化 (除权除息后历史价格会整体平移)
+    无重叠日期时无法判断，按已变化处理
+    """
+    merged = df_old[['Date', 'Close']].merge(df_new[['Date', 'Close']], on='Date', suffixes=('_old', '_new'))
+    if merged.empty:
+        return True
+    rel_diff = ((merged['Close_new'] - merged['Close_old']).abs() / merged['Close_old'].abs()).max()
+    return bool(rel_diff > tolerance)
+
+def update_symbol(stock, source, save_dir, watermarks, start_date, end_date,
+                  incremental=True, overlap_days=10):
+    """
+    下载/更新单只股票日线，返回本次动作: full / append / uptodate / empty
+    """
+    file_path = os.path.join(save_dir, f"{stock}.csv")
+    last_date = watermarks.get(stock)
+
+    if incremental and last_date and os.path.exists(file_path):
+        # 从水位线往前多取一段作为重叠窗口，用于检测复权因子变化
+        overlap_start = (datetime.strptime(last_date, "%Y-%m-%d") - timedelta(days=overlap_days)).strftime("%Y%m%d")
+        df_new = source(stock, overlap_start, end_date)
+        if not df_new.empty:
+            df_new = _normalize_bars(df_new)
+            df_old = pd.read_csv(file_path, dtype={'Date': str})
+            overlap_old = df_old[df_old['Date'] >= df_new['Date'].iloc[0]]
+
+            if not adjustment_changed(overlap_old, df_new[df_new['Date'] <= last_date]):
+                # 按 CSV 实际的最后日期截取新增行: 上次追加 CSV 后、写 Parquet / 水位线之前中断时，
+                # 重试不会重复追加，只补齐 Parquet 与水位线
+                csv_last = max(last_date, df_old['Date'].max()) if not df_old.empty else last_date
+                df_append = df_new[df_new['Date'] > csv_last]
+                if df_append.empty and csv_last == last_date:
+                    return "uptodate"
+                if not df_append.empty:
+                    with timer("csv_write", items=len(df_append)):
+                        df_append.to_csv(file_path, mode='a', header=False, index=False)
+                df_all = pd.concat([df_old, df_append], ignore_index=True)
+                write_frame("equity_daily", stock, df_all)
+                watermarks[stock] = df_all['Date'].iloc[-1]
+                return "append"
+
+            print(f"  {stock} 复权因子变化，重新全量下载")
+        else:
+            return "uptodate"
+
+    df = source(stock, start_date, end_date)
+    if df.empty:
+        return "empty"
+
+    df = _normalize_bars(df)
+
+    # 保存为 CSV
+    with timer("csv_write", items=len(df)):
+        df.to_csv(file_path, index=False)
+    write_frame("equity_daily", stock, df)
+    watermarks[stock] = df['Date'].iloc[-1]
+    return "full"
+
+def download_market_data(symbol="000300", period="365", incremental=True, source=fetch_akshare_daily,
+                         stocks=None, save_dir="data/equity/daily", watermark_path=WATERMARK_PATH,
+                         max_workers=8, rate=4.0):
     """
     下载沪深300成分股的日线数据
+
+    incremental: 按水位线只拉取新增 K 线并追加，复权因子变化时自动全量重拉
+    source: 数据源函数，默认 AKShare，可替换为本地桩
+    stocks: 目标股票代码列表，默认 DEFAULT_STOCKS
+    max_workers / rate: 并发线程数 / 接口限速 (次/秒)
     """
     print(f"正在获取 {symbol} 成分股列表...")
-    
-    # 1. 设置目标股票池 (用户指定)
-    # 金风科技, 明阳智能, 铜陵有色, 云南铜业, 吉电股份, 振华股份
-    stocks = ['002202', '601615', '000630', '000878', '000875', '603067']
+
+    # 1. 设置目标股票池
+    if stocks is None:
+        stocks = DEFAULT_STOCKS
     print(f"目标股票列表: {stocks}")
 
     # 创建保存目录
-    save_dir = "data/equity/daily"
     os.makedirs(save_dir, exist_ok=True)
+    # 总是读入已有水位线: 非增量模式 (update_symbol 不使用水位线) 或只更新部分股票时，
+    # 只覆盖本次下载到的股票，其余股票的水位线保持不变
+    watermarks = load_watermarks(watermark_path)
 
     # 2. 循环下载日线数据
     # 为了回测能覆盖研报历史，我们下载过去3年的数据 (365*3 = 1095)
     # 如果 AKShare 接口受限，可能不会返回这么久，但尽量请求
-    target_days = 365 * 3 
+    target_days = 365 * 3
     start_date = (datetime.now() - timedelta(days=target_days)).strftime("%Y%m%d")
     end_date = datetime.now().strftime("%Y%m%d")
     print(f"请求数据时间跨度: {start_date} - {end_date}")
 
-    for stock in stocks: 
-        print(f"正在下载 {stock} ...")
-        try:
-            # 使用 stock_zh_a_hist 接口
-            df = ak.stock_zh_a_hist(symbol=stock, start_date=start_date, end_date=end_date, adjust="qfq")
-            
-            if df.empty:
-                print(f"{stock} 数据为空，跳过")
-                continue
-
-            # 重命名列以符合 Lean 习惯 (Date, Open, High, Low, Close, Volume)
-            # AKShare 返回: 日期, 开盘, 收盘, 最高, 最低, 成交量, ...
-            df = df.rename(columns={
-                '日期': 'Date',
-                '开盘': 'Open',
-                '最高': 'High',
-                '最低': 'Low',
-                '收盘': 'Close',
-                '成交量': 'Volume'
-            })
-            
-            # 只保留需要的列
-            df = df[['Date', 'Open', 'High', 'Low', 'Close', 'Volume']]
-            
-            # 保存为 CSV
-            file_path = os.path.join(save_dir, f"{stock}.csv")
-            df.to_csv(file_path, index=False)
-            print(f"已保存: {file_path}")
-            
-            # 礼貌性延时
-            time.sleep(0.5)
-            
-        except Exception as e:
-            print(f"下载 {stock} 失败: {e}")
+    # 并发下载，按接口限速，失败自动重试
+    engine = FetchEngine(max_workers=max_workers)
+    engine.add_endpoint("stock_zh_a_hist", rate=rate, burst=max_workers)
+    # 增量模式下单只股票可能调用两次数据源，限速放在数据源调用上
+    limited_source = engine.limited("stock_zh_a_hist", source)
+
+    def fetch_one(stock):
+        action = update_symbol(stock, limited_source, save_dir, watermarks, start_date, end_date,
+                               incremental=incremental)
+        print(f"{stock}: {action}")
+        return action
+
+    results = engine.run(stocks, None, fetch_one)
+    print_report(results, title="日线下载")
+
+    save_watermarks(watermarks, watermark_path)
 
 if __name__ == "__main__":
-    download_market_data()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="下载日线数据 (按水位线增量更新)")
+    parser.add_argument("--stocks", default=None, help="股票列表文件 (每行一个代码)，默认内置的股票池")
+    args = parser.parse_args()
+    with run_metrics("download_market"):
+        download_market_data(stocks=read_stock_list(args.stocks) if args.stocks else None)
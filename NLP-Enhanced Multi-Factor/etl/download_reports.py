@@ -1,47 +1,58 @@
 import akshare as ak
 import pandas as pd
 import os
-import time
+from fetch_engine import DEFAULT_STOCKS, FetchEngine, print_report, read_stock_list
+from instrumentation import run_metrics, timer
 
-def download_report_data():
+def download_report_data(max_workers=4, rate=1.0, stocks=None):
     """
     下载个股研报和公告数据 (替代新闻，以获取更长历史)
     使用接口: 
     1. stock_research_report_em (东方财富-个股研报)
     2. stock_notice_report (东方财富-个股公告)
+    max_workers / rate: 并发线程数 / 接口限速 (次/秒)
+    stocks: 目标股票代码列表，默认 DEFAULT_STOCKS
     """
     report_save_dir = "data/alternative/reports"
     notice_save_dir = "data/alternative/notices"
     os.makedirs(report_save_dir, exist_ok=True)
     os.makedirs(notice_save_dir, exist_ok=True)
     
-    # 目标股票
-    # 金风科技, 明阳智能, 铜陵有色, 云南铜业, 吉电股份, 振华股份
-    stocks = ['002202', '601615', '000630', '000878', '000875', '603067']
+    if stocks is None:
+        stocks = DEFAULT_STOCKS
     
-    for stock in stocks:
+    def fetch_one(stock):
         # 1. 下载研报
         print(f"正在获取 {stock} 研报数据...")
-        try:
+        with timer("akshare", endpoint="stock_research_report_em"):
             df_report = ak.stock_research_report_em(symbol=stock)
-            if not df_report.empty:
-                # 简单清洗
-                if '日期' in df_report.columns:
-                    df_report['日期'] = pd.to_datetime(df_report['日期']).dt.strftime('%Y-%m-%d')
-                
-                report_path = os.path.join(report_save_dir, f"{stock}_reports.csv")
+        if not df_report.empty:
+            # 简单清洗
+            if '日期' in df_report.columns:
+                df_report['日期'] = pd.to_datetime(df_report['日期']).dt.strftime('%Y-%m-%d')
+            
+            report_path = os.path.join(report_save_dir, f"{stock}_reports.csv")
+            with timer("csv_write", items=len(df_report)):
                 df_report.to_csv(report_path, index=False)
-                print(f"已保存研报: {report_path} (共 {len(df_report)} 条)")
-            else:
-                print(f"{stock} 研报为空")
-        except Exception as e:
-            print(f"获取 {stock} 研报失败: {e}")
+            print(f"已保存研报: {report_path} (共 {len(df_report)} 条)")
+        else:
+            print(f"{stock} 研报为空")
             
         # 2. 公告接口暂时不稳定，跳过
         # df_notice = ak.stock_notice_report(symbol=stock)
+        return len(df_report)
 
-        # 礼貌性延时
-        time.sleep(2)
+    # 并发抓取，按接口限速 (原先每只股票固定 sleep 2 秒)，失败自动重试
+    engine = FetchEngine(max_workers=max_workers)
+    engine.add_endpoint("stock_research_report_em", rate=rate, burst=max_workers)
+    results = engine.run(stocks, "stock_research_report_em", fetch_one)
+    print_report(results, title="研报下载")
 
 if __name__ == "__main__":
-    download_report_data()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="下载个股研报")
+    parser.add_argument("--stocks", default=None, help="股票列表文件 (每行一个代码)，默认内置的股票池")
+    args = parser.parse_args()
+    with run_metrics("download_reports"):
+        download_report_data(stocks=read_stock_list(args.stocks) if args.stocks else None)
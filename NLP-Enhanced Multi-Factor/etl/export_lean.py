@@ -0,0 +1,78 @@
+import os
+import json
+import argparse
+import numpy as np
+from datastore import list_symbols, load_frame
+from align_sentiment import FACTOR_SOURCES
+from instrumentation import run_metrics, timer
+
+# 导出 LEAN 自定义数据文件: 每只股票、每个情感来源一个紧凑的 date,score 文件
+# - 读取已对齐到交易日、按日合并好的情感因子 (etl/align_sentiment.py)，只写有消息的交易日
+# - 每行 "yyyyMMdd,score"，按日期升序，无表头 / 无引号 / 无多余列，
+#   LEAN 的 ReportSentiment.Reader 只需按固定位置切片，不再对整行研报字段做 split 猜列
+# - 路径相对 lean.json 的 data-folder (FileSystemDataFeed 的数据根目录):
+#   {data-folder}/alternative/nlp_sentiment/{来源}/{代码}.csv
+#
+# 运行 (项目根目录，align_sentiment.py 之后): python etl/export_lean.py
+
+LEAN_CONFIG = "lean.json"
+LEAN_DATASET_DIR = os.path.join("alternative", "nlp_sentiment")
+
+
+def lean_data_folder(config_path=LEAN_CONFIG):
+    """
+    lean.json 中的 data-folder (本地环境优先)，读取失败时为 data
+    """
+    try:
+        with open(config_path, encoding="utf-8") as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return "data"
+    local = config.get("environments", {}).get(config.get("default-environment", "local"), {})
+    return local.get("data-folder") or config.get("data-folder") or "data"
+
+
+def lean_path(symbol, source, data_folder):
+    return os.path.join(data_folder, LEAN_DATASET_DIR, source, f"{symbol}.csv")
+
+
+def export_symbol(symbol, data_folder, sources=tuple(FACTOR_SOURCES)):
+    """
+    写出一只股票各来源的 LEAN 文件，返回 {来源: 行数}
+    """
+    factor = load_frame("sentiment_factor", symbol, columns=list(sources))
+    counts = {}
+    if factor is None:
+        return counts
+    dates = factor["date"].dt.strftime("%Y%m%d").to_numpy()
+    for source in sources:
+        scores = factor[source].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(scores)
+        path = lean_path(symbol, source, data_folder)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # repr 保留完整精度，LEAN 与本地回测读到的分数逐位相同
+        lines = [f"{d},{s!r}\n" for d, s in zip(dates[valid], scores[valid].tolist())]
+        tmp_path = path + ".tmp"
+        with timer("csv_write", items=len(lines)), open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
+            f.writelines(lines)
+        os.replace(tmp_path, path)
+        counts[source] = len(lines)
+    return counts
+
+
+def main(sources=tuple(FACTOR_SOURCES), config_path=LEAN_CONFIG):
+    data_folder = lean_data_folder(config_path)
+    symbols = list_symbols("sentiment_factor")
+    print(f"导出 LEAN 情感数据: {len(symbols)} 只股票 -> {os.path.join(data_folder, LEAN_DATASET_DIR)}")
+    for symbol in symbols:
+        counts = export_symbol(symbol, data_folder, sources)
+        print(f"  {symbol}: " + ", ".join(f"{source} {n}" for source, n in counts.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导出 LEAN 自定义情感数据 (date,score)")
+    parser.add_argument("--sources", nargs="+", choices=list(FACTOR_SOURCES), default=list(FACTOR_SOURCES))
+    parser.add_argument("--config", default=LEAN_CONFIG, help="lean.json 路径")
+    args = parser.parse_args()
+    with run_metrics("export_lean"):
+        main(tuple(args.sources), args.config)
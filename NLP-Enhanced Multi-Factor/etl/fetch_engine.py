@@ -0,0 +1,148 @@
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import count, timer
+
+# 下载脚本共用的并发抓取引擎
+# - 线程池并发 (AKShare 调用以网络 IO 为主)
+# - 每个接口一个令牌桶限速，替代固定 time.sleep
+# - 失败按指数退避重试
+# - 限制在途请求数，避免一次性提交整个股票池
+
+# ok: 是否成功; value: fn 返回值; error: 最后一次异常; attempts: 尝试次数; elapsed: 耗时(秒)
+FetchResult = namedtuple("FetchResult", ["key", "ok", "value", "error", "attempts", "elapsed"])
+
+# 下载脚本默认的目标股票池 (用户指定)
+# 金风科技, 明阳智能, 铜陵有色, 云南铜业, 吉电股份, 振华股份
+DEFAULT_STOCKS = ['002202', '601615', '000630', '000878', '000875', '603067']
+
+
+def read_stock_list(path):
+    """
+    股票列表文件 (下载脚本的 --stocks): 每行一个或多个代码 (空白或逗号分隔)，# 之后为注释
+    按文本读取，保留代码的前导零
+    """
+    stocks = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            stocks.extend(line.split("#")[0].replace(",", " ").split())
+    return stocks
+
+
+class TokenBucket:
+    """
+    令牌桶: 平均速率 rate 次/秒，允许 burst 次突发
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class FetchEngine:
+    """
+    用法:
+        engine = FetchEngine(max_workers=8)
+        engine.add_endpoint("stock_news_em", rate=2, burst=2)
+        results = engine.run(stocks, "stock_news_em", fetch_one)
+        print_report(results)
+    """
+
+    def __init__(self, max_workers=8, max_in_flight=None, max_retries=3, backoff_base=1.0, backoff_max=30.0):
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight or max_workers * 2
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limiters = {}
+
+    def add_endpoint(self, name, rate, burst=1):
+        self.limiters[name] = TokenBucket(rate, burst)
+
+    def limited(self, endpoint, fn):
+        """
+        包装 fn，使每次调用都先从 endpoint 的令牌桶取令牌
+        用于一个任务内会多次调用同一接口的情况 (如增量下载失败后全量重拉)
+        """
+        limiter = self.limiters[endpoint]
+
+        def wrapper(*args, **kwargs):
+            with timer("rate_limit_wait", endpoint=endpoint):
+                limiter.acquire()
+            return fn(*args, **kwargs)
+
+        return wrapper
+
+    def _call(self, endpoint, fn, key):
+        limiter = self.limiters.get(endpoint)
+        start = time.monotonic()
+        error = None
+        for attempt in range(1, self.max_retries + 2):
+            if limiter is not None:
+                # 限速等待单独计时，与接口本身的延迟区分
+                with timer("rate_limit_wait", endpoint=endpoint):
+                    limiter.acquire()
+            try:
+                value = fn(key)
+                return FetchResult(key, True, value, None, attempt, time.monotonic() - start)
+            except Exception as e:
+                error = e
+                if attempt > self.max_retries:
+                    count("fetch_failures", endpoint=endpoint or "-")
+                    break
+                count("fetch_retries", endpoint=endpoint or "-")
+                # 指数退避 + 抖动，避免所有线程同时重试
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+                time.sleep(delay * (0.5 + random.random() / 2))
+        return FetchResult(key, False, None, error, attempt, time.monotonic() - start)
+
+    def run(self, keys, endpoint, fn):
+        """
+        对每个 key 调用 fn(key)，返回按输入顺序排列的 {key: FetchResult}
+        endpoint 为 None 时不在任务层限速 (fn 内部已用 limited 包装)
+        """
+        keys = list(keys)
+        results = {}
+        in_flight = threading.BoundedSemaphore(self.max_in_flight)
+
+        def task(key):
+            try:
+                return self._call(endpoint, fn, key)
+            finally:
+                in_flight.release()
+
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for key in keys:
+                in_flight.acquire()
+                futures.append(pool.submit(task, key))
+            for future in futures:
+                result = future.result()
+                results[result.key] = result
+
+        return {key: results[key] for key in keys}
+
+
+def print_report(results, title="抓取结果"):
+    ok = [r for r in results.values() if r.ok]
+    failed = [r for r in results.values() if not r.ok]
+    print(f"{title}: 成功 {len(ok)} / 失败 {len(failed)} / 共 {len(results)}")
+    for r in failed:
+        print(f"  [失败] {r.key}: {r.error} (尝试 {r.attempts} 次, {r.elapsed:.1f}s)")
@@ -0,0 +1,164 @@
+import os
+import time
+import numpy as np
+import torch
+from sentiment_scoring import MODEL_NAME, load_model, score_texts
+
+# 情感模型的 CPU 推理后端
+# - fp32: PyTorch eager (原有行为)
+# - int8: PyTorch 动态量化 (Linear 层权重 int8)
+# - onnx: 导出 ONNX 后用 onnxruntime 推理，可设置 intra/inter op 线程数
+# 三者都返回 (tokenizer, model, device)，model 的调用方式与 HF 模型一致 (model(**inputs).logits)，
+# 因此 score_texts / score_documents 无需修改
+
+BACKENDS = ("fp32", "int8", "onnx")
+ONNX_DIR = "data/models"
+
+
+def backend_model_name(backend, model_name=MODEL_NAME):
+    """
+    缓存 key 中使用的模型名: 不同后端的分数有微小偏差，缓存需区分
+    """
+    return model_name if backend == "fp32" else f"{model_name}#{backend}"
+
+
+class OnnxSequenceClassifier:
+    """
+    onnxruntime 会话的包装，接口与 HF 分类模型一致: model(**inputs).logits
+    """
+
+    class Output:
+        def __init__(self, logits):
+            self.logits = logits
+
+    def __init__(self, session):
+        self.session = session
+        self.input_names = [i.name for i in session.get_inputs()]
+
+    def __call__(self, **inputs):
+        feed = {name: inputs[name].cpu().numpy().astype(np.int64) for name in self.input_names if name in inputs}
+        if "token_type_ids" in self.input_names and "token_type_ids" not in feed:
+            feed["token_type_ids"] = np.zeros_like(feed["input_ids"])
+        logits = self.session.run(None, feed)[0]
+        return self.Output(torch.from_numpy(logits))
+
+    def eval(self):
+        return self
+
+
+def export_onnx(tokenizer, model, path):
+    """
+    导出动态 batch / 动态序列长度的 ONNX 模型
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    sample = tokenizer(["样例文本"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+    torch.onnx.export(
+        model,
+        tuple(sample[name] for name in input_names),
+        path,
+        input_names=input_names,
+        output_names=["logits"],
+        dynamic_axes=dynamic_axes,
+        opset_version=17,
+        dynamo=False,
+    )
+    return path
+
+
+def load_backend(backend="fp32", model_name=MODEL_NAME, intra_op_threads=None, inter_op_threads=None,
+                 onnx_path=None):
+    """
+    按后端加载模型，返回 (tokenizer, model, device)
+    intra_op_threads / inter_op_threads: 推理线程数 (onnx 写入 SessionOptions，PyTorch 后端设置全局线程数)
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的推理后端: {backend}, 可选 {BACKENDS}")
+
+    tokenizer, model, device = load_model(model_name)
+
+    if backend in ("fp32", "int8"):
+        if intra_op_threads:
+            torch.set_num_threads(intra_op_threads)
+        if inter_op_threads and torch.get_num_interop_threads() != inter_op_threads:
+            try:
+                torch.set_num_interop_threads(inter_op_threads)
+            except RuntimeError:
+                # PyTorch 只允许在任何并行计算开始前设置一次
+                print(f"inter-op 线程数已固定为 {torch.get_num_interop_threads()}，忽略 {inter_op_threads}")
+        if backend == "int8":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return tokenizer, model, device
+
+    import onnxruntime as ort
+
+    onnx_path = onnx_path or os.path.join(ONNX_DIR, model_name.replace("/", "__") + ".onnx")
+    if not os.path.exists(onnx_path):
+        print(f"导出 ONNX 模型: {onnx_path}")
+        export_onnx(tokenizer, model, onnx_path)
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_op_threads:
+        options.intra_op_num_threads = intra_op_threads
+    if inter_op_threads:
+        options.inter_op_num_threads = inter_op_threads
+    session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+    return tokenizer, OnnxSequenceClassifier(session), device
+
+
+def compare_backends(texts, backends=BACKENDS, model_name=MODEL_NAME, batch_size=32, max_length=128,
+                     intra_op_threads=None, inter_op_threads=None):
+    """
+    对同一批文本用各后端打分，报告相对 fp32 的分数漂移与吞吐
+    返回 {backend: {"texts_per_sec", "max_abs_drift", "mean_abs_drift", "sign_agreement"}}
+    """
+    texts = list(texts)
+    report = {}
+    reference = None
+    for backend in ("fp32",) + tuple(b for b in backends if b != "fp32"):
+        tokenizer, model, device = load_backend(backend, model_name, intra_op_threads, inter_op_threads)
+        # 预热一次，避免首批的初始化开销计入吞吐
+        score_texts(texts[:batch_size], tokenizer, model, device, batch_size, max_length, show_progress=False)
+
+        start = time.perf_counter()
+        scores = np.asarray(score_texts(texts, tokenizer, model, device, batch_size, max_length,
+                                        show_progress=False))
+        elapsed = time.perf_counter() - start
+
+        if reference is None:
+            reference = scores
+        drift = np.abs(scores - reference)
+        report[backend] = {
+            "texts_per_sec": len(texts) / elapsed if elapsed > 0 else float("inf"),
+            "max_abs_drift": float(drift.max()) if len(drift) else 0.0,
+            "mean_abs_drift": float(drift.mean()) if len(drift) else 0.0,
+            "sign_agreement": float((np.sign(scores) == np.sign(reference)).mean()) if len(drift) else 1.0,
+        }
+    return report
+
+
+def print_report(report):
+    print(f"{'backend':<8}{'texts/s':>12}{'max drift':>12}{'mean drift':>12}{'sign agree':>12}")
+    for backend, r in report.items():
+        print(f"{backend:<8}{r['texts_per_sec']:>12.1f}{r['max_abs_drift']:>12.5f}"
+              f"{r['mean_abs_drift']:>12.5f}{r['sign_agreement']:>12.2%}")
+
+
+if __name__ == "__main__":
+    import glob
+    import pandas as pd
+
+    # 用已下载的研报标题做对比样本
+    sample_texts = []
+    for file in glob.glob("data/alternative/reports/*.csv"):
+        df = pd.read_csv(file)
+        if '报告名称' in df.columns:
+            sample_texts.extend(df['报告名称'].dropna().astype(str).tolist())
+    if not sample_texts:
+        sample_texts = ["公司业绩大增，超预期", "工厂发生火灾，停产整顿", "维持买入评级", "下调盈利预测"] * 64
+
+    print(f"样本数: {len(sample_texts)}")
+    print_report(compare_backends(sample_texts[:2000]))
@@ -0,0 +1,512 @@
+import bisect
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块，不记录峰值内存
+    resource = None
+
+# 运行指标: 各阶段耗时 / 吞吐 / 计数 (ETL 脚本与回测脚本共用，只依赖标准库)
+# - timer(stage, items=...): 上下文管理器 (或装饰器 timed)，记录阶段耗时直方图与处理条数
+#   阶段名: akshare / rate_limit_wait / pdf_download / pdf_parse / tokenize / forward / csv_write / plot / backtest ...
+# - count(name): 计数器；observe(name, value): 任意数值的直方图 (如 PDF 字节数)
+# - 进程池中执行的函数用 collected(fn, ...) 包装，子进程的指标随结果带回父进程合并 (merge)
+# - run_metrics(run): 脚本入口使用，结束时写出本次运行的汇总:
+#     data/metrics/{run}-{时间}.json   每次运行一个 JSON
+#     data/metrics/{run}.prom         Prometheus textfile (最近一次运行，node_exporter textfile collector 可直接采集)
+# - 性能剖析 (默认关闭，环境变量开启):
+#     NLP_MF_PROFILE=cprofile   整个运行做 cProfile，写出 {run}-{时间}.prof (pstats / snakeviz 查看)，并打印耗时最多的函数
+#     NLP_MF_PROFILE=sample     后台线程每 NLP_MF_PROFILE_INTERVAL 秒 (默认 0.005) 抓一次所有线程的调用栈，
+#                               按所在阶段归类，写出 flamegraph 折叠栈 {run}-{时间}.stacks (flamegraph.pl / speedscope)
+#   关闭时 timer 只多一次判断；子进程 (进程池) 内的调用栈不在采样范围内
+# 多线程并发的阶段 (如下载) 耗时按线程累加，吞吐 items_per_second 为 "每忙碌秒" 的处理量
+#
+# ETL 脚本: from instrumentation import ...    项目根目录的回测脚本: from etl.instrumentation import ...
+
+METRICS_DIR = os.environ.get("NLP_MF_METRICS_DIR", "data/metrics")
+PREFIX = "nlp_mf"
+
+# 耗时直方图的桶上界 (秒)
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+# observe() 的默认桶: 按 4 倍递增，覆盖字节数 / 条数等量级
+VALUE_BUCKETS = tuple(4.0 ** k for k in range(16))
+
+
+class Histogram:
+    """
+    固定桶直方图 (Prometheus 口径: 每个桶为 <= 上界的累计个数，导出时累加)
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for i, n in enumerate(other["counts"]):
+            self.counts[i] += n
+        self.count += other["count"]
+        self.sum += other["sum"]
+        self.min = min(self.min, other["min"])
+        self.max = max(self.max, other["max"])
+
+    def quantile(self, q):
+        """
+        按桶线性插值估计分位数 (落在最后一个开区间桶时取最大值)
+        """
+        if self.count == 0:
+            return float("nan")
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.buckets):
+                    return self.max
+                low = max(self.buckets[i - 1] if i else 0.0, self.min)
+                high = min(self.buckets[i], self.max)
+                return low + (high - low) * (rank - seen) / n
+            seen += n
+        return self.max
+
+    def export(self):
+        return {"buckets": list(self.buckets), "counts": list(self.counts), "count": self.count,
+                "sum": self.sum, "min": self.min, "max": self.max}
+
+
+class Registry:
+    """
+    进程内的指标表，key 为 (指标名, 排序后的标签元组)
+    """
+
+    def __init__(self):
+        self._reinit()
+
+    def _reinit(self):
+        # 不经过锁: 只在构造时和 fork 后的子进程里调用 (见 _after_fork)
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+
+    def observe(self, name, value, labels, buckets=VALUE_BUCKETS):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram(buckets)
+            hist.add(value)
+
+    def count(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def export(self):
+        """
+        可序列化 (pickle / JSON) 的快照，用于子进程 -> 父进程合并
+        """
+        with self.lock:
+            return {
+                "histograms": [[name, list(labels), hist.export()] for (name, labels), hist in self.histograms.items()],
+                "counters": [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+            }
+
+    def merge(self, snapshot):
+        with self.lock:
+            for name, labels, data in snapshot["histograms"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                hist = self.histograms.get(key)
+                if hist is None:
+                    hist = self.histograms[key] = Histogram(tuple(data["buckets"]))
+                hist.merge(data)
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                self.counters[key] = self.counters.get(key, 0) + value
+
+
+REGISTRY = Registry()
+
+# 采样剖析器 (NLP_MF_PROFILE=sample 时由 run_metrics 创建)；为 None 时 timer 不维护阶段栈
+_SAMPLER = None
+
+
+def _after_fork():
+    # fork 时父进程的其他线程 (如下载线程正在 timer 里) 可能正持有 REGISTRY.lock，
+    # 子进程继承到的是一把永远不会释放的锁；子进程里重建锁并清空继承来的指标，采样线程也不会被复制
+    global _SAMPLER
+    REGISTRY._reinit()
+    _SAMPLER = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+class timer:
+    """
+    阶段计时:
+        with timer("forward", items=len(batch)):
+            ...
+        with timer("pdf_parse") as t:
+            t.items = len(pages)         # 处理条数在阶段内才知道时
+    记录 stage_seconds{stage=...} 直方图与 stage_items_total{stage=...} 计数 (items 不为 None 时)
+    阶段内抛出异常时额外记录 stage_errors_total
+    """
+
+    __slots__ = ("stage", "items", "labels", "start")
+
+    def __init__(self, stage, items=None, **labels):
+        self.stage = stage
+        self.items = items
+        self.labels = labels
+
+    def __enter__(self):
+        if _SAMPLER is not None:
+            _SAMPLER.push(self.stage)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        if _SAMPLER is not None:
+            _SAMPLER.pop()
+        labels = dict(self.labels, stage=self.stage)
+        REGISTRY.observe("stage_seconds", elapsed, labels, SECONDS_BUCKETS)
+        if self.items is not None:
+            REGISTRY.count("stage_items", self.items, labels)
+        if exc_type is not None:
+            REGISTRY.count("stage_errors", 1, labels)
+        return False
+
+
+def timed(stage, **labels):
+    """
+    装饰器版本的 timer (不记录 items)
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(stage, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, value=1, **labels):
+    REGISTRY.count(name, value, labels)
+
+
+def observe(name, value, buckets=VALUE_BUCKETS, **labels):
+    REGISTRY.observe(name, value, labels, buckets)
+
+
+def collected(fn, *args, **kwargs):
+    """
+    在进程池中执行 fn 并带回本次调用的指标: pool.submit(collected, fn, ...) -> (结果, 指标快照)
+    父进程取结果后调用 merge(快照)。进程池的工作进程会执行多个任务，每个任务前先清空
+    """
+    REGISTRY.reset()
+    value = fn(*args, **kwargs)
+    return value, REGISTRY.export()
+
+
+def merge(snapshot):
+    REGISTRY.merge(snapshot)
+
+
+class Sampler:
+    """
+    采样剖析: 后台线程按 interval 秒抓取所有线程的调用栈 (sys._current_frames)，
+    以 "阶段;文件:函数;..." 的折叠栈计数，阶段来自该线程当前所在的 timer
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.stages = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="nlp-mf-sampler", daemon=True)
+
+    def push(self, stage):
+        self.stages.setdefault(threading.get_ident(), []).append(stage)
+
+    def pop(self):
+        stack = self.stages.get(threading.get_ident())
+        if stack:
+            stack.pop()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                names = []
+                while frame is not None and len(names) < self.max_depth:
+                    code = frame.f_code
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stage = self.stages.get(ident)
+                root = stage[-1] if stage else "-"
+                self.stacks[";".join([root] + names[::-1])] += 1
+            self.samples += 1
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+
+    def top_functions(self, n=20):
+        """
+        自身时间 (栈顶函数) 最多的 n 个函数，返回 [(阶段, 函数, 样本比例)]
+        """
+        leaf = Counter()
+        for stack, count_ in self.stacks.items():
+            parts = stack.split(";")
+            leaf[(parts[0], parts[-1])] += count_
+        total = sum(leaf.values()) or 1
+        return [(stage, fn, c / total) for (stage, fn), c in leaf.most_common(n)]
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return 0
+    # ru_maxrss: Linux 为 KB，macOS 为字节
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _format_le(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def prometheus_text(run, duration, status, peak_rss):
+    """
+    Prometheus 文本格式 (textfile collector，或常驻服务的 GET /metrics):
+    直方图导出 _bucket / _sum / _count，计数器加 _total 后缀
+    """
+    run_label = (("run", run),)
+    lines = []
+    for name, help_text, value in (
+        ("run_duration_seconds", "Wall time of the run", duration),
+        ("run_success", "1 if the run finished (or is running) without an exception", 1 if status == "ok" else 0),
+        ("run_timestamp_seconds", "Unix time the metrics were written", time.time()),
+        ("run_peak_rss_bytes", "Peak resident set size of the run process", peak_rss),
+    ):
+        metric = f"{PREFIX}_{name}"
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge",
+                  f"{metric}{_label_text(run_label)} {value!r}"]
+
+    with REGISTRY.lock:
+        histograms = sorted(REGISTRY.histograms.items())
+        counters = sorted(REGISTRY.counters.items())
+    declared = set()
+    for (name, labels), hist in histograms:
+        metric = f"{PREFIX}_{name}"
+        if metric not in declared:
+            lines += [f"# TYPE {metric} histogram"]
+            declared.add(metric)
+        labels = run_label + labels
+        cumulative = 0
+        for bound, n in zip(list(hist.buckets) + [float("inf")], hist.counts):
+            cumulative += n
+            lines.append(f"{metric}_bucket{_label_text(labels + (('le', _format_le(bound)),))} {cumulative}")
+        lines.append(f"{metric}_sum{_label_text(labels)} {hist.sum!r}")
+        lines.append(f"{metric}_count{_label_text(labels)} {hist.count}")
+    for (name, labels), value in counters:
+        metric = f"{PREFIX}_{name}_total"
+        if metric not in declared:
+            lines += [f"# TYPE {metric} counter"]
+            declared.add(metric)
+        lines.append(f"{metric}{_label_text(run_label + labels)} {value!r}")
+    return "\n".join(lines) + "\n"
+
+
+def summary(run, duration, status, peak_rss):
+    """
+    本次运行的 JSON 汇总: 每个阶段的次数 / 总耗时 / 分位数 / 处理条数与吞吐，计数器与其他直方图
+    """
+    with REGISTRY.lock:
+        histograms = dict(REGISTRY.histograms)
+        counters = dict(REGISTRY.counters)
+
+    stages = []
+    for (name, labels), hist in sorted(histograms.items()):
+        if name != "stage_seconds":
+            continue
+        items = counters.get(("stage_items", labels))
+        errors = counters.get(("stage_errors", labels), 0)
+        stages.append(dict(
+            labels,
+            count=hist.count,
+            seconds=hist.sum,
+            mean_ms=hist.sum / hist.count * 1000,
+            p50_ms=hist.quantile(0.5) * 1000,
+            p95_ms=hist.quantile(0.95) * 1000,
+            max_ms=hist.max * 1000,
+            # 子进程的耗时累加合并，多进程阶段的占比可超过 100%
+            share=hist.sum / duration if duration > 0 else 0.0,
+            items=items,
+            items_per_second=items / hist.sum if items is not None and hist.sum > 0 else None,
+            errors=errors,
+        ))
+    stages.sort(key=lambda s: -s["seconds"])
+    return {
+        "run": run,
+        "status": status,
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(time.time() - duration)),
+        "duration_seconds": duration,
+        "peak_rss_bytes": peak_rss,
+        "argv": sys.argv,
+        "stages": stages,
+        "counters": [dict(labels, name=name, value=value) for (name, labels), value in sorted(counters.items())
+                     if name not in ("stage_items", "stage_errors")],
+        "histograms": [dict(labels, name=name, count=hist.count, sum=hist.sum, min=hist.min, max=hist.max,
+                            p50=hist.quantile(0.5), p95=hist.quantile(0.95))
+                       for (name, labels), hist in sorted(histograms.items()) if name != "stage_seconds"],
+    }
+
+
+def print_summary(report, top=12):
+    print(f"运行指标 [{report['run']}] 总耗时 {report['duration_seconds']:.2f}s ({report['status']})")
+    print(f"  {'stage':<28}{'count':>8}{'seconds':>10}{'share':>8}{'p50 ms':>10}{'p95 ms':>10}{'items/s':>12}")
+    for stage in report["stages"][:top]:
+        label = stage["stage"] + "".join(f" {k}={v}" for k, v in stage.items() if k in ("endpoint", "backend"))
+        rate = "" if stage["items_per_second"] is None else f"{stage['items_per_second']:,.0f}"
+        print(f"  {label[:27]:<28}{stage['count']:>8}{stage['seconds']:>10.2f}{stage['share']:>8.1%}"
+              f"{stage['p50_ms']:>10.1f}{stage['p95_ms']:>10.1f}{rate:>12}")
+
+
+def _write_atomic(path, text):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class run_metrics:
+    """
+    脚本入口:
+        if __name__ == "__main__":
+            with run_metrics("calc_sentiment"):
+                process_news_data(...)
+    结束时 (含异常退出) 写出 JSON 汇总与 Prometheus textfile，并按环境变量开启 / 收尾性能剖析
+    """
+
+    def __init__(self, run, out_dir=None, profile=None, verbose=True):
+        self.run = run
+        self.out_dir = out_dir or METRICS_DIR
+        self.profile = (profile if profile is not None else os.environ.get("NLP_MF_PROFILE", "")).lower()
+        self.verbose = verbose
+        self.profiler = None
+        self.report = None
+
+    def __enter__(self):
+        global _SAMPLER
+        REGISTRY.reset()
+        self.stamp = time.strftime("%Y%m%d-%H%M%S")
+        if self.profile == "cprofile":
+            self.profiler = cProfile.Profile()
+        elif self.profile == "sample":
+            _SAMPLER = Sampler(float(os.environ.get("NLP_MF_PROFILE_INTERVAL", "0.005")))
+            _SAMPLER.start()
+        elif self.profile:
+            print(f"未知的 NLP_MF_PROFILE={self.profile} (可选 cprofile / sample)，不做性能剖析")
+        self.start = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _SAMPLER
+        if self.profiler is not None:
+            self.profiler.disable()
+        duration = time.perf_counter() - self.start
+        status = "ok" if exc_type is None else ("interrupted" if exc_type is KeyboardInterrupt else "failed")
+        peak_rss = peak_rss_bytes()
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        base = os.path.join(self.out_dir, f"{self.run}-{self.stamp}")
+        self.report = summary(self.run, duration, status, peak_rss)
+        _write_atomic(base + ".json", json.dumps(self.report, ensure_ascii=False, indent=2, default=str))
+        _write_atomic(os.path.join(self.out_dir, f"{self.run}.prom"),
+                      prometheus_text(self.run, duration, status, peak_rss))
+
+        if self.profiler is not None:
+            self.profiler.dump_stats(base + ".prof")
+            if self.verbose:
+                pstats.Stats(self.profiler).sort_stats("cumulative").print_stats(20)
+                print(f"cProfile 结果: {base}.prof")
+        if _SAMPLER is not None:
+            _SAMPLER.stop()
+            _SAMPLER.write(base + ".stacks")
+            if self.verbose:
+                print(f"采样剖析: {_SAMPLER.samples} 次采样，折叠栈 {base}.stacks")
+                for stage, fn, share in _SAMPLER.top_functions(10):
+                    print(f"  {share:>6.1%}  [{stage}] {fn}")
+            _SAMPLER = None
+
+        if self.verbose:
+            print_summary(self.report)
+            print(f"运行指标已保存: {base}.json")
+        return False
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description="查看最近一次运行的分阶段耗时")
+    parser.add_argument("run", nargs="?", help="运行名 (如 calc_sentiment)，缺省时列出每个运行最近一次的汇总")
+    parser.add_argument("--dir", default=METRICS_DIR)
+    args = parser.parse_args()
+
+    latest = {}
+    for path in sorted(glob.glob(os.path.join(args.dir, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            report = json.load(f)
+        latest[report["run"]] = report
+    for name, report in sorted(latest.items()):
+        if args.run is None or name == args.run:
+            print_summary(report)
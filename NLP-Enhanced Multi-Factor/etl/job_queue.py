@@ -0,0 +1,250 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+# 可续跑的本地任务队列 (SQLite)，打分脚本用它记录每个文档 / 文件的处理进度
+# - 每个任务一行: 状态 pending / leased / done / failed，尝试次数，租约持有者与到期时间，结果 (JSON)
+# - lease(): 在一个写事务内领取一批任务 (pending，或租约已过期的 leased)，尝试次数 +1；
+#   进程崩溃后它持有的任务在租约到期时被其他进程收回重做 (本机已退出的进程的租约立即收回)
+# - complete() / fail(): 批量提交结果；超过 max_attempts 的任务标记为 failed 不再领取
+# - enqueue() 对已存在的任务不做任何修改，重跑同一命令时只处理未完成的任务
+# 多个进程 (或共享文件系统的多台机器) 可同时消费同一个队列:
+# 这里不用 WAL (WAL 依赖同一主机的共享内存)，使用默认的回滚日志 + busy_timeout 等待写锁；
+# 网络文件系统需支持 POSIX 文件锁 (如 NFSv4)
+
+QUEUE_PATH = "data/cache/jobs.sqlite"
+
+LEASE_SECONDS = 600
+MAX_ATTEMPTS = 3
+
+# SQLite 单条语句的参数上限较低，批量操作时分块
+_QUERY_CHUNK = 500
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _dead_local_owner(owner):
+    # 本机上已退出的进程持有的租约不必等到期，可立即收回 (其他主机的进程无法判断，只能等租约到期)
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        return False
+    return False
+
+
+class JobQueue:
+    """
+    用法:
+        jobs = JobQueue()
+        jobs.enqueue("fulltext", [(job_id, payload), ...])
+        for job_id, payload in jobs.lease("fulltext", n=8):
+            ...
+        jobs.complete("fulltext", [(job_id, result), ...])
+    """
+
+    def __init__(self, path=QUEUE_PATH, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS, worker=None):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker = worker or worker_id()
+        # 同一进程内的多个线程 (如下载线程领取、主线程提交) 共用一个连接，串行访问
+        self.lock = threading.RLock()
+        # 事务由代码显式控制 (BEGIN IMMEDIATE)
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " queue TEXT NOT NULL,"
+            " job_id TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'pending',"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " lease_owner TEXT,"
+            " lease_expires REAL,"
+            " result TEXT,"
+            " error TEXT,"
+            " updated REAL NOT NULL,"
+            " PRIMARY KEY (queue, job_id))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (queue, status)")
+
+    def _write(self, fn):
+        # 写事务: 开始时即取得写锁，领取任务时不会有两个进程拿到同一行
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                value = fn()
+                self.conn.execute("COMMIT")
+                return value
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _read(self, sql, params):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def enqueue(self, queue, jobs):
+        """
+        jobs: [(job_id, payload dict)]，已存在的任务保持原状态，返回新增的任务数
+        """
+        now = time.time()
+        rows = [(queue, str(job_id), json.dumps(payload, ensure_ascii=False, default=str), now)
+                for job_id, payload in jobs]
+
+        def insert():
+            before = self.conn.total_changes
+            self.conn.executemany("INSERT OR IGNORE INTO jobs (queue, job_id, payload, updated) VALUES (?, ?, ?, ?)",
+                                  rows)
+            return self.conn.total_changes - before
+
+        return self._write(insert)
+
+    def lease(self, queue, n=1):
+        """
+        领取最多 n 个任务，返回 [(job_id, payload dict)]；没有可领取的任务时返回空列表
+        """
+        def take():
+            now = time.time()
+            owners = self.conn.execute("SELECT DISTINCT lease_owner FROM jobs WHERE queue = ? AND status = 'leased'",
+                                       (queue,)).fetchall()
+            dead = [owner for owner, in owners if owner and owner != self.worker and _dead_local_owner(owner)]
+            self.conn.executemany(
+                "UPDATE jobs SET lease_expires = 0 WHERE queue = ? AND status = 'leased' AND lease_owner = ?",
+                [(queue, owner) for owner in dead],
+            )
+            rows = self.conn.execute(
+                "SELECT job_id, payload FROM jobs WHERE queue = ? AND attempts < ?"
+                " AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?))"
+                " ORDER BY rowid LIMIT ?",
+                (queue, self.max_attempts, now, n),
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE jobs SET status = 'leased', attempts = attempts + 1, lease_owner = ?, lease_expires = ?,"
+                " updated = ? WHERE queue = ? AND job_id = ?",
+                [(self.worker, now + self.lease_seconds, now, queue, job_id) for job_id, _ in rows],
+            )
+            # 租约过期且已用完尝试次数的任务 (持有者反复崩溃) 标记为失败
+            self.conn.execute(
+                "UPDATE jobs SET status = 'failed', error = COALESCE(error, 'lease expired'), updated = ?"
+                " WHERE queue = ? AND status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, queue, now, self.max_attempts),
+            )
+            return [(job_id, json.loads(payload)) for job_id, payload in rows]
+
+        return self._write(take)
+
+    def extend(self, queue, job_ids):
+        """
+        续租 (长任务处理中途调用)
+        """
+        now = time.time()
+        self._write(lambda: self.conn.executemany(
+            "UPDATE jobs SET lease_expires = ?, updated = ? WHERE queue = ? AND job_id = ? AND lease_owner = ?"
+            " AND status = 'leased'",
+            [(now + self.lease_seconds, now, queue, job_id, self.worker) for job_id in job_ids],
+        ))
+
+    def complete(self, queue, results):
+        """
+        results: [(job_id, result)]，一个事务提交；租约已被其他进程收回的任务也接受结果 (结果相同，先到先得)
+        """
+        now = time.time()
+        self._write(lambda: self.conn.executemany(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_owner = NULL, lease_expires = NULL,"
+            " updated = ? WHERE queue = ? AND job_id = ? AND status != 'done'",
+            [(json.dumps(result, ensure_ascii=False, default=str), now, queue, job_id) for job_id, result in results],
+        ))
+
+    def fail(self, queue, job_ids, error):
+        """
+        处理失败: 尝试次数未用完的任务回到 pending，之后重新领取；否则标记为 failed
+        """
+        now = time.time()
+
+        def update():
+            for start in range(0, len(job_ids), _QUERY_CHUNK):
+                chunk = list(job_ids[start:start + _QUERY_CHUNK])
+                placeholders = ",".join("?" * len(chunk))
+                self.conn.execute(
+                    "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,"
+                    f" error = ?, lease_owner = NULL, lease_expires = NULL, updated = ?"
+                    f" WHERE queue = ? AND status = 'leased' AND job_id IN ({placeholders})",
+                    [self.max_attempts, str(error)[:500], now, queue] + chunk,
+                )
+
+        self._write(update)
+
+    def results(self, queue):
+        """
+        已完成任务的 {job_id: result}
+        """
+        rows = self._read("SELECT job_id, result FROM jobs WHERE queue = ? AND status = 'done'", (queue,))
+        return {job_id: json.loads(result) for job_id, result in rows}
+
+    def counts(self, queue):
+        rows = self._read("SELECT status, COUNT(*) FROM jobs WHERE queue = ? GROUP BY status", (queue,))
+        return dict(rows)
+
+    def remaining(self, queue):
+        """
+        尚未结束 (pending / leased) 的任务数
+        """
+        counts = self.counts(queue)
+        return counts.get("pending", 0) + counts.get("leased", 0)
+
+    def retry_failed(self, queue):
+        """
+        失败任务重置为 pending，尝试次数清零
+        """
+        self._write(lambda: self.conn.execute(
+            "UPDATE jobs SET status = 'pending', attempts = 0, updated = ? WHERE queue = ? AND status = 'failed'",
+            (time.time(), queue),
+        ))
+
+    def reset(self, queue):
+        """
+        清空队列 (从头重跑)
+        """
+        self._write(lambda: self.conn.execute("DELETE FROM jobs WHERE queue = ?", (queue,)))
+
+    def summary(self, queue):
+        counts = self.counts(queue)
+        return (f"任务队列 {queue}: 完成 {counts.get('done', 0)}, 失败 {counts.get('failed', 0)}, "
+                f"待处理 {counts.get('pending', 0)}, 处理中 {counts.get('leased', 0)}")
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="查看 / 重置打分任务队列")
+    parser.add_argument("queue", nargs="?", help="队列名，缺省时列出全部队列")
+    parser.add_argument("--path", default=QUEUE_PATH)
+    parser.add_argument("--retry-failed", action="store_true", help="失败任务重新排队")
+    parser.add_argument("--reset", action="store_true", help="清空队列")
+    args = parser.parse_args()
+
+    jobs = JobQueue(args.path)
+    queues = [args.queue] if args.queue else [
+        row[0] for row in jobs._read("SELECT DISTINCT queue FROM jobs ORDER BY queue", ())]
+    for name in queues:
+        if args.reset:
+            jobs.reset(name)
+        elif args.retry_failed:
+            jobs.retry_failed(name)
+        print(jobs.summary(name))
+    jobs.close()
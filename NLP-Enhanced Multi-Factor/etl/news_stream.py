@@ -0,0 +1,359 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+from align_sentiment import REDUCERS
+from calc_sentiment import headline_column
+from datastore import append_frame
+from instrumentation import run_metrics, timer
+from fetch_engine import FetchEngine, print_report
+from sentiment_cache import SentimentCache, text_hash
+from sentiment_service import get_scorer
+
+# 流式新闻抓取 + 实时情感 (download_news.py / calc_sentiment.py 的常驻版本)
+# - 按 poll_interval 持续轮询每只股票的 stock_news_em (或任意 source(stock) -> DataFrame)
+# - 按 (股票, 归一化标题) 去重: 已处理过的标题记录在 SQLite 中，重启后也不会重复打分
+# - 每轮的新标题合并成一个 micro-batch 打分 (get_scorer: 常驻打分服务或进程内模型，走持久缓存)
+# - 结果追加到每只股票的新闻情感数据 (CSV 追加 + Parquet 增量分片)，并发布到本地 REST 端点，
+#   LEAN 实盘模式轮询 GET /live/{代码}?since=游标 (见 SentimentAlphaStrategy/main.py 与 live_events.py)
+#   每只股票每轮只发布一个分数: 本轮新标题按与回测相同的 reducer (align_sentiment.py，默认 mean) 合并，
+#   时间戳精确到毫秒并严格递增；带 since 时只返回晚于游标的事件，不带时只返回最新一条
+# - 每条新闻记录 发布时间 -> 信号可用 的端到端延迟，定期输出 p50 / p95 / max (GET /health 同样返回)
+# 单条新闻的延迟上界约为 poll_interval + 一次抓取 + 一个 micro-batch 的推理时间
+#
+# 运行 (项目根目录): python etl/news_stream.py --interval 10
+#                    python benchmarks/stream_latency.py      (本地假新闻源 + 离线小模型，测延迟)
+
+STOCKS = ['002202', '601615', '000630', '000878', '000875', '603067']
+SAVE_DIR = "data/alternative/sentiment_stream"
+SEEN_PATH = "data/cache/news_seen.sqlite"
+LIVE_HOST = "127.0.0.1"
+LIVE_PORT = 8766
+
+# SQLite 单条语句的参数上限较低，批量查询时分块
+_QUERY_CHUNK = 500
+
+
+def akshare_news_source(stock):
+    """
+    默认新闻源: 东方财富个股新闻 (最近一页)
+    """
+    import akshare as ak
+    with timer("akshare", endpoint="stock_news_em"):
+        return ak.stock_news_em(symbol=stock)
+
+
+class SeenStore:
+    """
+    已处理的 (股票, 归一化标题 sha1) 集合
+    """
+
+    def __init__(self, path=SEEN_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS news_seen ("
+            " symbol TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " first_seen REAL NOT NULL,"
+            " PRIMARY KEY (symbol, text_hash))"
+        )
+        self.conn.commit()
+
+    def unseen(self, symbol, hashes):
+        """
+        返回未出现过的 hash 集合 (同一批内的重复只算一次)
+        """
+        unique = list(dict.fromkeys(hashes))
+        found = set()
+        for start in range(0, len(unique), _QUERY_CHUNK):
+            chunk = unique[start:start + _QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT text_hash FROM news_seen WHERE symbol = ? AND text_hash IN ({placeholders})",
+                [symbol] + chunk,
+            ).fetchall()
+            found.update(r[0] for r in rows)
+        return set(unique) - found
+
+    def add(self, symbol, hashes):
+        now = time.time()
+        self.conn.executemany("INSERT OR IGNORE INTO news_seen (symbol, text_hash, first_seen) VALUES (?, ?, ?)",
+                              [(symbol, h, now) for h in hashes])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class LatencyStats:
+    """
+    端到端延迟 (秒) 的滑动样本，summary() 返回毫秒
+    """
+
+    def __init__(self, maxlen=100000):
+        self.values = deque(maxlen=maxlen)
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.values.extend(seconds)
+
+    def summary(self):
+        with self.lock:
+            values = np.asarray(self.values, dtype=np.float64) * 1000
+        if len(values) == 0:
+            return {"count": 0}
+        return {
+            "count": int(len(values)),
+            "p50_ms": float(np.percentile(values, 50)),
+            "p95_ms": float(np.percentile(values, 95)),
+            "max_ms": float(values.max()),
+        }
+
+
+class LiveFeed:
+    """
+    每只股票最近 maxlen 条实时情感，行格式 "yyyyMMdd HH:MM:SS.fff,score" (信号可用时间, 分数)
+    每条事件的游标为 "yyyyMMddHHMMSSfff"，与时间戳同序，可直接按字符串比较
+    """
+
+    def __init__(self, maxlen=200):
+        self.maxlen = maxlen
+        self.events = {}
+        self.last_ms = {}
+        self.lock = threading.Lock()
+
+    def publish(self, symbol, when, score):
+        with self.lock:
+            # 同一毫秒内的再次发布顺延 1 ms，同一股票的时间戳严格递增
+            ms = max(int(when * 1000), self.last_ms.get(symbol, 0) + 1)
+            self.last_ms[symbol] = ms
+            stamp = time.strftime("%Y%m%d %H:%M:%S", time.localtime(ms // 1000)) + f".{ms % 1000:03d}"
+            events = self.events.setdefault(symbol, deque(maxlen=self.maxlen))
+            key = stamp.replace(" ", "").replace(":", "").replace(".", "")
+            events.append((key, f"{stamp},{float(score)!r}\n"))
+
+    def text(self, symbol, since=None):
+        """
+        since 为 None 时只返回最新一条，否则返回游标之后的全部事件 (按时间升序)
+        """
+        with self.lock:
+            events = list(self.events.get(symbol, ()))
+        if since is None:
+            return events[-1][1] if events else ""
+        return "".join(line for key, line in events if key > since)
+
+
+def make_handler(feed, stats):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _send(self, code, body, content_type):
+            body = body.encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            if url.path.startswith("/live/"):
+                since = urllib.parse.parse_qs(url.query).get("since", [None])[0]
+                self._send(200, feed.text(url.path[len("/live/"):], since), "text/csv")
+            elif self.path == "/health":
+                self._send(200, json.dumps(stats()), "application/json")
+            else:
+                self._send(404, json.dumps({"error": "not found"}), "application/json")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class NewsStreamer:
+    """
+    用法:
+        streamer = NewsStreamer(STOCKS)
+        streamer.serve()                       # 可选: 启动 LEAN 实时数据端点
+        streamer.run(poll_interval=10)
+    source: source(stock) -> DataFrame (与 stock_news_em 列一致)，测试时替换为本地假新闻源
+    """
+
+    def __init__(self, stocks, source=akshare_news_source, scorer=None, backend="fp32", batch_size=32,
+                 max_length=512, max_workers=4, rate=2.0, seen_path=SEEN_PATH, save_dir=SAVE_DIR,
+                 cache=None, feed=None, reducer="mean"):
+        self.stocks = list(stocks)
+        self.source = source
+        self.reducer = reducer
+        self.scorer = scorer or get_scorer(backend)
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.save_dir = save_dir
+        self.seen = SeenStore(seen_path)
+        self.cache = cache if cache is not None else SentimentCache()
+        self.feed = feed or LiveFeed()
+        self.latency = LatencyStats()
+        self.polls = 0
+        self.fetched = 0
+        self.scored = 0
+        # 失败留给下一轮重试，不在轮内退避等待
+        self.engine = FetchEngine(max_workers=max_workers, max_retries=0)
+        self.engine.add_endpoint("stock_news_em", rate=rate, burst=max_workers)
+        self._server = None
+
+    def stats(self):
+        return dict(self.latency.summary(), polls=self.polls, fetched=self.fetched, scored=self.scored)
+
+    def serve(self, host=LIVE_HOST, port=LIVE_PORT):
+        self._server = ThreadingHTTPServer((host, port), make_handler(self.feed, self.stats))
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"实时情感端点: http://{host}:{self._server.server_address[1]}/live/{{代码}}")
+        return self._server.server_address[1]
+
+    def _new_rows(self, stock, df):
+        # 标题列每批判断一次
+        col = headline_column(df)
+        if col is None or df.empty:
+            return None
+        df = df.copy()
+        df["_hash"] = [text_hash(t) for t in df[col].fillna("").astype(str)]
+        fresh = self.seen.unseen(stock, df["_hash"].tolist())
+        df = df[df["_hash"].isin(fresh)].drop_duplicates("_hash")
+        if df.empty:
+            return None
+        return df.assign(_text=df[col].fillna("").astype(str))
+
+    def _reduce(self, rows):
+        # 与 align_sentiment.align_events 相同: 按发布时间排序后用 reducer 合并 (reducer=last 取最后发布的一条)
+        scores = pd.to_numeric(rows["sentiment_score"], errors="coerce")
+        if "发布时间" in rows.columns:
+            order = pd.to_datetime(rows["发布时间"], errors="coerce")
+            scores = scores.iloc[np.argsort(order.to_numpy(), kind="stable")]
+        scores = scores.dropna().reset_index(drop=True)
+        if scores.empty:
+            return float("nan")
+        # 走 groupby 聚合，reducer 的含义与回测完全相同 (如 "last" 只有分组聚合支持)
+        grouped = scores.groupby(np.zeros(len(scores), dtype=np.int8))
+        return float(grouped.agg(REDUCERS.get(self.reducer, self.reducer)).iloc[0])
+
+    def poll_once(self):
+        """
+        轮询一次全部股票，返回本轮新增的新闻条数
+        """
+        results = self.engine.run(self.stocks, "stock_news_em", self.source)
+        self.polls += 1
+        failed = {k: r for k, r in results.items() if not r.ok}
+        if failed:
+            print_report(failed, title="新闻轮询失败")
+
+        batches = {}
+        for stock, result in results.items():
+            if result.ok and result.value is not None:
+                self.fetched += len(result.value)
+                rows = self._new_rows(stock, result.value)
+                if rows is not None:
+                    batches[stock] = rows
+        if not batches:
+            return 0
+
+        # 本轮全部新标题一次打分
+        texts = [t for rows in batches.values() for t in rows["_text"]]
+        with timer("score_texts", items=len(texts)):
+            scores = self.scorer.score(texts, max_length=self.max_length, batch_size=self.batch_size,
+                                       cache=self.cache, show_progress=False)
+
+        offset = 0
+        latencies = []
+        for stock, rows in batches.items():
+            rows = rows.assign(sentiment_score=scores[offset:offset + len(rows)])
+            offset += len(rows)
+            hashes = rows["_hash"].tolist()
+            rows = rows.drop(columns=["_hash", "_text"])
+            self._append(stock, rows)
+            self.seen.add(stock, hashes)
+
+            available = time.time()
+            self.feed.publish(stock, available, self._reduce(rows))
+            if "发布时间" in rows.columns:
+                # 发布时间为本地时间 (无时区)，换算为 epoch 秒时扣除本地时区偏移
+                published = pd.to_datetime(rows["发布时间"], errors="coerce").dropna()
+                epoch = (published - pd.Timestamp(0)) / pd.Timedelta(seconds=1) - time.localtime().tm_gmtoff
+                latencies.extend(available - epoch.to_numpy())
+        self.latency.record(latencies)
+        self.scored += len(texts)
+        return len(texts)
+
+    def _append(self, stock, rows):
+        os.makedirs(self.save_dir, exist_ok=True)
+        path = os.path.join(self.save_dir, f"{stock}_sentiment.csv")
+        with timer("csv_write", items=len(rows)):
+            if os.path.exists(path):
+                # 与已有文件的列对齐后追加
+                header = pd.read_csv(path, nrows=0).columns
+                rows.reindex(columns=header).to_csv(path, mode="a", header=False, index=False)
+            else:
+                rows.to_csv(path, index=False)
+        with timer("parquet_write", items=len(rows)):
+            append_frame("news_stream_sentiment", stock, rows)
+
+    def run(self, poll_interval=10.0, max_polls=None, report_every=60.0):
+        """
+        持续轮询 (Ctrl+C 停止)，每轮开始时间间隔 poll_interval 秒
+        """
+        last_report = time.monotonic()
+        try:
+            while max_polls is None or self.polls < max_polls:
+                start = time.monotonic()
+                new = self.poll_once()
+                if new:
+                    print(f"  [{time.strftime('%H:%M:%S')}] 新增 {new} 条新闻")
+                if time.monotonic() - last_report >= report_every:
+                    print(f"  延迟: {self.stats()}")
+                    last_report = time.monotonic()
+                time.sleep(max(0.0, poll_interval - (time.monotonic() - start)))
+        except KeyboardInterrupt:
+            pass
+        return self.stats()
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        self.seen.close()
+        self.cache.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="流式新闻抓取与实时情感")
+    parser.add_argument("--interval", type=float, default=10.0, help="轮询间隔 (秒)")
+    parser.add_argument("--backend", default="fp32", choices=["fp32", "int8", "onnx"])
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--rate", type=float, default=2.0, help="接口限速 (次/秒)")
+    parser.add_argument("--port", type=int, default=LIVE_PORT, help="LEAN 实时数据端点端口 (0 为不启动)")
+    parser.add_argument("--reducer", default="mean", choices=list(REDUCERS),
+                        help="每轮同一股票多条新标题的合并方式 (与 align_sentiment.py 回测一致)")
+    args = parser.parse_args()
+
+    streamer = NewsStreamer(STOCKS, backend=args.backend, batch_size=args.batch_size, rate=args.rate,
+                            reducer=args.reducer)
+    if not streamer.scorer.load():
+        raise SystemExit("情感模型未能加载")
+    if args.port:
+        streamer.serve(port=args.port)
+    print(f"开始轮询 {len(STOCKS)} 只股票的新闻 (间隔 {args.interval}s)...")
+    # 常驻进程: 分阶段指标在 Ctrl+C 退出时写出
+    with run_metrics("news_stream"):
+        print(f"结束: {streamer.run(args.interval)}")
+    streamer.close()
@@ -0,0 +1,129 @@
+import hashlib
+import os
+import sqlite3
+import time
+import unicodedata
+from instrumentation import count, timer
+
+# 情感分持久化缓存 (SQLite)
+# key: (模型名, max_length, 归一化文本的 sha1)
+# 三个打分脚本共用，日常重跑时只有新增文本才需要过模型
+
+DEFAULT_CACHE_PATH = "data/cache/sentiment_cache.sqlite"
+
+# SQLite 单条语句的参数上限较低，批量查询时分块
+_QUERY_CHUNK = 500
+
+
+def normalize_text(text):
+    """
+    归一化: 全角/半角统一 (NFKC)，压缩空白
+    """
+    text = unicodedata.normalize("NFKC", "" if text is None else str(text))
+    return " ".join(text.split())
+
+
+def text_hash(text):
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class SentimentCache:
+    """
+    磁盘情感分缓存
+
+    max_entries: 超过后按最近使用时间淘汰最旧的条目
+    hits / misses: 本次运行的命中统计
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=2000000):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sentiment_cache ("
+            " model TEXT NOT NULL,"
+            " max_length INTEGER NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " score REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, max_length, text_hash))"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sentiment_cache_last_used ON sentiment_cache (last_used)"
+        )
+        self.conn.commit()
+        # 条目数在内存里近似维护，避免每次写入都 COUNT(*)
+        self._approx_count = self.conn.execute("SELECT COUNT(*) FROM sentiment_cache").fetchone()[0]
+
+    def get_many(self, model_name, max_length, texts):
+        """
+        批量查询，返回 {输入下标: score}，未命中的下标不在结果中
+        """
+        with timer("cache_lookup", items=len(texts)):
+            hashes = [text_hash(t) for t in texts]
+            found = {}
+            unique = list(dict.fromkeys(hashes))
+            for start in range(0, len(unique), _QUERY_CHUNK):
+                chunk = unique[start:start + _QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT text_hash, score FROM sentiment_cache"
+                    f" WHERE model = ? AND max_length = ? AND text_hash IN ({placeholders})",
+                    [model_name, max_length] + chunk,
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                # 刷新最近使用时间，供淘汰使用
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE sentiment_cache SET last_used = ? WHERE model = ? AND max_length = ? AND text_hash = ?",
+                    [(now, model_name, max_length, h) for h in found],
+                )
+                self.conn.commit()
+
+        result = {i: found[h] for i, h in enumerate(hashes) if h in found}
+        self.hits += len(result)
+        self.misses += len(texts) - len(result)
+        count("cache_hits", len(result))
+        count("cache_misses", len(texts) - len(result))
+        return result
+
+    def put_many(self, model_name, max_length, texts, scores):
+        now = time.time()
+        with timer("cache_write", items=len(scores)):
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO sentiment_cache (model, max_length, text_hash, score, last_used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(model_name, max_length, text_hash(t), float(s), now) for t, s in zip(texts, scores)],
+            )
+            self.conn.commit()
+        self._approx_count += len(scores)
+        if self._approx_count > self.max_entries:
+            self._evict()
+
+    def _evict(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM sentiment_cache").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self.conn.execute(
+                "DELETE FROM sentiment_cache WHERE rowid IN"
+                " (SELECT rowid FROM sentiment_cache ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+            self.conn.commit()
+            count -= overflow
+        self._approx_count = count
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return f"缓存命中: {self.hits}, 未命中: {self.misses} (命中率 {rate:.1f}%)"
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,168 @@
+import torch
+from tqdm import tqdm
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from instrumentation import timer
+
+# 批量情感打分，供 calc_sentiment.py / calc_report_sentiment.py / calc_fulltext_sentiment.py 共用
+# 逐行 tokenize + forward 的主要开销在调用本身，这里改为按长度分桶后批量推理
+
+MODEL_NAME = "IDEA-CCNL/Erlangshen-Roberta-110M-Sentiment"
+
+def load_model(model_name=MODEL_NAME):
+    """
+    加载 tokenizer 与分类模型 (CPU)，返回 (tokenizer, model, device)
+    """
+    device = torch.device("cpu")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).to(device)
+    model.eval()
+    return tokenizer, model, device
+
+def score_texts(texts, tokenizer, model, device, batch_size=32, max_length=128, show_progress=True,
+                cache=None, model_name=MODEL_NAME):
+    """
+    批量计算情感分 P(pos) - P(neg)
+
+    texts: list 或 pd.Series
+    - 先整体 tokenize (不 padding)，按 token 长度排序
+    - 排序后每 batch_size 条为一个桶，只 pad 到桶内最长文本
+    - 在 torch.inference_mode 下前向
+    cache: SentimentCache，命中的文本不再过模型
+    返回与输入顺序一致的 list[float]
+    """
+    texts = ["" if t is None else str(t) for t in texts]
+    if cache is None:
+        return _score_batches(texts, tokenizer, model, device, batch_size, max_length, show_progress)
+
+    cached = cache.get_many(model_name, max_length, texts)
+    miss_idx = [i for i in range(len(texts)) if i not in cached]
+    miss_texts = [texts[i] for i in miss_idx]
+    miss_scores = _score_batches(miss_texts, tokenizer, model, device, batch_size, max_length, show_progress)
+    if miss_texts:
+        cache.put_many(model_name, max_length, miss_texts, miss_scores)
+
+    scores = [cached.get(i, 0.0) for i in range(len(texts))]
+    for i, score in zip(miss_idx, miss_scores):
+        scores[i] = score
+    return scores
+
+def _score_batches(texts, tokenizer, model, device, batch_size, max_length, show_progress):
+    if not texts:
+        return []
+
+    with timer("tokenize", items=len(texts)):
+        encoded = tokenizer(texts, truncation=True, max_length=max_length)
+        features = [{key: encoded[key][i] for key in encoded.keys()} for i in range(len(texts))]
+    return _score_features(features, tokenizer, model, device, batch_size, show_progress)
+
+def _score_features(features, tokenizer, model, device, batch_size, show_progress):
+    # features: 已 tokenize 的样本列表 (每个是 {input_ids, attention_mask, ...})
+    if not features:
+        return []
+
+    # 按长度排序，长度相近的文本落在同一个桶里，padding 最少
+    order = sorted(range(len(features)), key=lambda i: len(features[i]["input_ids"]))
+    scores = [0.0] * len(features)
+
+    batches = range(0, len(order), batch_size)
+    if show_progress:
+        batches = tqdm(batches, total=(len(order) + batch_size - 1) // batch_size)
+
+    with torch.inference_mode():
+        for start in batches:
+            idx = order[start:start + batch_size]
+            # 只 pad 到本桶最长
+            with timer("pad"):
+                inputs = tokenizer.pad([features[i] for i in idx], padding=True, return_tensors="pt").to(device)
+            with timer("forward", items=len(idx)):
+                outputs = model(**inputs)
+                probs = torch.nn.functional.softmax(outputs.logits, dim=-1)
+                # Erlangshen 2 分类: Label 0: Negative, Label 1: Positive
+                batch_scores = (probs[:, 1] - probs[:, 0]).tolist()
+            for i, score in zip(idx, batch_scores):
+                scores[i] = score
+
+    return scores
+
+# 长文档聚合方式: 窗口分数 -> 文档分数
+AGGREGATORS = ("mean", "length_weighted", "first_k")
+
+def split_windows(docs, tokenizer, max_length=512, stride=64):
+    """
+    把长文本切成相互重叠的 token 窗口，每个窗口加上 [CLS]/[SEP] 后不超过 max_length
+    stride: 相邻窗口重叠的 token 数
+    返回 (窗口列表, 每个窗口所属文档下标)
+    """
+    if not docs:
+        return [], []
+    # fast tokenizer 的 overflow 机制一次性完成切窗
+    with timer("tokenize", items=len(docs)):
+        encoded = tokenizer(docs, truncation=True, max_length=max_length, stride=stride,
+                            return_overflowing_tokens=True)
+        owners = list(encoded["overflow_to_sample_mapping"])
+        keys = [key for key in encoded.keys() if key != "overflow_to_sample_mapping"]
+        windows = [{key: encoded[key][j] for key in keys} for j in range(len(owners))]
+    return windows, owners
+
+def _aggregate(scores, lengths, aggregator, first_k):
+    if aggregator == "mean":
+        return sum(scores) / len(scores)
+    if aggregator == "length_weighted":
+        return sum(s * n for s, n in zip(scores, lengths)) / sum(lengths)
+    if aggregator == "first_k":
+        head = scores[:first_k]
+        return sum(head) / len(head)
+    raise ValueError(f"未知的聚合方式: {aggregator}, 可选 {AGGREGATORS}")
+
+def document_cache_model(model_name, stride, aggregator, first_k):
+    # 长文档分数的缓存 key 需要区分切分参数与聚合方式
+    return f"{model_name}#chunk:{stride}:{aggregator}" + (f":{first_k}" if aggregator == "first_k" else "")
+
+def score_documents(docs, tokenizer, model, device, batch_size=32, max_length=512, stride=64,
+                    aggregator="mean", first_k=3, show_progress=True, cache=None, model_name=MODEL_NAME):
+    """
+    长文档分块打分
+
+    - 每篇文档切成重叠的 token 窗口 (不超过模型 512 token 上限)
+    - 所有文档的窗口合并后按长度分桶批量前向，单位 token 成本与标题打分一致
+    - 窗口分数按 aggregator 聚合成文档分数: mean / length_weighted / first_k
+    返回与输入顺序一致的 list[float]
+    """
+    if aggregator not in AGGREGATORS:
+        raise ValueError(f"未知的聚合方式: {aggregator}, 可选 {AGGREGATORS}")
+    docs = ["" if d is None else str(d) for d in docs]
+
+    cache_model = document_cache_model(model_name, stride, aggregator, first_k)
+    cached = cache.get_many(cache_model, max_length, docs) if cache is not None else {}
+    miss_idx = [i for i in range(len(docs)) if i not in cached]
+
+    windows, window_owners = split_windows([docs[i] for i in miss_idx], tokenizer, max_length, stride)
+    features = []
+    owners = []
+    taken = {}
+    for feature, j in zip(windows, window_owners):
+        i = miss_idx[j]
+        if aggregator == "first_k":
+            # first_k 只需前 k 个窗口，其余不过模型
+            if taken.get(i, 0) >= first_k:
+                continue
+            taken[i] = taken.get(i, 0) + 1
+        features.append(feature)
+        owners.append(i)
+
+    window_scores = _score_features(features, tokenizer, model, device, batch_size, show_progress)
+
+    per_doc = {}
+    for i, feature, score in zip(owners, features, window_scores):
+        scores, lengths = per_doc.setdefault(i, ([], []))
+        scores.append(score)
+        lengths.append(len(feature["input_ids"]))
+
+    result = [cached.get(i, 0.0) for i in range(len(docs))]
+    for i in miss_idx:
+        scores, lengths = per_doc[i]
+        result[i] = _aggregate(scores, lengths, aggregator, first_k)
+
+    if cache is not None and miss_idx:
+        cache.put_many(cache_model, max_length, [docs[i] for i in miss_idx], [result[i] for i in miss_idx])
+    return result
@@ -0,0 +1,427 @@
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sentiment_scoring import MODEL_NAME, score_texts, score_documents, document_cache_model
+from inference_backends import load_backend, backend_model_name
+from instrumentation import collected, merge, observe, peak_rss_bytes, prometheus_text, timer
+
+# 常驻情感打分服务 (localhost HTTP)
+# - 模型只加载一次并保持常驻，ETL 脚本不再各自付出数秒的加载开销
+# - 并发请求在 max_latency_ms 内合并成 micro-batch 一起前向
+# - 客户端 get_scorer(): 服务在线时走 HTTP，否则回退到进程内打分；workers > 1 时为多进程分片打分
+#
+# 启动: python etl/sentiment_service.py --port 8765 --backend fp32
+
+DEFAULT_URL = "http://127.0.0.1:8765"
+
+
+def load_sentiment_model(backend="fp32", model_name=MODEL_NAME):
+    """
+    加载中文情感模型，失败 (如网络问题) 返回 (None, None, None)
+    """
+    print(f"正在加载模型 {model_name} ({backend})...")
+    try:
+        return load_backend(backend, model_name)
+    except Exception as e:
+        print(f"模型加载失败 (可能是网络问题): {e}")
+        return None, None, None
+
+
+class MicroBatcher:
+    """
+    把并发到达的打分请求合并成批:
+    第一个请求到达后最多再等 max_latency_ms，或累计满 max_batch 条文本即开始推理
+    """
+
+    def __init__(self, tokenizer, model, device, model_lock, max_batch=64, max_latency_ms=20, batch_size=32):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.device = device
+        self.model_lock = model_lock
+        self.max_batch = max_batch
+        self.max_latency = max_latency_ms / 1000.0
+        self.batch_size = batch_size
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.texts = 0
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, texts, max_length):
+        req = {"texts": texts, "max_length": max_length, "done": threading.Event(), "scores": None, "error": None}
+        self.requests.put(req)
+        req["done"].wait()
+        if req["error"] is not None:
+            raise req["error"]
+        return req["scores"]
+
+    def _collect(self):
+        batch = [self.requests.get()]
+        count = len(batch[0]["texts"])
+        deadline = time.monotonic() + self.max_latency
+        while count < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                req = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(req)
+            count += len(req["texts"])
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            # 不同 max_length 的请求分开推理
+            groups = {}
+            for req in batch:
+                groups.setdefault(req["max_length"], []).append(req)
+
+            for max_length, reqs in groups.items():
+                texts = [t for req in reqs for t in req["texts"]]
+                observe("microbatch_texts", len(texts))
+                try:
+                    with self.model_lock:
+                        scores = score_texts(texts, self.tokenizer, self.model, self.device,
+                                             batch_size=self.batch_size, max_length=max_length,
+                                             show_progress=False)
+                    offset = 0
+                    for req in reqs:
+                        req["scores"] = scores[offset:offset + len(req["texts"])]
+                        offset += len(req["texts"])
+                except Exception as e:
+                    for req in reqs:
+                        req["error"] = e
+                self.batches += 1
+                self.texts += len(texts)
+                for req in reqs:
+                    req["done"].set()
+
+
+def make_handler(batcher, model_lock, info):
+    started = time.monotonic()
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _send(self, code, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, dict(info, batches=batcher.batches, texts=batcher.texts))
+            elif self.path == "/metrics":
+                # Prometheus 抓取: 启动以来各阶段 (tokenize / forward ...) 的耗时直方图
+                body = prometheus_text("sentiment_service", time.monotonic() - started, "ok",
+                                       peak_rss_bytes()).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/score":
+                    scores = batcher.submit([str(t) for t in payload["texts"]], int(payload.get("max_length", 128)))
+                elif self.path == "/score_documents":
+                    # 长文档请求本身已是整批，直接推理
+                    with model_lock:
+                        scores = score_documents(
+                            payload["docs"], batcher.tokenizer, batcher.model, batcher.device,
+                            max_length=int(payload.get("max_length", 512)),
+                            aggregator=payload.get("aggregator", "mean"),
+                            first_k=int(payload.get("first_k", 3)), show_progress=False)
+                else:
+                    self._send(404, {"error": "not found"})
+                    return
+                self._send(200, {"scores": scores})
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8765, backend="fp32", max_batch=64, max_latency_ms=20, batch_size=32):
+    tokenizer, model, device = load_sentiment_model(backend)
+    if tokenizer is None:
+        return
+    model_lock = threading.Lock()
+    batcher = MicroBatcher(tokenizer, model, device, model_lock, max_batch, max_latency_ms, batch_size)
+    info = {"model": MODEL_NAME, "backend": backend, "cache_model_name": backend_model_name(backend)}
+    server = ThreadingHTTPServer((host, port), make_handler(batcher, model_lock, info))
+    print(f"情感打分服务已启动: http://{host}:{port} (backend={backend}, "
+          f"max_batch={max_batch}, max_latency={max_latency_ms}ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# ---------------------------------------------------------------- 客户端
+
+class InProcessScorer:
+    """
+    进程内打分 (服务未启动时的回退)，模型在第一次使用时加载
+    """
+
+    def __init__(self, backend="fp32", model_name=MODEL_NAME):
+        self.backend = backend
+        self.base_model = model_name
+        self.model_name = backend_model_name(backend, model_name)
+        self._model = None
+
+    def load(self):
+        if self._model is None:
+            self._model = load_sentiment_model(self.backend, self.base_model)
+        return self._model[0] is not None
+
+    def _loaded(self):
+        if not self.load():
+            raise RuntimeError("情感模型未能加载")
+        return self._model
+
+    def score(self, texts, max_length=128, batch_size=32, cache=None, show_progress=True):
+        tokenizer, model, device = self._loaded()
+        return score_texts(texts, tokenizer, model, device, batch_size=batch_size, max_length=max_length,
+                           show_progress=show_progress, cache=cache, model_name=self.model_name)
+
+    def score_documents(self, docs, max_length=512, aggregator="mean", first_k=3, batch_size=32, cache=None):
+        tokenizer, model, device = self._loaded()
+        return score_documents(docs, tokenizer, model, device, batch_size=batch_size, max_length=max_length,
+                               aggregator=aggregator, first_k=first_k, show_progress=False,
+                               cache=cache, model_name=self.model_name)
+
+    def close(self):
+        pass
+
+
+class RemoteScorer:
+    """
+    常驻服务的 HTTP 客户端，接口与 InProcessScorer 一致
+    缓存查询在客户端完成，只把未命中的文本发给服务
+    运行中服务出错 (HTTP 500) 或下线时，改用 fallback (默认同一后端的 InProcessScorer) 继续，不再请求服务
+    """
+
+    def __init__(self, url=DEFAULT_URL, model_name=MODEL_NAME, request_size=256, timeout=600, backend="fp32",
+                 fallback=None):
+        self.url = url.rstrip("/")
+        self.model_name = model_name
+        self.request_size = request_size
+        self.timeout = timeout
+        self.backend = backend
+        self.fallback = fallback
+        self._remote = True
+
+    def load(self):
+        return True
+
+    def _post(self, path, payload):
+        if self._remote:
+            request = urllib.request.Request(self.url + path, data=json.dumps(payload).encode("utf-8"),
+                                             headers={"Content-Type": "application/json"})
+            try:
+                with timer("remote_score", items=len(payload.get("texts") or payload.get("docs") or ())):
+                    with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                        return json.loads(response.read())["scores"]
+            except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+                # HTTPError (服务返回 500) 是 URLError 的子类；连接被拒 / 断开 / 超时是 OSError
+                print(f"打分服务不可用 ({e})，改为进程内打分 (backend={self.backend})")
+                self._remote = False
+                if self.fallback is None:
+                    self.fallback = InProcessScorer(self.backend)
+                if not self.fallback.load():
+                    raise RuntimeError("情感模型未能加载") from e
+        return self._local(path, payload)
+
+    def _local(self, path, payload):
+        # 缓存仍由 _with_cache 处理，这里只对未命中的一段打分
+        if path == "/score":
+            return self.fallback.score(payload["texts"], max_length=payload["max_length"], show_progress=False)
+        return self.fallback.score_documents(payload["docs"], max_length=payload["max_length"],
+                                             aggregator=payload["aggregator"], first_k=payload["first_k"])
+
+    def _with_cache(self, items, max_length, cache, cache_model, fetch):
+        items = ["" if t is None else str(t) for t in items]
+        cached = cache.get_many(cache_model, max_length, items) if cache is not None else {}
+        miss_idx = [i for i in range(len(items)) if i not in cached]
+        miss_items = [items[i] for i in miss_idx]
+        miss_scores = []
+        for start in range(0, len(miss_items), self.request_size):
+            miss_scores.extend(fetch(miss_items[start:start + self.request_size]))
+        if cache is not None and miss_items:
+            cache.put_many(cache_model, max_length, miss_items, miss_scores)
+        scores = [cached.get(i, 0.0) for i in range(len(items))]
+        for i, score in zip(miss_idx, miss_scores):
+            scores[i] = score
+        return scores
+
+    def score(self, texts, max_length=128, batch_size=32, cache=None, show_progress=True):
+        return self._with_cache(texts, max_length, cache, self.model_name,
+                                lambda chunk: self._post("/score", {"texts": chunk, "max_length": max_length}))
+
+    def score_documents(self, docs, max_length=512, aggregator="mean", first_k=3, batch_size=32, cache=None):
+        # 与 score_documents 的缓存 key 保持一致 (服务端使用默认切窗重叠 64)
+        cache_model = document_cache_model(self.model_name, 64, aggregator, first_k)
+        payload = {"max_length": max_length, "aggregator": aggregator, "first_k": first_k}
+        return self._with_cache(docs, max_length, cache, cache_model,
+                                lambda chunk: self._post("/score_documents", dict(payload, docs=chunk)))
+
+    def close(self):
+        pass
+
+
+# 分片打分的工作进程状态: (tokenizer, model, device)，每个进程只加载一次
+_WORKER_MODEL = None
+
+
+def _init_worker(backend, model_name, threads):
+    global _WORKER_MODEL
+    import torch
+    # 每个进程固定线程预算，避免 N 个进程各开满核心数的线程互相争抢
+    torch.set_num_threads(threads)
+    if _WORKER_MODEL is None:
+        # spawn 启动的进程没有继承父进程的模型，在这里各自加载
+        _WORKER_MODEL = load_backend(backend, model_name, intra_op_threads=threads, inter_op_threads=1)
+
+
+def _score_items(kind, items, kwargs):
+    tokenizer, model, device = _WORKER_MODEL
+    if kind == "documents":
+        return score_documents(items, tokenizer, model, device, show_progress=False, **kwargs)
+    return score_texts(items, tokenizer, model, device, show_progress=False, **kwargs)
+
+
+def _score_shard(task):
+    # 返回 (分数, 本分片的阶段指标)，指标在父进程合并
+    return collected(_score_items, *task)
+
+
+class ShardedScorer:
+    """
+    多进程分片打分，接口与 InProcessScorer 一致
+    - 未命中缓存的文本按行切成分片 (每片不超过 shard_size 条)，分发给 workers 个进程，结果按原顺序合并
+    - 每个进程 torch.set_num_threads(threads_per_worker)，默认按 CPU 核数平均分配
+    - Linux 上 fp32 / int8 后端: 父进程加载一次模型后 fork，各进程以写时复制方式共享同一份权重
+      (推理不写权重，物理内存中只有一份)；onnx 后端或不支持 fork 的平台用 spawn，各进程自行加载
+    短标题 (128 token) 的单次前向很小，单进程多线程的并行效率低，多进程按行切分可接近线性扩展
+    """
+
+    def __init__(self, backend="fp32", workers=None, threads_per_worker=None, model_name=MODEL_NAME,
+                 shard_size=256):
+        self.backend = backend
+        self.base_model = model_name
+        self.model_name = backend_model_name(backend, model_name)
+        self.workers = workers or os.cpu_count() or 1
+        self.threads = threads_per_worker or max(1, (os.cpu_count() or 1) // self.workers)
+        self.shard_size = shard_size
+        self._pool = None
+
+    def load(self):
+        global _WORKER_MODEL
+        if self._pool is not None:
+            return True
+        fork = self.backend != "onnx" and "fork" in multiprocessing.get_all_start_methods()
+        if fork:
+            # 在父进程中加载 (不做推理)，fork 出的进程直接继承
+            _WORKER_MODEL = load_sentiment_model(self.backend, self.base_model)
+            if _WORKER_MODEL[0] is None:
+                _WORKER_MODEL = None
+                return False
+        context = multiprocessing.get_context("fork" if fork else "spawn")
+        print(f"分片打分: {self.workers} 个进程 × {self.threads} 线程 ({'fork 共享权重' if fork else 'spawn'})")
+        self._pool = context.Pool(self.workers, initializer=_init_worker,
+                                  initargs=(self.backend, self.base_model, self.threads))
+        return True
+
+    def _sharded(self, kind, items, max_length, cache, cache_model, **kwargs):
+        if not self.load():
+            raise RuntimeError("情感模型未能加载")
+        items = ["" if t is None else str(t) for t in items]
+        cached = cache.get_many(cache_model, max_length, items) if cache is not None else {}
+        miss_idx = [i for i in range(len(items)) if i not in cached]
+        miss_items = [items[i] for i in miss_idx]
+        # 分片数至少为进程数，保证小文件也能用满所有进程
+        size = max(1, min(self.shard_size, -(-len(miss_items) // self.workers)))
+        tasks = [(kind, miss_items[start:start + size], dict(kwargs, max_length=max_length))
+                 for start in range(0, len(miss_items), size)]
+        miss_scores = []
+        for shard, snapshot in self._pool.map(_score_shard, tasks, chunksize=1):
+            miss_scores.extend(shard)
+            merge(snapshot)
+        if cache is not None and miss_items:
+            cache.put_many(cache_model, max_length, miss_items, miss_scores)
+        scores = [cached.get(i, 0.0) for i in range(len(items))]
+        for i, score in zip(miss_idx, miss_scores):
+            scores[i] = score
+        return scores
+
+    def score(self, texts, max_length=128, batch_size=32, cache=None, show_progress=True):
+        return self._sharded("texts", texts, max_length, cache, self.model_name, batch_size=batch_size)
+
+    def score_documents(self, docs, max_length=512, aggregator="mean", first_k=3, batch_size=32, cache=None):
+        cache_model = document_cache_model(self.model_name, 64, aggregator, first_k)
+        return self._sharded("documents", docs, max_length, cache, cache_model, batch_size=batch_size,
+                             aggregator=aggregator, first_k=first_k)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+def server_info(url=DEFAULT_URL, timeout=0.5):
+    try:
+        with urllib.request.urlopen(url.rstrip("/") + "/health", timeout=timeout) as response:
+            return json.loads(response.read())
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+
+
+def get_scorer(backend="fp32", url=DEFAULT_URL, workers=1):
+    """
+    服务在线且后端一致时返回 RemoteScorer，否则 workers > 1 时返回 ShardedScorer，
+    其余回退到 InProcessScorer
+    """
+    info = server_info(url)
+    if info is not None and info.get("backend") == backend:
+        print(f"使用常驻打分服务: {url} (backend={backend})")
+        return RemoteScorer(url, model_name=info["cache_model_name"], backend=backend)
+    if workers > 1:
+        return ShardedScorer(backend, workers)
+    return InProcessScorer(backend)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="常驻情感打分服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--backend", default="fp32", choices=["fp32", "int8", "onnx"])
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-latency-ms", type=float, default=20)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.backend, args.max_batch, args.max_latency_ms, args.batch_size)
@@ -0,0 +1,244 @@
+import difflib
+import re
+import unicodedata
+import numpy as np
+import pandas as pd
+from instrumentation import timer
+
+# 打分前的重复 / 近似重复文本合并 (calc_sentiment.py / calc_report_sentiment.py 共用)
+# 同一条新闻常以略有不同的标题出现多次，同一业绩事件的研报标题也几乎相同，每条都过模型是浪费:
+# 1. 精确去重: 归一化 (NFKC、小写、去掉标点与空白) 后完全相同的文本为一组 (哈希分组)
+# 2. 近似去重: 对每组的代表文本做字符 n-gram MinHash 签名，LSH 分桶找候选对，
+#    签名估计的 Jaccard 相似度不低于 threshold 的候选对连成一簇 (连通分量)
+# 3. 近似对中两条文本不同的字落在情感极性词上 (上调 / 下调、买入 / 卖出 ...) 时不合并
+# 每簇只把第一条文本送入模型，分数复制给簇内全部行
+# 全程 numpy 向量化，按块计算签名，百万行量级可用
+#
+# 注意: 中文短标题改一两个字就可能情绪相反 (如 "上调" / "下调")，字符 n-gram 的 Jaccard 仍在 0.9 左右，
+# 提高 threshold 无法区分，只能靠第 3 步的极性词检查；打分脚本默认 threshold=None (只做精确去重)，
+# 近似去重需显式开启 (--near-dedup)
+
+NGRAM = 2
+NUM_PERM = 64
+BANDS = 16
+THRESHOLD = 0.85
+
+# 每块计算签名的文本数 (控制中间数组的内存)
+_SIGNATURE_CHUNK = 100000
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+# 情感极性词: 近似对的差异落在这些词上时视为不同文本 (检查的是归一化后的 key，均为小写)
+POLARITY_TERMS = (
+    "上调", "下调", "调升", "调降", "上修", "下修", "提高", "降低", "上升", "下降", "上涨", "下跌",
+    "买入", "卖出", "买进", "增持", "减持", "强烈推荐", "推荐", "谨慎推荐", "中性", "回避", "审慎",
+    "优于大市", "弱于大市", "跑赢", "跑输", "看多", "看空", "看好", "看淡", "利好", "利空",
+    "增长", "下滑", "增加", "减少", "扩大", "收窄", "盈利", "亏损", "扭亏", "转亏", "预增", "预减",
+    "预盈", "预亏", "超预期", "不及预期", "低于预期", "高于预期", "好于预期", "涨停", "跌停",
+    "增", "减", "涨", "跌", "升", "降", "盈", "亏", "多", "空", "买", "卖", "不", "未", "无",
+)
+_POLARITY = re.compile("|".join(sorted(map(re.escape, POLARITY_TERMS), key=len, reverse=True)))
+
+def dedup_key(text):
+    """
+    精确去重的 key: NFKC 归一化后小写，去掉标点、符号与空白
+    """
+    # 先去掉标点 (多为全角)，剩下的文字大多已是 NFKC 形式，normalize 走快速路径
+    text = _NON_WORD.sub("", "" if text is None else str(text))
+    return _NON_WORD.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+def _shingle_hashes(keys, ngram):
+    # 所有文本的字符拼成一个码点数组，每个文本后补 ngram-1 个 0，n-gram 窗口不会跨越文本
+    lengths = np.fromiter((len(k) for k in keys), dtype=np.int64, count=len(keys))
+    pad = "\0" * (ngram - 1)
+    codepoints = np.frombuffer((pad.join(keys) + pad).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    n_windows = len(codepoints) - ngram + 1
+    hashes = np.zeros(n_windows, dtype=np.uint64)
+    for j in range(ngram):
+        hashes = hashes * np.uint64(0x100000001B3) + codepoints[j:j + n_windows]
+
+    # 每个文本的 n-gram 个数 (短于 ngram 的文本整体作为一个 n-gram)
+    counts = np.maximum(lengths - ngram + 1, 1)
+    starts = np.concatenate(([0], np.cumsum(lengths + ngram - 1)[:-1]))
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    positions = np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+    return hashes[positions], offsets
+
+
+def minhash_signatures(keys, ngram=NGRAM, num_perm=NUM_PERM, seed=0):
+    """
+    keys: 非空字符串列表，返回 (len(keys), num_perm) 的 uint32 MinHash 签名
+    哈希族为 multiply-shift: (a * x + b) >> 32，a 为随机奇数
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+    signatures = np.empty((len(keys), num_perm), dtype=np.uint32)
+    for start in range(0, len(keys), _SIGNATURE_CHUNK):
+        shingles, offsets = _shingle_hashes(keys[start:start + _SIGNATURE_CHUNK], ngram)
+        block = signatures[start:start + _SIGNATURE_CHUNK]
+        for k in range(num_perm):
+            permuted = ((shingles * a[k] + b[k]) >> np.uint64(32)).astype(np.uint32)
+            block[:, k] = np.minimum.reduceat(permuted, offsets)
+    return signatures
+
+
+def _candidate_pairs(signatures, bands):
+    # LSH: 每个 band 的签名片段相同的文本落入同一个桶，桶内每个成员与桶内第一个成员组成候选对
+    n, num_perm = signatures.shape
+    rows = num_perm // bands
+    mix = np.random.default_rng(1).integers(1, 1 << 63, rows, dtype=np.uint64)
+    index = np.arange(n)
+    left, right = [], []
+    for band in range(bands):
+        part = signatures[:, band * rows:(band + 1) * rows].astype(np.uint64)
+        bucket = (part * mix).sum(axis=1)
+        _, first, inverse = np.unique(bucket, return_index=True, return_inverse=True)
+        head = first[inverse.ravel()]
+        candidates = np.nonzero(head != index)[0]
+        left.append(candidates)
+        right.append(head[candidates])
+    left = np.concatenate(left)
+    right = np.concatenate(right)
+    if len(left) == 0:
+        return left, right
+    # 多个 band 给出的同一对只保留一次 (排序去重比 np.unique 的哈希实现快)
+    pairs = np.sort(left.astype(np.int64) * n + right)
+    pairs = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))]
+    return pairs // n, pairs % n
+
+
+def _verified(signatures, left, right, threshold, chunk=200000):
+    # 签名中相同位置取值相等的比例是 Jaccard 相似度的无偏估计，过滤 LSH 的误报
+    keep = np.empty(len(left), dtype=bool)
+    for start in range(0, len(left), chunk):
+        l = left[start:start + chunk]
+        r = right[start:start + chunk]
+        keep[start:start + chunk] = (signatures[l] == signatures[r]).mean(axis=1) >= threshold
+    return left[keep], right[keep]
+
+
+def _touches(spans, start, end):
+    # [start, end) 与极性词出现位置是否相交；插入点 (start == end) 落在词内部也算
+    for s, e in spans:
+        if s < end and e > start or start == end and s < start < e:
+            return True
+    return False
+
+
+def polarity_conflict(a, b):
+    """
+    两个归一化 key 不同的字是否落在情感极性词上 (如 "上调" / "下调"、"买入" / "卖出")
+    """
+    spans_a = [m.span() for m in _POLARITY.finditer(a)]
+    spans_b = [m.span() for m in _POLARITY.finditer(b)]
+    if not spans_a and not spans_b:
+        return False
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag != "equal" and (_touches(spans_a, i1, i2) or _touches(spans_b, j1, j2)):
+            return True
+    return False
+
+
+def _polarity_filtered(keys, left, right):
+    # 只检查通过相似度验证的候选对 (数量远小于文本数)
+    keep = np.fromiter((not polarity_conflict(keys[l], keys[r]) for l, r in zip(left, right)),
+                       dtype=bool, count=len(left))
+    return left[keep], right[keep]
+
+
+def _components(n, left, right):
+    # 连通分量: 标签取分量内最小下标 (最小标签传播 + 指针跳跃)，即簇内第一条文本
+    labels = np.arange(n)
+    while True:
+        previous = labels
+        low = np.minimum(labels[left], labels[right])
+        labels = labels.copy()
+        np.minimum.at(labels, left, low)
+        np.minimum.at(labels, right, low)
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+        if np.array_equal(labels, previous):
+            return labels
+
+
+def collapse_duplicates(texts, threshold=THRESHOLD, ngram=NGRAM, num_perm=NUM_PERM, bands=BANDS, seed=0):
+    """
+    返回 (representative, stats)
+    representative[i]: 第 i 行所在簇的代表行下标 (簇内第一行)
+    stats: rows / exact_groups / clusters / saved (省下的模型调用比例)
+    """
+    with timer("dedup", items=len(texts)):
+        return _collapse(texts, threshold, ngram, num_perm, bands, seed)
+
+
+def _collapse(texts, threshold, ngram, num_perm, bands, seed):
+    keys = [dedup_key(t) for t in texts]
+    groups, uniques = pd.factorize(pd.Series(keys, dtype=object))
+    n_groups = len(uniques)
+    # 每个精确组的第一行
+    first_row = np.full(n_groups, len(keys), dtype=np.int64)
+    np.minimum.at(first_row, groups, np.arange(len(keys)))
+
+    cluster = np.arange(n_groups)
+    if threshold is not None and n_groups > 1:
+        # 归一化后为空的文本只参与精确去重
+        valid = np.nonzero(np.fromiter((len(k) > 0 for k in uniques), dtype=bool, count=n_groups))[0]
+        valid_keys = [uniques[i] for i in valid]
+        signatures = minhash_signatures(valid_keys, ngram, num_perm, seed)
+        left, right = _candidate_pairs(signatures, bands)
+        left, right = _verified(signatures, left, right, threshold)
+        left, right = _polarity_filtered(valid_keys, left, right)
+        cluster[valid] = valid[_components(len(valid), left, right)]
+
+    representative = first_row[cluster[groups]]
+    # 每簇的标签是簇内最小下标，标签等于自身下标的即为簇
+    n_clusters = int(np.count_nonzero(cluster == np.arange(n_groups)))
+    stats = {
+        "rows": len(keys),
+        "exact_groups": n_groups,
+        "clusters": n_clusters,
+        "saved": 1 - n_clusters / len(keys) if len(keys) else 0.0,
+    }
+    return representative, stats
+
+
+def score_collapsed(scorer, texts, threshold=None, **score_kwargs):
+    """
+    去重后打分: 每簇只把代表文本交给 scorer.score，分数复制给簇内所有行
+    threshold=None (默认) 只合并归一化后完全相同的文本
+    返回 (与 texts 等长的分数列表, stats)
+    """
+    if len(texts) == 0:
+        return [], {"rows": 0, "exact_groups": 0, "clusters": 0, "saved": 0.0}
+    representative, stats = collapse_duplicates(texts, threshold)
+    # 代表行的代表是它自己
+    rows = np.flatnonzero(representative == np.arange(len(texts)))
+    rep_scores = np.empty(len(texts), dtype=np.float64)
+    rep_scores[rows] = scorer.score([texts[i] for i in rows], **score_kwargs)
+    return rep_scores[representative].tolist(), stats
+
+
+class DedupReport:
+    """
+    多个文件的去重统计汇总
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.exact_groups = 0
+        self.clusters = 0
+
+    def add(self, stats):
+        self.rows += stats["rows"]
+        self.exact_groups += stats["exact_groups"]
+        self.clusters += stats["clusters"]
+
+    def summary(self):
+        saved = 1 - self.clusters / self.rows if self.rows else 0.0
+        return (f"去重: {self.rows} 行 -> 精确去重后 {self.exact_groups} -> 近似聚类后 {self.clusters}"
+                f" (节省模型调用 {saved * 100:.1f}%)")
@@ -0,0 +1,239 @@
+import argparse
+import itertools
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from etl.datastore import list_symbols
+from backtest_engine import INITIAL_CAPITAL
+from backtest_metrics import compute_metrics
+from portfolio_backtest import aggregate_portfolio, load_universe, synthetic_universe
+from etl.instrumentation import collected, merge, run_metrics, timer
+from SentimentAlphaStrategy.signal_fusion import DEFAULT_PARAMS, moving_average, panel_positions, tech_signal_from_ma
+
+# 信号融合参数的并行扫描 (网格 / 随机搜索)
+# - 价格与情感面板只加载一次，日收益和各组 MA 窗口的技术信号在主进程算好后放入共享内存，
+#   工作进程直接挂载，不复制数据
+# - 只依赖 MA 窗口的技术信号按 (ma_short, ma_long) 计算一次，被其余所有参数组合复用
+# - 每组参数在全部股票上跑组合回测 (portfolio_backtest)，结果按收益 / Sharpe / 回撤排名
+#
+# 运行: python param_sweep.py                                   (默认网格)
+#       python param_sweep.py --grid '{"decay_factor": [0.8, 0.9, 0.95], "ma_long": [20, 30]}'
+#       python param_sweep.py --random 200 --grid '{"decay_factor": [0.7, 0.99], "ma_short": [3, 10]}'
+
+PARAM_NAMES = ("decay_factor", "strong_buy", "tech_floor", "hold_threshold", "ma_short", "ma_long")
+INT_PARAMS = ("ma_short", "ma_long")
+
+DEFAULT_GRID = {
+    "decay_factor": [0.8, 0.9, 0.95],
+    "strong_buy": [0.7, 0.8, 0.9],
+    "tech_floor": [-0.4, -0.2, 0.0],
+    "hold_threshold": [0.3, 0.5, 0.7],
+    "ma_short": [5, 10],
+    "ma_long": [20, 30],
+}
+
+# 工作进程中挂载的共享数组
+_SHARED = {}
+
+
+def grid_combinations(grid):
+    """
+    网格: {参数: [取值, ...]}，未给出的参数取默认值
+    """
+    grid = {name: list(grid.get(name, [DEFAULT_PARAMS[name]])) for name in PARAM_NAMES}
+    combos = [dict(zip(PARAM_NAMES, values)) for values in itertools.product(*grid.values())]
+    return [c for c in combos if c["ma_short"] < c["ma_long"]]
+
+
+def random_combinations(spec, n_samples, seed=0):
+    """
+    随机搜索: {参数: [下限, 上限]}，窗口参数取整数，其余均匀分布；未给出的参数取默认值
+    取值列表按 (最小值, 最大值) 作为区间，网格 (如 DEFAULT_GRID) 可直接用作随机搜索的范围
+    """
+    bounds = {name: (min(values), max(values)) for name, values in spec.items()}
+    rng = np.random.default_rng(seed)
+    combos = []
+    attempts = 0
+    while len(combos) < n_samples and attempts < n_samples * 20:
+        attempts += 1
+        combo = {}
+        for name in PARAM_NAMES:
+            if name not in bounds:
+                combo[name] = DEFAULT_PARAMS[name]
+            elif name in INT_PARAMS:
+                combo[name] = int(rng.integers(int(bounds[name][0]), int(bounds[name][1]) + 1))
+            else:
+                combo[name] = float(rng.uniform(*bounds[name]))
+        if combo["ma_short"] < combo["ma_long"]:
+            combos.append(combo)
+    return combos
+
+
+def _to_shared(array):
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    view[:] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _attach(spec):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def _init_worker(specs):
+    for key, spec in specs.items():
+        _SHARED[key] = _attach(spec)
+
+
+def _run_combos(window_key, combos, max_weight, cost_rate, block_size):
+    # 同一 MA 窗口的参数组合共享一份技术信号
+    new_sentiment = _SHARED["new_sentiment"][1]
+    returns = _SHARED["returns"][1]
+    tradable = _SHARED["tradable"][1]
+    tech = _SHARED[window_key][1]
+    n_symbols = returns.shape[1]
+
+    rows = []
+    for combo in combos:
+        with timer("signals", items=new_sentiment.size):
+            position = panel_positions(new_sentiment, tech, combo["decay_factor"], combo["strong_buy"],
+                                       combo["tech_floor"], combo["hold_threshold"])
+            # 没有价格的 (日期, 股票) 不持仓 (见 portfolio_backtest.tradable_positions)
+            position = position * tradable
+        with timer("backtest", items=position.size):
+            held_return_sum = np.zeros(returns.shape[0])
+            for start in range(0, n_symbols, block_size):
+                held_return_sum += (returns[:, start:start + block_size]
+                                    * position[:, start:start + block_size]).sum(axis=1)
+            result = aggregate_portfolio(position, held_return_sum, max_weight, INITIAL_CAPITAL, cost_rate,
+                                         block_size)
+            metrics = compute_metrics(np.concatenate(([INITIAL_CAPITAL], result["equity"]))).iloc[0]
+        rows.append(dict(combo, **metrics.drop("hit_rate").to_dict(),
+                         avg_exposure=result["exposure"].mean(), avg_turnover=result["turnover"].mean()))
+    return rows
+
+
+def _window_signals(close, windows, pairs, block_size):
+    """
+    每个 MA 窗口只算一次均线，再组合出每个 (short, long) 的技术信号 (int8)
+    按股票分块计算，均线不需要整块常驻内存
+    """
+    n_days, n_symbols = close.shape
+    tech = {pair: np.zeros((n_days, n_symbols), dtype=np.int8) for pair in pairs}
+    for start in range(0, n_symbols, block_size):
+        prices = close[:, start:start + block_size]
+        ma = {w: moving_average(prices, w) for w in windows}
+        for short, long in pairs:
+            tech[(short, long)][:, start:start + block_size] = tech_signal_from_ma(ma[short], ma[long])
+    return tech
+
+
+def rank_results(rows):
+    df = pd.DataFrame(rows)
+    df["rank_return"] = df["total_return"].rank(ascending=False, method="min").astype(int)
+    df["rank_sharpe"] = df["sharpe"].rank(ascending=False, method="min").astype(int)
+    # 回撤为负数，越接近 0 越好
+    df["rank_drawdown"] = df["max_drawdown"].rank(ascending=False, method="min").astype(int)
+    return df
+
+
+def run_sweep(close, new_sentiment, combos, max_workers=None, max_weight=0.15, cost_rate=0.0,
+              block_size=1000, chunk_size=4):
+    """
+    close / new_sentiment: (T, N) 面板，combos: 参数组合列表
+    返回排名后的结果 DataFrame (按 Sharpe 排序)
+    """
+    close = np.asarray(close, dtype=np.float64)
+    pairs = sorted({(c["ma_short"], c["ma_long"]) for c in combos})
+    windows = sorted({w for pair in pairs for w in pair})
+
+    arrays = {
+        "tradable": ~np.isnan(close),
+        "new_sentiment": np.asarray(new_sentiment, dtype=np.float64),
+        "returns": np.nan_to_num(pd.DataFrame(close).pct_change().to_numpy(), nan=0.0),
+    }
+    with timer("indicators", items=close.size):
+        tech_signals = _window_signals(close, windows, pairs, block_size)
+    for (short, long), tech in tech_signals.items():
+        arrays[f"tech_{short}_{long}"] = tech
+    del tech_signals
+
+    shared = {}
+    specs = {}
+    try:
+        for key, array in arrays.items():
+            shared[key], specs[key] = _to_shared(array)
+        del arrays
+
+        # 按 MA 窗口分组后切成小任务，便于负载均衡
+        tasks = []
+        for short, long in pairs:
+            group = [c for c in combos if (c["ma_short"], c["ma_long"]) == (short, long)]
+            for start in range(0, len(group), chunk_size):
+                tasks.append((f"tech_{short}_{long}", group[start:start + chunk_size]))
+
+        rows = []
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(specs,)) as pool:
+            # 工作进程内的分阶段计时随结果带回
+            futures = [pool.submit(collected, _run_combos, key, group, max_weight, cost_rate, block_size)
+                       for key, group in tasks]
+            for i, future in enumerate(as_completed(futures), 1):
+                task_rows, snapshot = future.result()
+                rows.extend(task_rows)
+                merge(snapshot)
+                print(f"  进度: {i}/{len(futures)} 个任务, {len(rows)}/{len(combos)} 组参数", end="\r")
+        print()
+    finally:
+        for shm in shared.values():
+            shm.close()
+            shm.unlink()
+
+    return rank_results(rows).sort_values("sharpe", ascending=False).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="信号融合参数扫描")
+    parser.add_argument("--grid", default=None, help="JSON: 网格 {参数: [取值]}，随机搜索时为 {参数: [下限, 上限]} (默认网格的最小 / 最大值)")
+    parser.add_argument("--random", type=int, default=0, help="随机搜索的采样数 (0 为网格搜索)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sentiment", default="report", choices=["report", "fulltext", "news"],
+                        help="情感因子来源 (etl/align_sentiment.py 对齐后的列)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-weight", type=float, default=0.15)
+    parser.add_argument("--cost", type=float, default=0.0)
+    parser.add_argument("--synthetic", type=int, default=0, help="使用 N 只股票的合成数据")
+    parser.add_argument("--days", type=int, default=2500)
+    parser.add_argument("--output", default="backtest_results/param_sweep.csv")
+    args = parser.parse_args()
+
+    spec = json.loads(args.grid) if args.grid else DEFAULT_GRID
+    if args.random:
+        combos = random_combinations(spec, args.random, args.seed)
+    else:
+        combos = grid_combinations(spec)
+
+    with run_metrics("param_sweep"):
+        with timer("load"):
+            if args.synthetic:
+                dates, symbols, close, new_sentiment = synthetic_universe(args.synthetic, args.days)
+            else:
+                dates, symbols, close, new_sentiment = load_universe(list_symbols("equity_daily"), args.sentiment)
+        print(f"参数扫描: {len(combos)} 组参数, {len(symbols)} 只股票 × {len(dates)} 个交易日")
+
+        start = time.perf_counter()
+        with timer("sweep", items=len(combos)):
+            df = run_sweep(close, new_sentiment, combos, max_workers=args.workers,
+                           max_weight=args.max_weight, cost_rate=args.cost)
+        print(f"  耗时: {time.perf_counter() - start:.1f}s")
+
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+        with timer("csv_write", items=len(df)):
+            df.to_csv(args.output, index=False)
+        print(df.head(10).to_string(index=False))
+        print(f"结果已保存至 {args.output}")
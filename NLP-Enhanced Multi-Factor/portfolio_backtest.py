@@ -0,0 +1,188 @@
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+from etl.datastore import list_symbols, load_panel
+from backtest_engine import INITIAL_CAPITAL
+from SentimentAlphaStrategy.signal_fusion import DEFAULT_PARAMS, moving_average, panel_positions, tech_signal_from_ma
+from backtest_metrics import compute_metrics
+from etl.instrumentation import run_metrics, timer
+
+# 组合回测 (日期 × 股票 面板)
+# run_strategy_local.py / strategy_mock.py 对每只股票单独回测、各自 10000 资金；
+# 这里所有股票共享一个账户:
+# - 每只股票的持仓信号与单股引擎 (backtest_engine) 完全相同 (舆情衰减 + MA 技术面融合，
+#   规则与均线见 SentimentAlphaStrategy/signal_fusion.py 的面板批量模式)
+# - 每日调仓: 所有持仓信号为 1 的股票等权，单只权重上限 max_weight
+#   (当日没有价格的股票 — 未上市 / 停牌 / 超出数据区间 — 不计入持仓，不占权重)
+#   (对应 SentimentAlphaStrategy 中的 SetHoldings(stock, 0.15))，剩余为现金
+# - 收益口径与单股引擎一致: 当日信号 × 当日收益
+# 股票按 block_size 分块计算信号，每块只保留按日汇总的向量，内存占用与全市场规模解耦
+#
+# 运行: python portfolio_backtest.py              (数据仓库中全部股票)
+#       python portfolio_backtest.py --synthetic 5000 --days 2500   (合成数据测速)
+
+
+def block_signals(close, new_sentiment, **params):
+    """
+    一块股票的 (持仓矩阵, 日收益矩阵)，close / new_sentiment 为 (T, N)
+    """
+    p = dict(DEFAULT_PARAMS, **params)
+    short_ma = moving_average(close, p["ma_short"])
+    long_ma = moving_average(close, p["ma_long"])
+    returns = np.nan_to_num(pd.DataFrame(close).pct_change().to_numpy(), nan=0.0)
+    tech = tech_signal_from_ma(short_ma, long_ma)
+    position = panel_positions(new_sentiment, tech, p["decay_factor"], p["strong_buy"],
+                               p["tech_floor"], p["hold_threshold"])
+    return tradable_positions(position, close), returns
+
+
+def tradable_positions(position, close):
+    """
+    收盘价为 NaN 的 (日期, 股票) 不可交易，持仓置 0:
+    强情绪分支可能在没有价格的日子给出持仓 1，不屏蔽的话会以 0 收益占去 1/n 权重，稀释真实持仓
+    """
+    return position * ~np.isnan(close)
+
+
+def aggregate_portfolio(position, held_return_sum, max_weight=0.15, initial_capital=INITIAL_CAPITAL,
+                        cost_rate=0.0, block_size=1000, prev_position=None, prev_weight=0.0):
+    """
+    由持仓矩阵与按日汇总的持仓收益和 (sum_i position * return) 计算组合净值
+    prev_position / prev_weight: 分段计算时上一段最后一天的持仓与单只权重 (用于首日换手)
+    """
+    n_days, n_symbols = position.shape
+    n_held = position.sum(axis=1, dtype=np.int64)
+    # 等权 1/n，单只不超过 max_weight
+    weight = np.where(n_held > 0, np.minimum(1.0 / np.maximum(n_held, 1), max_weight), 0.0)
+    gross_returns = weight * held_return_sum
+
+    # 换手: 每只股票的权重变化之和，按块计算避免生成 (T, N) 浮点矩阵
+    turnover = np.zeros(n_days)
+    if prev_position is None:
+        prev_position = np.zeros(n_symbols, dtype=np.int8)
+    prev_weight = np.concatenate(([prev_weight], weight[:-1]))
+    for start in range(0, n_symbols, block_size):
+        block = position[:, start:start + block_size]
+        prev_block = np.vstack([prev_position[None, start:start + block_size], block[:-1]])
+        turnover += np.abs(block * weight[:, None] - prev_block * prev_weight[:, None]).sum(axis=1)
+
+    returns = gross_returns - cost_rate * turnover
+    equity = np.multiply.accumulate(np.concatenate(([initial_capital], 1.0 + returns)))[1:]
+    return {
+        "equity": equity,
+        "returns": returns,
+        "n_held": n_held,
+        "weight": weight,
+        "exposure": weight * n_held,
+        "turnover": turnover,
+        "position": position,
+    }
+
+
+def run_portfolio_backtest(close, new_sentiment, max_weight=0.15, initial_capital=INITIAL_CAPITAL,
+                           cost_rate=0.0, block_size=1000, **params):
+    """
+    close / new_sentiment: (T, N) 矩阵 (按交易日对齐，缺失价格为 NaN，无新消息为 NaN)
+    max_weight: 单只股票权重上限
+    cost_rate: 按换手收取的单边交易成本 (例如 0.0005)
+    返回 dict:
+      equity (T,) 组合净值、returns (T,) 组合日收益、n_held (T,) 持仓股票数、
+      weight (T,) 每只持仓股票的权重、exposure (T,) 总仓位、turnover (T,) 日换手、
+      position (T, N) int8 持仓矩阵
+    """
+    close = np.asarray(close, dtype=np.float64)
+    new_sentiment = np.asarray(new_sentiment, dtype=np.float64)
+    n_days, n_symbols = close.shape
+
+    position = np.zeros((n_days, n_symbols), dtype=np.int8)
+    held_return_sum = np.zeros(n_days)
+    for start in range(0, n_symbols, block_size):
+        end = min(start + block_size, n_symbols)
+        block_pos, block_ret = block_signals(close[:, start:end], new_sentiment[:, start:end], **params)
+        position[:, start:end] = block_pos
+        held_return_sum += (block_ret * block_pos).sum(axis=1)
+
+    return aggregate_portfolio(position, held_return_sum, max_weight, initial_capital, cost_rate, block_size)
+
+
+def load_universe(symbols=None, source="report", start=None, end=None):
+    """
+    从数据仓库读取对齐的面板: 返回 (dates, symbols, close (T, N), new_sentiment (T, N))
+    source: 情感因子列 (report / fulltext / news)，读取 etl/align_sentiment.py 预先对齐到交易日的因子，无消息为 NaN
+    """
+    prices = load_panel("equity_daily", symbols, columns=["close"], start=start, end=end)
+    close = prices.pivot_table(index="date", columns="symbol", values="close", aggfunc="last").sort_index()
+    factor = load_panel("sentiment_factor", list(close.columns), columns=[source], start=start, end=end)
+    if factor.empty:
+        print("  [WARNING] 没有对齐的情感因子，请先运行 python etl/align_sentiment.py")
+    factor = factor.dropna(subset=[source])
+    daily = factor.pivot_table(index="date", columns="symbol", values=source, aggfunc="last")
+    new_sentiment = daily.reindex(index=close.index, columns=close.columns)
+    return close.index, list(close.columns), close.to_numpy(dtype=np.float64), new_sentiment.to_numpy(dtype=np.float64)
+
+
+def synthetic_universe(n_symbols=5000, n_days=2500, event_rate=0.02, seed=0):
+    """
+    合成面板 (随机游走价格 + 稀疏研报事件)，用于全市场规模测速
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2015-01-05", periods=n_days)
+    log_ret = rng.normal(0, 0.02, (n_days, n_symbols)).astype(np.float64)
+    close = 10 * np.exp(np.cumsum(log_ret, axis=0))
+    events = rng.random((n_days, n_symbols)) < event_rate
+    new_sentiment = np.where(events, rng.uniform(-1, 1, (n_days, n_symbols)), np.nan)
+    symbols = [f"{i:06d}" for i in range(n_symbols)]
+    return dates, symbols, close, new_sentiment
+
+
+def print_summary(dates, result, initial_capital=INITIAL_CAPITAL):
+    m = compute_metrics(np.concatenate(([initial_capital], result["equity"]))).iloc[0]
+    print(f"  区间: {dates[0]} ~ {dates[-1]} ({len(dates)} 个交易日)")
+    print(f"  组合收益: {m['total_return']:.2%}, 年化: {m['cagr']:.2%}, Sharpe: {m['sharpe']:.2f}, "
+          f"Sortino: {m['sortino']:.2f}, 最大回撤: {m['max_drawdown']:.2%} ({int(m['max_drawdown_days'])} 天)")
+    print(f"  平均持仓数: {result['n_held'].mean():.1f}, 平均仓位: {result['exposure'].mean():.2%}, "
+          f"日均换手: {result['turnover'].mean():.2%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="组合 (面板) 回测")
+    parser.add_argument("--sentiment", default="report", choices=["report", "fulltext", "news"],
+                        help="情感因子来源 (etl/align_sentiment.py 对齐后的列)")
+    parser.add_argument("--max-weight", type=float, default=0.15)
+    parser.add_argument("--cost", type=float, default=0.0)
+    parser.add_argument("--synthetic", type=int, default=0, help="使用 N 只股票的合成数据测速")
+    parser.add_argument("--days", type=int, default=2500)
+    args = parser.parse_args()
+
+    with run_metrics("portfolio_backtest"):
+        with timer("load"):
+            if args.synthetic:
+                dates, symbols, close, new_sentiment = synthetic_universe(args.synthetic, args.days)
+            else:
+                dates, symbols, close, new_sentiment = load_universe(list_symbols("equity_daily"), args.sentiment)
+        print(f"组合回测: {len(symbols)} 只股票 × {len(dates)} 个交易日")
+
+        start = time.perf_counter()
+        with timer("backtest", items=close.size):
+            result = run_portfolio_backtest(close, new_sentiment, max_weight=args.max_weight, cost_rate=args.cost)
+        print(f"  回测耗时: {time.perf_counter() - start:.2f}s")
+        print_summary(dates, result)
+
+        if not args.synthetic:
+            with timer("plot"):
+                import matplotlib.pyplot as plt
+                output_dir = "backtest_results"
+                os.makedirs(output_dir, exist_ok=True)
+                plt.figure(figsize=(10, 6))
+                plt.plot(dates, result["equity"], label="Portfolio", color='red', linewidth=2)
+                plt.title(f"Portfolio ({len(symbols)} stocks, max weight {args.max_weight:.0%})")
+                plt.xlabel("Date")
+                plt.ylabel(f"Portfolio Value (Initial: {INITIAL_CAPITAL:.0f})")
+                plt.legend()
+                plt.grid(True)
+                save_path = os.path.join(output_dir, "portfolio_backtest.png")
+                plt.savefig(save_path)
+                plt.close()
+            print(f"组合净值图已保存至 {save_path}")
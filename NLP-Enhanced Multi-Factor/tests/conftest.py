@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 与 benchmarks/ 脚本相同: etl 与策略目录下的模块按同级方式导入
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in ("", "etl", "SentimentAlphaStrategy", "benchmarks"):
+    sys.path.append(os.path.join(PROJECT_ROOT, path))
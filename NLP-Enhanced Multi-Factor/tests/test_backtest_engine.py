@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from backtest_engine import align_sentiment, reference_backtest, run_backtest, synthetic_case
+from signal_fusion import StreamingSignal
+
+# 向量化引擎 / 逐 bar 增量模式 与原 iterrows 循环逐位一致 (情感按交易日精确给出)
+# 样本: 随机游走价格、停牌 (价格不变，均线相等) 区间、缺失价格 (NaN) 区间
+
+
+def halted_case(seed, n_days=600, length=30):
+    df_price, sentiment_map = synthetic_case(n_days=n_days, seed=seed)
+    rng = np.random.default_rng(seed)
+    halt = int(rng.integers(0, n_days - length))
+    df_price.iloc[halt:halt + length, 0] = df_price["close"].iloc[halt]
+    return df_price, sentiment_map, halt
+
+
+def nan_case(seed, n_days=600, gaps=3):
+    df_price, sentiment_map = synthetic_case(n_days=n_days, seed=seed)
+    rng = np.random.default_rng(seed)
+    for start in rng.integers(0, n_days - 10, size=gaps):
+        df_price.iloc[start:start + int(rng.integers(1, 10)), 0] = np.nan
+    return df_price, sentiment_map
+
+
+def assert_parity(df_price, sentiment_map):
+    ref_position, ref_equity = reference_backtest(df_price, sentiment_map)
+    result = run_backtest(df_price, sentiment_map)
+    np.testing.assert_array_equal(result["Position"].to_numpy(), ref_position)
+    np.testing.assert_array_equal(result["Equity"].to_numpy(), ref_equity)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_parity_random(seed):
+    assert_parity(*synthetic_case(n_days=1000, seed=seed))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_parity_constant_runs(seed):
+    df_price, sentiment_map, _ = halted_case(seed)
+    assert_parity(df_price, sentiment_map)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_parity_nan_gaps(seed):
+    df_price, sentiment_map = nan_case(seed)
+    assert df_price["close"].isna().any()
+    assert_parity(df_price, sentiment_map)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_streaming_matches_batch(seed):
+    df_price, sentiment_map, halt = halted_case(seed)
+    # 恰好为 0.0 的中性消息 (原循环视为无消息，只与增量模式比较)
+    sentiment_map[df_price.index[halt]] = 0.0
+    result = run_backtest(df_price, sentiment_map)
+    signal = StreamingSignal()
+    new_sentiment = align_sentiment(df_price.index, sentiment_map)
+    streamed = [signal.update(close, s) for close, s in zip(df_price["close"].tolist(), new_sentiment.tolist())]
+    np.testing.assert_array_equal(result["Position"].to_numpy(), np.asarray(streamed))
@@ -0,0 +1,87 @@
+import time
+import urllib.request
+import zlib
+
+import numpy as np
+
+import synthetic_data
+from live_events import cursor, parse_events
+from news_stream import LiveFeed, NewsStreamer
+
+# 端到端: FakeNewsSource -> NewsStreamer -> LiveFeed 端点 -> Reader 的解析 (live_events)
+# LEAN 的 Rest 数据源把整个响应体作为一个 line 交给 Reader，这里按同样方式拉取并解析
+
+
+class HashScorer:
+    """
+    确定性的打分器 (按标题哈希)，不加载模型
+    """
+
+    def score(self, texts, max_length=128, batch_size=32, cache=None, show_progress=True):
+        return np.array([zlib.crc32(t.encode("utf-8")) % 2001 / 1000 - 1 for t in texts])
+
+    def close(self):
+        pass
+
+
+class RecordingFeed(LiveFeed):
+    def __init__(self):
+        super().__init__()
+        self.published = {}
+
+    def publish(self, symbol, when, score):
+        super().publish(symbol, when, score)
+        self.published.setdefault(symbol, []).append(float(score))
+
+
+def fetch(port, code, since=None):
+    url = f"http://127.0.0.1:{port}/live/{code}" + ("" if since is None else f"?since={since}")
+    with urllib.request.urlopen(url, timeout=5) as resp:
+        return resp.read().decode("utf-8")
+
+
+def poll(streamer, n):
+    for _ in range(n):
+        time.sleep(0.05)
+        streamer.poll_once()
+
+
+def test_live_feed_end_to_end(tmp_path, monkeypatch):
+    # datastore / 缓存使用相对路径 data/...
+    monkeypatch.chdir(tmp_path)
+    codes, _ = synthetic_data.stock_universe(2)
+    feed = RecordingFeed()
+    source = synthetic_data.FakeNewsSource(codes, rate=40.0, duplicate_rate=0.3)
+    streamer = NewsStreamer(codes, source=source, scorer=HashScorer(), rate=1000.0, feed=feed)
+    port = streamer.serve(port=0)
+    try:
+        # 第一次请求前已发布多轮: 响应体为多行，必须全部解析出来
+        poll(streamer, 4)
+        received = {code: parse_events(fetch(port, code, cursor())) for code in codes}
+        assert any(len(events) > 1 for events in received.values())
+
+        # 之后按 since 游标增量拉取，每轮只收到新事件
+        for _ in range(4):
+            poll(streamer, 1)
+            for code in codes:
+                after = received[code][-1][0] if received[code] else None
+                received[code].extend(parse_events(fetch(port, code, cursor(after)), after))
+
+        for code in codes:
+            times = [t for t, _ in received[code]]
+            assert times == sorted(set(times))
+            assert [score for _, score in received[code]] == feed.published.get(code, [])
+            if times:
+                # 游标之后没有新事件时返回空；不带游标只返回最新一条
+                assert fetch(port, code, cursor(times[-1])) == ""
+                assert parse_events(fetch(port, code)) == received[code][-1:]
+    finally:
+        streamer.close()
+
+
+def test_parse_events_skips_seen_and_malformed():
+    body = "20240102 09:30:00.001,0.5\n20240102 09:30:00.002,-0.25\nbad line\n20240102,0.1\n"
+    events = parse_events(body)
+    assert [score for _, score in events] == [0.5, -0.25]
+    assert parse_events(body, events[0][0]) == events[1:]
+    assert cursor(events[1][0]) == "20240102093000002"
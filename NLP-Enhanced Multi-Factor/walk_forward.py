@@ -0,0 +1,205 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from etl.datastore import list_symbols
+from backtest_engine import INITIAL_CAPITAL
+from portfolio_backtest import aggregate_portfolio, load_universe, synthetic_universe, tradable_positions
+from param_sweep import DEFAULT_GRID, grid_combinations, random_combinations
+from SentimentAlphaStrategy.signal_fusion import advance_positions, moving_average, tech_signal_from_ma
+from etl.instrumentation import run_metrics, timer
+
+# 滚动窗口 (walk-forward) 评估
+# 时间轴切成 [训练 train_days | 测试 test_days] 的滚动窗口，每个训练窗口上重新选参，在随后的测试窗口样本外评估
+#
+# 计算方式 (总成本随历史长度线性增长):
+# - 时间轴按 test_days 分段顺序推进一次，每组候选参数的衰减情绪 / 持仓状态在段与段之间接续，
+#   MA 只保留上一段末尾 max(window) 个收盘价作为缓冲，不从头重算
+# - 每组参数得到全历史的组合日收益，训练窗口的 Sharpe / 收益由前缀和 O(1) 得到
+# - 测试窗口直接取选中参数的日收益: 该参数的状态本来就是连续推进的，相当于热启动
+# - 窗口边界换参时，样本外组合从上一窗口参数的持仓调到新参数的持仓，首日按同样的成本率收取这部分换手
+#
+# 运行: python walk_forward.py --train-days 500 --test-days 125
+
+# 日对数收益的截断下限 (见 run_walk_forward)
+LOG_FLOOR = 1e-12
+
+
+def segment_indicators(close_seg, tail, windows, pairs):
+    """
+    计算一段的日收益与各 (short, long) 技术信号
+    tail: 上一段末尾的收盘价缓冲 (行数 <= max(windows))，None 表示时间轴起点
+    返回 (returns, {pair: tech}, 新的 tail)
+    """
+    n_days = len(close_seg)
+    extended = close_seg if tail is None else np.vstack([tail, close_seg])
+    returns = np.nan_to_num(pd.DataFrame(extended).pct_change().to_numpy()[-n_days:], nan=0.0)
+    ma = {w: moving_average(extended, w)[-n_days:] for w in windows}
+    tech = {(short, long): tech_signal_from_ma(ma[short], ma[long]) for short, long in pairs}
+    return returns, tech, extended[-max(windows):]
+
+
+def combo_daily_returns(close, new_sentiment, combos, segment_days, max_weight=0.15, cost_rate=0.0,
+                        block_size=1000, holding_days=()):
+    """
+    按段顺序推进，返回 (每组参数在全历史上的组合日收益 (n_combos, T), holdings)
+    holding_days: 需要记录持仓的交易日 (窗口边界)，holdings 为 {day: (持仓 (n_combos, N) int8, 单只权重 (n_combos,))}
+    """
+    n_days, n_symbols = close.shape
+    pairs = sorted({(c["ma_short"], c["ma_long"]) for c in combos})
+    windows = sorted({w for pair in pairs for w in pair})
+
+    daily = np.zeros((len(combos), n_days))
+    holdings = {t: (np.zeros((len(combos), n_symbols), dtype=np.int8), np.zeros(len(combos))) for t in holding_days}
+    states = [None] * len(combos)
+    last_position = [None] * len(combos)
+    last_weight = [0.0] * len(combos)
+    tail = None
+    for seg_start in range(0, n_days, segment_days):
+        seg_end = min(seg_start + segment_days, n_days)
+        with timer("indicators", items=(seg_end - seg_start) * n_symbols):
+            returns, tech, tail = segment_indicators(close[seg_start:seg_end], tail, windows, pairs)
+        sentiment_seg = new_sentiment[seg_start:seg_end]
+        seg_holding_days = [t for t in sorted(holdings) if seg_start <= t < seg_end]
+
+        for i, combo in enumerate(combos):
+            with timer("signals", items=sentiment_seg.size):
+                position, states[i] = advance_positions(
+                    sentiment_seg, tech[(combo["ma_short"], combo["ma_long"])], states[i],
+                    combo["decay_factor"], combo["strong_buy"], combo["tech_floor"], combo["hold_threshold"])
+                position = tradable_positions(position, close[seg_start:seg_end])
+            with timer("backtest", items=position.size):
+                held_return_sum = np.zeros(seg_end - seg_start)
+                for start in range(0, n_symbols, block_size):
+                    held_return_sum += (returns[:, start:start + block_size]
+                                        * position[:, start:start + block_size]).sum(axis=1)
+                result = aggregate_portfolio(position, held_return_sum, max_weight, INITIAL_CAPITAL, cost_rate,
+                                             block_size, prev_position=last_position[i],
+                                             prev_weight=last_weight[i])
+            daily[i, seg_start:seg_end] = result["returns"]
+            for t in seg_holding_days:
+                holdings[t][0][i] = position[t - seg_start]
+                holdings[t][1][i] = result["weight"][t - seg_start]
+            last_position[i] = position[-1]
+            last_weight[i] = result["weight"][-1]
+    return daily, holdings
+
+
+def _window_scores(prefix_sum, prefix_sq, prefix_log, start, end, select_by):
+    n = end - start
+    mean = (prefix_sum[:, end] - prefix_sum[:, start]) / n
+    var = np.maximum((prefix_sq[:, end] - prefix_sq[:, start]) / n - mean ** 2, 0.0)
+    std = np.sqrt(var)
+    sharpe = np.where(std > 0, mean / np.where(std > 0, std, 1.0) * np.sqrt(252), 0.0)
+    total_return = np.expm1(prefix_log[:, end] - prefix_log[:, start])
+    return sharpe if select_by == "sharpe" else total_return, sharpe, total_return
+
+
+def switch_cost(holdings, day, prev_combo, combo, cost_rate):
+    """
+    day 当天由 prev_combo (None 为空仓) 换到 combo 时需要额外收取的成本 (日收益口径)：
+    按 prev_combo 前一日持仓 -> combo 当日持仓的换手收费，扣除 combo 日收益里已按自身前一日持仓收取的部分
+    """
+    position, weight = holdings[day]
+    prev_position, prev_weight = holdings[day - 1]
+    target = position[combo] * weight[combo]
+    own = np.abs(target - prev_position[combo] * prev_weight[combo]).sum()
+    held = 0.0 if prev_combo is None else prev_position[prev_combo] * prev_weight[prev_combo]
+    return cost_rate * (np.abs(target - held).sum() - own)
+
+
+def run_walk_forward(dates, close, new_sentiment, combos, train_days=500, test_days=125, select_by="sharpe",
+                     max_weight=0.15, cost_rate=0.0):
+    """
+    返回 (窗口明细 DataFrame, 样本外日收益 Series)
+    select_by: 训练窗口上的选参指标 sharpe / total_return
+    """
+    close = np.asarray(close, dtype=np.float64)
+    new_sentiment = np.asarray(new_sentiment, dtype=np.float64)
+    n_days = close.shape[0]
+    if n_days <= train_days:
+        raise ValueError(f"历史长度 {n_days} 天不足一个训练窗口 ({train_days} 天)")
+
+    # 段长取 test_days (只影响每段的计算量)；窗口边界不必落在段边界上，训练 / 测试窗口的指标都由前缀和得到
+    # 另外记录每个测试窗口首日及前一日各组参数的持仓，用于计算换参的换手成本
+    test_starts = list(range(train_days, n_days, test_days))
+    daily, holdings = combo_daily_returns(close, new_sentiment, combos, test_days, max_weight, cost_rate,
+                                          holding_days={t for start in test_starts for t in (start - 1, start)})
+    zeros = np.zeros((len(combos), 1))
+    prefix_sum = np.hstack([zeros, np.cumsum(daily, axis=1)])
+    prefix_sq = np.hstack([zeros, np.cumsum(daily ** 2, axis=1)])
+    # 计入交易成本后日收益可能 <= -1 (净值归零)，log1p 会得到 -inf / NaN 并污染之后所有窗口的前缀差；
+    # 下限截断到 -1 + LOG_FLOOR: 含该日的窗口累计收益约为 -100%，其余窗口不受影响
+    prefix_log = np.hstack([zeros, np.cumsum(np.log1p(np.maximum(daily, -1.0 + LOG_FLOOR)), axis=1)])
+
+    rows = []
+    oos = []
+    prev_best = None
+    for test_start in test_starts:
+        test_end = min(test_start + test_days, n_days)
+        train_start = test_start - train_days
+        score, train_sharpe, train_return = _window_scores(prefix_sum, prefix_sq, prefix_log,
+                                                           train_start, test_start, select_by)
+        best = int(np.argmax(score))
+        _, test_sharpe, test_return = _window_scores(prefix_sum, prefix_sq, prefix_log,
+                                                     test_start, test_end, select_by)
+        # 换参 (含首个窗口从空仓建仓) 的换手成本计入样本外首日
+        returns = daily[best, test_start:test_end].copy()
+        cost = switch_cost(holdings, test_start, prev_best, best, cost_rate) if best != prev_best else 0.0
+        returns[0] -= cost
+        prev_best = best
+        rows.append(dict(
+            train_start=dates[train_start], test_start=dates[test_start], test_end=dates[test_end - 1],
+            **combos[best],
+            train_sharpe=train_sharpe[best], train_return=train_return[best],
+            test_sharpe=test_sharpe[best], test_return=test_return[best], switch_cost=cost,
+        ))
+        oos.append(pd.Series(returns, index=dates[test_start:test_end]))
+
+    return pd.DataFrame(rows), pd.concat(oos)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="滚动窗口 (walk-forward) 评估")
+    parser.add_argument("--train-days", type=int, default=500)
+    parser.add_argument("--test-days", type=int, default=125)
+    parser.add_argument("--select-by", default="sharpe", choices=["sharpe", "total_return"])
+    parser.add_argument("--grid", default=None, help="JSON 参数网格 (与 param_sweep.py 相同)")
+    parser.add_argument("--random", type=int, default=0)
+    parser.add_argument("--sentiment", default="report", choices=["report", "fulltext", "news"],
+                        help="情感因子来源 (etl/align_sentiment.py 对齐后的列)")
+    parser.add_argument("--max-weight", type=float, default=0.15)
+    parser.add_argument("--cost", type=float, default=0.0)
+    parser.add_argument("--synthetic", type=int, default=0, help="使用 N 只股票的合成数据")
+    parser.add_argument("--days", type=int, default=2500)
+    parser.add_argument("--output", default="backtest_results/walk_forward.csv")
+    args = parser.parse_args()
+
+    spec = json.loads(args.grid) if args.grid else DEFAULT_GRID
+    combos = random_combinations(spec, args.random) if args.random else grid_combinations(spec)
+
+    with run_metrics("walk_forward"):
+        with timer("load"):
+            if args.synthetic:
+                dates, symbols, close, new_sentiment = synthetic_universe(args.synthetic, args.days)
+            else:
+                dates, symbols, close, new_sentiment = load_universe(list_symbols("equity_daily"), args.sentiment)
+        print(f"Walk-forward: {len(combos)} 组候选参数, {len(symbols)} 只股票 × {len(dates)} 个交易日, "
+              f"训练 {args.train_days} 天 / 测试 {args.test_days} 天")
+
+        start = time.perf_counter()
+        windows, oos_returns = run_walk_forward(dates, close, new_sentiment, combos, args.train_days, args.test_days,
+                                                args.select_by, args.max_weight, args.cost)
+        print(f"  耗时: {time.perf_counter() - start:.1f}s")
+
+        equity = INITIAL_CAPITAL * np.cumprod(1.0 + oos_returns.to_numpy())
+        print(windows.to_string(index=False))
+        print(f"  样本外累计收益: {(equity[-1] / INITIAL_CAPITAL - 1) * 100:.2f}%, "
+              f"最大回撤: {(equity / np.maximum.accumulate(equity) - 1).min() * 100:.2f}%")
+
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+        with timer("csv_write", items=len(windows)):
+            windows.to_csv(args.output, index=False)
+        print(f"窗口明细已保存至 {args.output}")